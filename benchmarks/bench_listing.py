@@ -0,0 +1,89 @@
+'''Сравнение разбора страниц каталога: полное дерево против SoupStrainer
+
+Запуск из корня проекта:
+
+    python -m benchmarks.bench_listing [--repeat 20]
+'''
+import argparse
+import os
+import timeit
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+from src.core.settings import settings
+from src.parsers.category import PRODUCT_CARD_STRAINER, CategoryPageParser
+from src.parsers.soup import HTML_BACKENDS, _resolve_backend
+from src.parsers.start_page import CATEGORY_STRAINER, StartPageParser
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def _category_hrefs(soup: BeautifulSoup):
+    return [item.find('a').get('href') for item in soup.find_all('div', class_ = 'category-card__name')]
+
+
+def _product_hrefs(soup: BeautifulSoup):
+    return sorted({
+        link.get('href')
+        for block in soup.find_all('div', class_ = 'product-card')
+        for link in block.find_all('a')
+        if (link.get('href') or '').startswith('products/')
+    })
+
+
+# Фикстура, страйнер и функция извлечения результата из дерева
+CASES = {
+    'home.html': (CATEGORY_STRAINER, _category_hrefs),
+    'category.html': (PRODUCT_CARD_STRAINER, _product_hrefs),
+    'category_page3.html': (PRODUCT_CARD_STRAINER, _product_hrefs),
+}
+
+
+def measure(function, repeat: int):
+    '''Лучшее время одного вызова и пиковая память (tracemalloc)'''
+
+    best = min(timeit.repeat(function, number = 1, repeat = repeat))
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--repeat', type = int, default = 20)
+    args = parser.parse_args()
+
+    print(f"{'страница':<22}{'бэкенд':<13}{'режим':<10}{'мс':>9}{'пик, КБ':>10}")
+    for backend in HTML_BACKENDS:
+        if _resolve_backend(backend) != backend:
+            continue
+
+        for name, (strainer, extract) in CASES.items():
+            with open(os.path.join(FIXTURES, name), encoding = 'utf-8') as file:
+                html = file.read()
+
+            full = extract(BeautifulSoup(html, backend))
+            strained = extract(BeautifulSoup(html, backend, parse_only = strainer))
+            if full != strained:
+                raise SystemExit(f"{name} ({backend}): результат со страйнером отличается от полного разбора")
+
+            for mode, parse_only in (('полный', None), ('strainer', strainer)):
+                seconds, peak = measure(lambda: BeautifulSoup(html, backend, parse_only = parse_only), args.repeat)
+                print(f"{name:<22}{backend:<13}{mode:<10}{seconds * 1000:>9.2f}{peak / 1024:>10.0f}")
+
+    # Проверка парсеров проекта на фикстурах с текущими настройками
+    with open(os.path.join(FIXTURES, 'home.html'), encoding = 'utf-8') as file:
+        categories = StartPageParser().parse_categories(file.read())
+    with open(os.path.join(FIXTURES, 'category.html'), encoding = 'utf-8') as file:
+        products = CategoryPageParser().parse_product_links(file.read())
+    print(f"\nБэкенд из настроек: {settings.html_parser}; категорий: {len(categories)}, товаров: {len(products)}")
+
+
+if __name__ == '__main__':
+    main()
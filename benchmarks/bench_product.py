@@ -0,0 +1,256 @@
+'''Проверка и бенчмарк разбора страниц товаров на сохраненных фикстурах
+
+Запуск из корня проекта:
+
+    python -m benchmarks.bench_product [--repeat 20] [--tolerance 0.3] [--update]
+
+Товар, разобранный из каждой фикстуры всеми путями (по настройкам, полный
+разбор compiled и legacy), сравнивается с эталоном из fixtures/golden, а время
+и пиковая память - с baseline.json. Время измеряется не в миллисекундах, а в
+долях эталонной нагрузки (html.parser из стандартной библиотеки), замеры
+которой чередуются с замерами метрики: так baseline переносим между машинами
+и не зависит от колебаний скорости машины во время запуска. При расхождении с
+эталоном или регрессии сверх допуска скрипт завершается с ненулевым кодом.
+--update перезаписывает эталоны и baseline текущими результатами.
+'''
+import argparse
+import inspect
+import json
+import os
+import statistics
+import sys
+import timeit
+from contextlib import contextmanager
+from html.parser import HTMLParser
+
+from benchmarks.bench_listing import measure
+from src.core.settings import settings
+from src.parsers.product_page import PATH_FULL, PATH_STRUCTURED, ProductPropertyParser
+from src.parsers.product_spec import product_extractor
+from src.parsers.soup import make_soup
+
+
+ROOT = os.path.dirname(__file__)
+PRODUCTS = os.path.join(ROOT, 'fixtures', 'products')
+GOLDEN = os.path.join(ROOT, 'fixtures', 'golden')
+BASELINE = os.path.join(ROOT, 'baseline.json')
+
+# Поля, меняющиеся от запуска к запуску
+EXCLUDE = {'created_at'}
+
+# Пути разбора, каждый из которых должен давать эталонный товар
+VARIANTS = {
+    'default': {},
+    'compiled': {'structured_fast_path': False, 'product_extraction': 'compiled'},
+    'legacy': {'structured_fast_path': False, 'product_extraction': 'legacy'},
+}
+
+# Путь разбора по настройкам для фикстур, проверяющих быстрый путь: полный JSON-LD
+# разбирается без дерева, а без сопоставимого наличия - полным разбором
+EXPECTED_PATHS = {
+    'structured': PATH_STRUCTURED,
+    'ld_no_stock': PATH_FULL,
+}
+
+# Разница меньше этой не считается регрессией: шум быстрых операций (долей эталонной нагрузки)
+MIN_DELTA_RATIO = 0.5
+MIN_DELTA_KB = 16
+
+# Эталонная нагрузка, не зависящая от кода проекта: разбор начала страницы html.parser
+REFERENCE_FIXTURE = 'full'
+REFERENCE_SIZE = 16 * 1024
+
+
+@contextmanager
+def overridden(**values):
+    '''Временно подменяет настройки'''
+
+    previous = {name: getattr(settings, name) for name in values}
+    for name, value in values.items():
+        setattr(settings, name, value)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            setattr(settings, name, value)
+
+
+def fixtures():
+    for name in sorted(os.listdir(PRODUCTS)):
+        if name.endswith('.html'):
+            with open(os.path.join(PRODUCTS, name), encoding = 'utf-8') as file:
+                yield name[:-len('.html')], file.read()
+
+
+def product_url(name: str) -> str:
+    return f"{settings.base_url}/products/{name}"
+
+
+def extract_methods(parser: ProductPropertyParser):
+    '''Методы _extract_* парсера с числом аргументов'''
+
+    for name, method in inspect.getmembers(parser, inspect.ismethod):
+        if name.startswith('_extract_'):
+            yield name, method, len(inspect.signature(method).parameters)
+
+
+def check_golden(parser: ProductPropertyParser, update: bool) -> list:
+    '''Сравнивает товары со всех путей разбора с эталонами; возвращает расхождения'''
+
+    os.makedirs(GOLDEN, exist_ok = True)
+    failures = []
+
+    for name, html in fixtures():
+        path = os.path.join(GOLDEN, f"{name}.json")
+        results = {}
+        for variant, values in VARIANTS.items():
+            with overridden(**values):
+                product, parse_path = parser.parse_html_with_path(html, product_url(name))
+            results[variant] = product.model_dump(exclude = EXCLUDE)
+            if variant == 'default' and name in EXPECTED_PATHS and parse_path != EXPECTED_PATHS[name]:
+                failures.append(f"{name}: разобран путем {parse_path}, ожидался {EXPECTED_PATHS[name]}")
+
+        if update:
+            with open(path, 'w', encoding = 'utf-8') as file:
+                json.dump(results['default'], file, ensure_ascii = False, indent = 2, sort_keys = True)
+                file.write('\n')
+
+        if not os.path.exists(path):
+            failures.append(f"{name}: нет эталона (запустите с --update)")
+            continue
+        with open(path, encoding = 'utf-8') as file:
+            golden = json.load(file)
+        for variant, result in results.items():
+            if result != golden:
+                fields = sorted(key for key in golden.keys() | result.keys() if golden.get(key) != result.get(key))
+                failures.append(f"{name} ({variant}): отличаются поля {', '.join(fields)}")
+
+    return failures
+
+
+def reference_workload():
+    '''Эталонная нагрузка: разбор начала страницы html.parser без построения дерева'''
+
+    with open(os.path.join(PRODUCTS, f"{REFERENCE_FIXTURE}.html"), encoding = 'utf-8') as file:
+        html = file.read()[:REFERENCE_SIZE]
+
+    def feed():
+        reader = HTMLParser()
+        reader.feed(html)
+        reader.close()
+
+    return feed
+
+
+def relative(function, reference, repeat: int) -> float:
+    '''Время вызова в долях эталонной нагрузки
+
+    Замеры функции и эталона чередуются попарно, поэтому изменение скорости
+    машины сказывается на обоих; берется медиана отношений по парам.
+    '''
+
+    ratios = []
+    for _ in range(repeat):
+        base = timeit.timeit(reference, number = 1)
+        ratios.append(timeit.timeit(function, number = 1) / base)
+    return statistics.median(ratios)
+
+
+def collect_metrics(parser: ProductPropertyParser, repeat: int) -> dict:
+    '''Время (в долях эталонной нагрузки) и пиковая память (КБ) разбора каждой фикстуры'''
+
+    reference = reference_workload()
+    metrics = {}
+    for name, html in fixtures():
+        url = product_url(name)
+        soup = make_soup(html)
+
+        metrics[f"{name}/page_x"] = relative(lambda: parser.parse_html(html, url), reference, repeat)
+        metrics[f"{name}/page_peak_kb"] = measure(lambda: parser.parse_html(html, url), 1)[1] / 1024
+        metrics[f"{name}/soup_x"] = relative(lambda: make_soup(html), reference, repeat)
+        metrics[f"{name}/compiled_x"] = relative(lambda: product_extractor.extract(soup), reference, repeat)
+
+        for method_name, method, arity in extract_methods(parser):
+            args = (soup, url)[:arity]
+            metrics[f"{name}/{method_name}_x"] = relative(lambda: method(*args), reference, repeat)
+
+    return metrics
+
+
+def compare(metrics: dict, baseline: dict, tolerance: float) -> list:
+    '''Метрики, выросшие относительно baseline больше допуска'''
+
+    regressions = []
+    for key, value in sorted(metrics.items()):
+        base = baseline.get(key)
+        if base is None:
+            continue
+        min_delta = MIN_DELTA_KB if key.endswith('_kb') else MIN_DELTA_RATIO
+        if value > base * (1 + tolerance) and value - base > min_delta:
+            regressions.append(f"{key}: {base:.3f} → {value:.3f} (+{(value / base - 1) * 100 if base else 0:.0f}%)")
+    return regressions
+
+
+def report(metrics: dict, baseline: dict):
+    pages = sorted({key.split('/')[0] for key in metrics})
+    columns = sorted({key.split('/')[1] for key in metrics}, key = lambda column: (not column.startswith('page'), column))
+
+    print(f"{'метрика':<30}" + ''.join(f"{page:>15}" for page in pages))
+    for column in columns:
+        cells = []
+        for page in pages:
+            key = f"{page}/{column}"
+            value = metrics[key]
+            base = baseline.get(key)
+            delta = f"{(value / base - 1) * 100:+.0f}%" if base else ''
+            cells.append(f"{value:>9.3f}{delta:>6}")
+        print(f"{column:<30}" + ''.join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--repeat', type = int, default = 20)
+    parser.add_argument('--tolerance', type = float, default = 0.3, help = 'допустимый рост метрик (доля)')
+    parser.add_argument('--update', action = 'store_true', help = 'перезаписать эталоны и baseline')
+    args = parser.parse_args()
+
+    product_parser = ProductPropertyParser()
+
+    failures = check_golden(product_parser, args.update)
+    for failure in failures:
+        print(f"ЭТАЛОН: {failure}")
+
+    metrics = collect_metrics(product_parser, args.repeat)
+
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE, encoding = 'utf-8') as file:
+            stored = json.load(file)
+        if stored.get('html_parser') == settings.html_parser:
+            baseline = stored['metrics']
+        else:
+            print(f"baseline снят с бэкендом {stored.get('html_parser')}, сравнение пропущено")
+
+    report(metrics, baseline)
+
+    if args.update:
+        with open(BASELINE, 'w', encoding = 'utf-8') as file:
+            json.dump(
+                {'html_parser': settings.html_parser, 'metrics': {key: round(value, 4) for key, value in metrics.items()}},
+                file, ensure_ascii = False, indent = 2, sort_keys = True
+            )
+            file.write('\n')
+        print(f"\nЭталоны и baseline обновлены: {GOLDEN}, {BASELINE}")
+        sys.exit(1 if failures else 0)
+
+    regressions = compare(metrics, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"РЕГРЕССИЯ: {regression}")
+
+    if failures or regressions:
+        sys.exit(1)
+    print(f"\nЭталоны совпадают, регрессий сверх {args.tolerance:.0%} нет")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+'''Нагрузочный прогон полного обхода (ParserService.start_parsing) на синтетическом сайте
+
+Запуск из корня проекта:
+
+    python -m benchmarks.load_test --categories 50 --pages 84 --latency 0.02 \\
+        --throttle-rate 0.01 --error-rate 0.01 --duplicates 0.1 \\
+        --set FETCH_WORKERS=32 --set RATE_LIMIT_INITIAL=200 --set RATE_LIMIT_MAX=2000
+
+Сайт запускается в отдельном процессе на свободном порту, база - в памяти
+процесса (--mongo memory) или локальная MongoDB из MONGO_URL (--mongo local,
+база OptoStroyLoadTest очищается перед прогоном). Параметры проекта меняются
+через --set ИМЯ=ЗНАЧЕНИЕ. В конце выводятся товаров в секунду, число запросов
+по видам и статусам и пиковая память процесса обхода.
+'''
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import socket
+import tempfile
+import time
+import tracemalloc
+
+import httpx
+
+from benchmarks import memory_mongo
+from benchmarks.synthetic_site import add_site_arguments, serve, site_options
+from src.core.metrics import metrics
+from src.core.settings import settings
+from src.repository.mongo_client import mongo_client
+from src.services.parser_service import ParserService
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(url: str, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"{url}/__stats", timeout = 1.0)
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise SystemExit(f"Синтетический сайт не ответил за {timeout} с: {url}")
+
+
+def apply_overrides(assignments):
+    '''Применяет --set ИМЯ=ЗНАЧЕНИЕ к настройкам с приведением к типу поля'''
+
+    for assignment in assignments:
+        name, _, raw = assignment.partition('=')
+        name = name.strip().lower()
+        if name not in type(settings).model_fields:
+            raise SystemExit(f"Неизвестная настройка: {name}")
+        current = getattr(settings, name)
+        if isinstance(current, bool):
+            value = raw.strip().lower() in ('1', 'true', 'yes', 'on')
+        elif isinstance(current, list):
+            value = [item.strip() for item in raw.split(',') if item.strip()]
+        else:
+            value = type(current)(raw)
+        setattr(settings, name, value)
+
+
+async def prepare_database(mode: str):
+    if mode == 'memory':
+        memory_mongo.install()
+        return
+    settings.db_name = 'OptoStroyLoadTest'
+    await mongo_client.connect()
+    await mongo_client.client.drop_database(settings.db_name)
+    await mongo_client.disconnect()
+
+
+async def run_crawl(base_url: str) -> ParserService:
+    service = ParserService()
+    await service.start_parsing(base_url + '/')
+    return service
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    add_site_arguments(parser)
+    parser.add_argument('--mongo', choices = ('memory', 'local'), default = 'memory')
+    parser.add_argument('--set', action = 'append', default = [], metavar = 'ИМЯ=ЗНАЧЕНИЕ')
+    parser.add_argument('--tracemalloc', action = 'store_true', help = 'пиковая память Python (замедляет прогон)')
+    parser.add_argument('--log-level', default = 'WARNING')
+    parser.add_argument('--json', help = 'сохранить отчет в файл')
+    args = parser.parse_args()
+
+    logging.basicConfig(level = args.log_level, format = '%(asctime)s - %(levelname)s - %(message)s')
+    options = site_options(args)
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = multiprocessing.Process(target = serve, args = (port, options), daemon = True)
+    server.start()
+
+    try:
+        wait_until_ready(base_url)
+
+        workdir = tempfile.mkdtemp(prefix = 'optostroy-load-')
+        settings.base_url = base_url
+        settings.delay_between_categories = 0.0
+        settings.http_cache_path = os.path.join(workdir, 'http_cache.sqlite3')
+        settings.metrics_summary_path = os.path.join(workdir, 'metrics.json')
+        apply_overrides(args.set)
+
+        asyncio.run(prepare_database(args.mongo))
+
+        if args.tracemalloc:
+            tracemalloc.start()
+        started = time.perf_counter()
+        service = asyncio.run(run_crawl(base_url))
+        elapsed = time.perf_counter() - started
+        traced_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+
+        site_stats = httpx.get(f"{base_url}/__stats").json()
+    finally:
+        server.terminate()
+        server.join()
+
+    stats = service.repository.stats
+    processed = stats['new'] + stats['updated'] + stats['unchanged'] + stats['offers_updated'] + stats['offers_unchanged']
+    requests = site_stats['requests']
+    report = {
+        'catalog_products': options.products,
+        'processed': processed,
+        'seconds': round(elapsed, 2),
+        'products_per_second': round(processed / elapsed, 1) if elapsed else None,
+        'requests_total': sum(requests.values()),
+        'requests': dict(sorted(requests.items())),
+        'products_unique': site_stats['products_unique'],
+        'products_repeated': site_stats['products_repeated'],
+        'repository': stats,
+        # ru_maxrss в Linux - в килобайтах
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'peak_traced_mb': round(traced_peak / 1024 / 1024, 1) if traced_peak is not None else None,
+        'rates': {host: round(rate, 2) for host, rate in service.scraper.current_rates().items()},
+        'metrics': metrics.snapshot(),
+    }
+
+    print(f"\nТоваров в каталоге: {report['catalog_products']}, обработано: {processed}")
+    print(f"Время: {report['seconds']} с, товаров в секунду: {report['products_per_second']}")
+    print(f"Запросов: {report['requests_total']}")
+    for key, count in report['requests'].items():
+        print(f"  {key:<20}{count:>10}")
+    print(f"Страниц товаров запрошено повторно: {report['products_repeated']}")
+    print(f"Пиковая память (RSS): {report['peak_rss_mb']} МБ"
+          + (f", Python: {report['peak_traced_mb']} МБ" if traced_peak is not None else ''))
+
+    if args.json:
+        with open(args.json, 'w', encoding = 'utf-8') as file:
+            json.dump(report, file, ensure_ascii = False, indent = 2)
+
+
+if __name__ == '__main__':
+    main()
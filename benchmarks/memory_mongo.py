@@ -0,0 +1,389 @@
+'''Хранилище в памяти процесса вместо MongoDB для нагрузочного стенда
+
+Поддерживает подмножество API AsyncMongoClient, которое использует проект:
+find / find_one / update_one / update_many / delete_many / count_documents /
+bulk_write (UpdateOne, InsertOne) / insert_many / find_one_and_update и
+create_collection / list_collection_names у базы, операторы
+запросов $in, $nin, $ne, $or, $exists, $lt, $lte, $gt, $gte и операторы
+обновления $set (в том числе с $[] и arrayFilters), $setOnInsert, $unset,
+$inc, $push. По первому полю каждого индекса строится хеш-индекс на
+равенство, чтобы выборки пакетами не просматривали всю коллекцию.
+'''
+import copy
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from bson import ObjectId
+from pymongo import InsertOne, ReturnDocument, UpdateOne
+
+from src.repository.mongo_client import mongo_client
+
+
+def _values(document: Any, path: List[str]) -> List[Any]:
+    '''Значения по пути с точками; массивы раскрываются, как в MongoDB'''
+
+    current = [document]
+    for part in path:
+        found = []
+        for item in current:
+            if isinstance(item, list):
+                for element in item:
+                    if isinstance(element, dict) and part in element:
+                        found.append(element[part])
+            elif isinstance(item, dict) and part in item:
+                found.append(item[part])
+        current = []
+        for item in found:
+            current.extend(item if isinstance(item, list) else [item])
+            if isinstance(item, list):
+                current.append(item)
+    return current
+
+
+def _compare(values: List[Any], predicate) -> bool:
+    for value in values:
+        try:
+            if predicate(value):
+                return True
+        except TypeError:
+            continue
+    return False
+
+
+def matches(document: dict, query: dict) -> bool:
+    for key, condition in query.items():
+        if key == '$or':
+            if not any(matches(document, branch) for branch in condition):
+                return False
+            continue
+        if key == '$and':
+            if not all(matches(document, branch) for branch in condition):
+                return False
+            continue
+
+        values = _values(document, key.split('.'))
+        if isinstance(condition, dict) and condition and all(name.startswith('$') for name in condition):
+            for operator, argument in condition.items():
+                if operator == '$in' and not any(value in argument for value in values):
+                    return False
+                if operator == '$nin' and any(value in argument for value in values):
+                    return False
+                if operator == '$ne' and argument in values:
+                    return False
+                if operator == '$exists' and bool(values) != bool(argument):
+                    return False
+                if operator == '$lt' and not _compare(values, lambda value: value < argument):
+                    return False
+                if operator == '$lte' and not _compare(values, lambda value: value <= argument):
+                    return False
+                if operator == '$gt' and not _compare(values, lambda value: value > argument):
+                    return False
+                if operator == '$gte' and not _compare(values, lambda value: value >= argument):
+                    return False
+        elif condition not in values:
+            return False
+    return True
+
+
+def _hashable(value: Any) -> bool:
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+def _set_path(target: Any, path: List[str], value: Any, array_filters: List[dict]):
+    part, rest = path[0], path[1:]
+
+    if part == '$[]' or part.startswith('$['):
+        name = part[2:-1]
+        conditions = {
+            key[len(name) + 1:]: condition
+            for array_filter in array_filters for key, condition in array_filter.items()
+            if name and key.startswith(name + '.')
+        }
+        for element in target:
+            if not conditions or matches(element, conditions):
+                if rest:
+                    _set_path(element, rest, value, array_filters)
+        return
+
+    if not rest:
+        target[part] = copy.deepcopy(value)
+        return
+    if part not in target or target[part] is None:
+        target[part] = {}
+    _set_path(target[part], rest, value, array_filters)
+
+
+def _unset_path(target: dict, path: List[str]):
+    for part in path[:-1]:
+        target = target.get(part)
+        if not isinstance(target, dict):
+            return
+    target.pop(path[-1], None)
+
+
+def apply_update(document: dict, update: dict, array_filters: Optional[List[dict]] = None, inserting: bool = False):
+    array_filters = array_filters or []
+    for key, value in update.get('$set', {}).items():
+        _set_path(document, key.split('.'), value, array_filters)
+    if inserting:
+        for key, value in update.get('$setOnInsert', {}).items():
+            _set_path(document, key.split('.'), value, array_filters)
+    for key in update.get('$unset', {}):
+        _unset_path(document, key.split('.'))
+    for key, value in update.get('$inc', {}).items():
+        current = _values(document, key.split('.'))
+        _set_path(document, key.split('.'), (current[0] if current else 0) + value, array_filters)
+    for key, value in update.get('$push', {}).items():
+        current = _values(document, key.split('.'))
+        items = list(current[-1]) if current and isinstance(current[-1], list) else []
+        items.extend(value['$each'] if isinstance(value, dict) and '$each' in value else [value])
+        _set_path(document, key.split('.'), items, array_filters)
+
+
+class MemoryCursor:
+
+    def __init__(self, documents: List[dict]):
+        self._documents = documents
+
+    def sort(self, key, direction: int = 1):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for name, order in reversed(keys):
+            self._documents.sort(
+                key = lambda document: (_values(document, name.split('.')) or [None])[0] or 0,
+                reverse = order < 0
+            )
+        return self
+
+    def limit(self, count: int):
+        if count:
+            self._documents = self._documents[:count]
+        return self
+
+    async def to_list(self, length: Optional[int] = None):
+        return self._documents[:length] if length else list(self._documents)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in self._documents:
+            yield document
+
+
+class MemoryCollection:
+
+    def __init__(self):
+        self._documents: Dict[Any, dict] = {}
+        self._indexes: Dict[str, Dict[Any, Set[Any]]] = {}
+
+    # Индексы
+
+    async def create_indexes(self, models: Iterable):
+        for model in models:
+            self._add_index(next(iter(model.document['key'])))
+
+    async def create_index(self, keys, **kwargs):
+        self._add_index(keys[0][0] if isinstance(keys, list) else keys)
+
+    def _add_index(self, path: str):
+        if path in self._indexes or path == '_id':
+            return
+        index = self._indexes[path] = defaultdict(set)
+        for key, document in self._documents.items():
+            for value in self._index_values(document, path):
+                index[value].add(key)
+
+    @staticmethod
+    def _index_values(document: dict, path: str):
+        return {value for value in _values(document, path.split('.')) if _hashable(value)}
+
+    def _store(self, document: dict):
+        key = document['_id']
+        old = self._documents.get(key)
+        for path, index in self._indexes.items():
+            if old is not None:
+                for value in self._index_values(old, path):
+                    index[value].discard(key)
+            for value in self._index_values(document, path):
+                index[value].add(key)
+        self._documents[key] = document
+
+    def _remove(self, key: Any):
+        document = self._documents.pop(key)
+        for path, index in self._indexes.items():
+            for value in self._index_values(document, path):
+                index[value].discard(key)
+
+    def _candidates(self, query: dict) -> Optional[Set[Any]]:
+        '''Ключи документов-кандидатов по индексам или None (полный просмотр)'''
+
+        best = None
+        for key, condition in query.items():
+            if key == '$or':
+                branches = [self._candidates(branch) for branch in condition]
+                found = None if any(branch is None for branch in branches) else set().union(*branches)
+            elif key == '_id' or key in self._indexes:
+                if isinstance(condition, dict) and set(condition) == {'$in'}:
+                    values = condition['$in']
+                elif not isinstance(condition, dict):
+                    values = [condition]
+                else:
+                    continue
+                if key == '_id':
+                    found = {value for value in values if _hashable(value) and value in self._documents}
+                else:
+                    index = self._indexes[key]
+                    found = set().union(*(index.get(value, ()) for value in values if _hashable(value)))
+            else:
+                continue
+            if found is not None and (best is None or len(found) < len(best)):
+                best = found
+        return best
+
+    def _find(self, query: Optional[dict]) -> List[dict]:
+        query = query or {}
+        keys = self._candidates(query)
+        documents = self._documents.values() if keys is None else (
+            self._documents[key] for key in keys if key in self._documents
+        )
+        return [document for document in documents if matches(document, query)]
+
+    # Чтение
+
+    def find(self, query: Optional[dict] = None, projection: Optional[dict] = None, **kwargs) -> MemoryCursor:
+        return MemoryCursor([copy.deepcopy(document) for document in self._find(query)])
+
+    async def find_one(self, query: Optional[dict] = None, projection: Optional[dict] = None, **kwargs):
+        found = self._find(query)
+        return copy.deepcopy(found[0]) if found else None
+
+    async def count_documents(self, query: dict) -> int:
+        return len(self._find(query))
+
+    # Запись
+
+    async def insert_many(self, documents: List[dict], **kwargs):
+        for document in documents:
+            self._insert(document)
+        return SimpleNamespace(inserted_ids = [document['_id'] for document in documents])
+
+    async def insert_one(self, document: dict, **kwargs):
+        self._insert(document)
+        return SimpleNamespace(inserted_id = document['_id'])
+
+    def _insert(self, document: dict):
+        document.setdefault('_id', ObjectId())
+        self._store(copy.deepcopy(document))
+
+    async def delete_many(self, query: dict):
+        found = self._find(query)
+        for document in found:
+            self._remove(document['_id'])
+        return SimpleNamespace(deleted_count = len(found))
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False, array_filters = None, **kwargs):
+        result = SimpleNamespace(matched_count = 0, modified_count = 0, upserted_count = 0, upserted_id = None)
+        self._update(query, update, upsert, array_filters, result)
+        return result
+
+    async def update_many(self, query: dict, update: dict, upsert: bool = False, array_filters = None, **kwargs):
+        result = SimpleNamespace(matched_count = 0, modified_count = 0, upserted_count = 0, upserted_id = None)
+        for document in self._find(query):
+            updated = copy.deepcopy(document)
+            apply_update(updated, update, array_filters)
+            self._store(updated)
+            result.matched_count += 1
+            result.modified_count += 1
+        return result
+
+    def _update(self, query: dict, update: dict, upsert: bool, array_filters, result) -> Optional[dict]:
+        found = self._find(query)
+        if found:
+            document = copy.deepcopy(found[0])
+            apply_update(document, update, array_filters)
+            self._store(document)
+            result.matched_count += 1
+            result.modified_count += 1
+            return document
+
+        if not upsert:
+            return None
+        document = {
+            key: copy.deepcopy(value) for key, value in query.items()
+            if not key.startswith('$') and '.' not in key and not isinstance(value, dict)
+        }
+        document.setdefault('_id', ObjectId())
+        apply_update(document, update, array_filters, inserting = True)
+        self._store(document)
+        result.upserted_count += 1
+        result.upserted_id = document['_id']
+        return document
+
+    async def find_one_and_update(
+        self,
+        query: dict,
+        update: dict,
+        upsert: bool = False,
+        sort = None,
+        return_document = ReturnDocument.BEFORE,
+        **kwargs
+    ):
+        found = self._find(query)
+        if sort and found:
+            found = await MemoryCursor(found).sort(sort).to_list()
+        if not found and not upsert:
+            return None
+        before = copy.deepcopy(found[0]) if found else None
+        result = SimpleNamespace(matched_count = 0, modified_count = 0, upserted_count = 0, upserted_id = None)
+        query = {'_id': found[0]['_id']} if found else query
+        after = self._update(query, update, upsert, kwargs.get('array_filters'), result)
+        return copy.deepcopy(after) if return_document == ReturnDocument.AFTER else before
+
+    async def bulk_write(self, operations: List[Any], ordered: bool = True):
+        result = SimpleNamespace(
+            matched_count = 0, modified_count = 0, upserted_count = 0, inserted_count = 0, upserted_id = None
+        )
+        for operation in operations:
+            if isinstance(operation, UpdateOne):
+                self._update(operation._filter, operation._doc, operation._upsert, operation._array_filters, result)
+            elif isinstance(operation, InsertOne):
+                self._insert(operation._doc)
+                result.inserted_count += 1
+            else:
+                raise NotImplementedError(f"Операция {type(operation).__name__} не поддерживается")
+        return result
+
+
+class MemoryDatabase(dict):
+
+    def __missing__(self, name: str) -> MemoryCollection:
+        collection = self[name] = MemoryCollection()
+        return collection
+
+    async def list_collection_names(self) -> List[str]:
+        return list(self)
+
+    async def create_collection(self, name: str, **kwargs) -> MemoryCollection:
+        # Параметры коллекции (в том числе timeseries) не моделируются
+        return self[name]
+
+
+def install() -> MemoryDatabase:
+    '''Подключает общий mongo_client проекта к хранилищу в памяти'''
+
+    database = MemoryDatabase()
+
+    async def connect():
+        mongo_client.database = database
+
+    async def disconnect():
+        pass
+
+    mongo_client.connect = connect
+    mongo_client.disconnect = disconnect
+    return database
@@ -0,0 +1,314 @@
+'''Локальный синтетический сайт с разметкой ОптоСтрой для нагрузочных прогонов
+
+Запуск отдельно (для ручной проверки):
+
+    python -m benchmarks.synthetic_site --port 8000 --categories 20 --pages 10
+
+Каталог генерируется детерминированно: стартовая страница с карточками
+категорий, страницы категорий с карточками товаров и пагинацией, страницы
+товаров, robots.txt и sitemap (индекс и сжатые части). Пагинация показывает
+только ближайшие страницы, как на сайте. Можно добавить задержку ответа,
+долю ответов 429 / 503 и долю карточек, ведущих на товары других категорий.
+Счетчики запросов отдаются по /__stats.
+'''
+import argparse
+import gzip
+import json
+import random
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+SITEMAP_CHUNK = 50000
+PAGINATION_WINDOW = 4
+
+STOCKS = ('В наличии', 'В наличии', 'В наличии', 'Под заказ', 'Нет в наличии')
+BRANDS = ('Евроцемент', 'Knauf', 'Технониколь', 'Керма', 'Северсталь', 'Керамин', 'Color Expert')
+COUNTRIES = ('Россия', 'Беларусь', 'Казахстан', 'Китай')
+
+
+@dataclass
+class SiteOptions:
+    categories: int = 20
+    pages: int = 10
+    per_page: int = 24
+    duplicates: float = 0.0
+    latency: float = 0.0
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    seed: int = 7
+
+    @property
+    def products(self) -> int:
+        return self.categories * self.pages * self.per_page
+
+
+class Catalog:
+    '''Детерминированный каталог: товар k принадлежит категории k // (pages * per_page)'''
+
+    def __init__(self, options: SiteOptions):
+        self.options = options
+
+    def category_of(self, product: int) -> int:
+        return product // (self.options.pages * self.options.per_page)
+
+    def listing_products(self, category: int, page: int):
+        options = self.options
+        start = (category * options.pages + page - 1) * options.per_page
+        for product in range(start, start + options.per_page):
+            # Часть карточек ведет на тот же слот соседней категории: товары
+            # на странице остаются различными, и полнота страницы не меняется
+            if options.duplicates and random.Random(product * 31 + options.seed).random() < options.duplicates:
+                yield (product + options.pages * options.per_page) % options.products
+            else:
+                yield product
+
+    @staticmethod
+    def price(product: int) -> float:
+        return round(50 + (product * 37 % 5000) + (product % 4) * 0.25, 2)
+
+    @staticmethod
+    def slug(product: int) -> str:
+        return f"product-{product}"
+
+    def home(self) -> str:
+        cards = ''.join(
+            f'<div class="category-card"><a class="category-card__image" href="catalog/category-{category}">'
+            f'<img src="/files/categories/{category}.jpg" alt=""></a>'
+            f'<div class="category-card__name"><a href="catalog/category-{category}">Категория {category}</a></div></div>'
+            for category in range(self.options.categories)
+        )
+        return _page('Строительные материалы', f'<h2>Каталог</h2><div class="category-cards">{cards}</div>')
+
+    def listing(self, category: int, page: int) -> str:
+        cards = []
+        for product in self.listing_products(category, page):
+            price = _money(self.price(product))
+            stock = STOCKS[product % len(STOCKS)]
+            css = 'text-success' if stock == 'В наличии' else 'text-muted'
+            cards.append(
+                f'<div class="product-card"><a class="product-card__image" href="products/{self.slug(product)}">'
+                f'<img src="/files/products/{product}.jpg" alt=""></a><div class="product-card__info">'
+                f'<a class="product-card__name" href="products/{self.slug(product)}">Товар {product}</a>'
+                f'<div class="product-card__prices"><span class="new-price">{price}</span></div>'
+                f'<div class="product-card__availability"><span class="{css}">{stock}</span></div></div></div>'
+            )
+
+        last = min(self.options.pages, page + PAGINATION_WINDOW)
+        pager = ''.join(
+            f'<li class="page-item"><a class="page-link" href="?page={number}">{number}</a></li>'
+            for number in range(1, last + 1) if number != page
+        )
+        body = (
+            '<ol class="breadcrumb"><li class="breadcrumb-item"><a href="/">Главная</a></li>'
+            f'<li class="breadcrumb-item active">Категория {category}</li></ol><h1>Категория {category}</h1>'
+            f'<div class="products-list">{"".join(cards)}</div>'
+            + (f'<ul class="pagination">{pager}</ul>' if pager else '')
+        )
+        return _page(f'Категория {category}', body)
+
+    def product(self, product: int) -> str:
+        category = self.category_of(product)
+        stock = STOCKS[product % len(STOCKS)]
+        rows = [
+            ('Страна происхождения', COUNTRIES[product % len(COUNTRIES)]),
+            ('Вес', f'{product % 50 + 1} кг'),
+            ('Размер', f'{product % 300 + 100}x{product % 200 + 50} мм'),
+            ('Упаковка', 'Мешок' if product % 2 else 'Поддон'),
+        ]
+        spec = ''.join(
+            f'<div class="spec__row"><div class="spec__name">{name}:</div><div class="spec__value">{value}</div></div>'
+            for name, value in rows
+        )
+        body = (
+            '<ol class="breadcrumb"><li class="breadcrumb-item"><a href="/">Главная</a></li>'
+            f'<li class="breadcrumb-item"><a href="/catalog/category-{category}">Категория {category}</a></li>'
+            f'<li class="breadcrumb-item active">Товар {product}</li></ol>'
+            f'<div class="product"><h1 class="product__title">Товар {product}</h1>'
+            '<ul class="product__meta">'
+            f'<li>Бренд: <a href="/brands/{product % len(BRANDS)}">{BRANDS[product % len(BRANDS)]}</a></li>'
+            f'<li class="product__meta-availability">Наличие: <span class="text-success">{stock}</span></li>'
+            f'<li class="sku sku-show">Артикул: <span class="variant-sku">SYN-{product:07d}</span></li></ul>'
+            f'<div class="product__prices"><span class="new-price">{_money(self.price(product))}</span></div>'
+            f'<div class="tabs"><div id="tab-description"><p>Описание товара {product}.</p></div>'
+            f'<div id="tab-specification"><div class="spec"><div class="spec__section">{spec}</div></div></div></div></div>'
+        )
+        return _page(f'Товар {product}', body)
+
+    def sitemap_index(self, base_url: str) -> str:
+        chunks = (self.options.products + SITEMAP_CHUNK - 1) // SITEMAP_CHUNK
+        items = ''.join(
+            f'<sitemap><loc>{base_url}/sitemap-{chunk}.xml.gz</loc></sitemap>' for chunk in range(chunks)
+        )
+        return f'<?xml version="1.0" encoding="UTF-8"?><sitemapindex xmlns="{_SITEMAP_NS}">{items}</sitemapindex>'
+
+    def sitemap_chunk(self, base_url: str, chunk: int) -> bytes:
+        start = chunk * SITEMAP_CHUNK
+        items = ''.join(
+            f'<url><loc>{base_url}/products/{self.slug(product)}</loc></url>'
+            for product in range(start, min(start + SITEMAP_CHUNK, self.options.products))
+        )
+        xml = f'<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="{_SITEMAP_NS}">{items}</urlset>'
+        return gzip.compress(xml.encode('utf-8'))
+
+
+_SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+def _money(value: float) -> str:
+    text = f'{value:,.2f}'.replace(',', ' ').replace('.', ',')
+    return (text[:-3] if text.endswith(',00') else text) + ' ₽'
+
+
+def _page(title: str, body: str) -> str:
+    return (
+        f'<!DOCTYPE html><html lang="ru"><head><meta charset="utf-8"><title>{title} — ОптоСтрой</title></head>'
+        '<body><header class="header"><a class="logo" href="/">ОптоСтрой</a></header>'
+        f'<main class="main"><div class="container">{body}</div></main>'
+        '<footer class="footer"><p>8 (499) 455-50-75; 8 (800) 500-61-72</p></footer></body></html>'
+    )
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    catalog: Catalog
+    stats: Counter
+    product_hits: Counter
+    lock: threading.Lock
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        path = parts.path.rstrip('/') or '/'
+        options = self.catalog.options
+        base_url = f"http://{self.headers.get('Host')}"
+
+        if path == '/__stats':
+            with self.lock:
+                payload = {
+                    'requests': dict(self.stats),
+                    'products_unique': len(self.product_hits),
+                    'products_repeated': sum(self.product_hits.values()) - len(self.product_hits),
+                }
+            return self._send(200, json.dumps(payload), 'application/json')
+
+        kind = _kind(path)
+        if options.latency:
+            time.sleep(options.latency * random.uniform(0.5, 1.5))
+
+        roll = random.random()
+        if roll < options.throttle_rate:
+            return self._send(429, 'Too Many Requests', kind = kind, headers = {'Retry-After': '1'})
+        if roll < options.throttle_rate + options.error_rate:
+            return self._send(503, 'Service Unavailable', kind = kind)
+
+        try:
+            if path == '/':
+                return self._send(200, self.catalog.home(), kind = kind)
+            if path == '/robots.txt':
+                return self._send(200, f'User-agent: *\nSitemap: {base_url}/sitemap.xml\n', 'text/plain', kind = kind)
+            if path == '/sitemap.xml':
+                return self._send(200, self.catalog.sitemap_index(base_url), 'application/xml', kind = kind)
+            if path.startswith('/sitemap-'):
+                chunk = int(path[len('/sitemap-'):].split('.')[0])
+                return self._send(200, self.catalog.sitemap_chunk(base_url, chunk), 'application/gzip', kind = kind)
+            if path.startswith('/catalog/category-'):
+                category = int(path.rsplit('-', 1)[1])
+                page = int(parse_qs(parts.query).get('page', ['1'])[0])
+                if category < options.categories and 1 <= page <= options.pages:
+                    return self._send(200, self.catalog.listing(category, page), kind = kind)
+            if path.startswith('/products/product-'):
+                product = int(path.rsplit('-', 1)[1])
+                if product < options.products:
+                    with self.lock:
+                        self.product_hits[product] += 1
+                    return self._send(200, self.catalog.product(product), kind = kind)
+        except ValueError:
+            pass
+        return self._send(404, 'Not Found', kind = kind)
+
+    def _send(self, status: int, body, content_type: str = 'text/html; charset=utf-8', kind: str = None, headers = None):
+        data = body if isinstance(body, bytes) else body.encode('utf-8')
+        if kind:
+            with self.lock:
+                self.stats[f"{kind} {status}"] += 1
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def _kind(path: str) -> str:
+    if path == '/':
+        return 'home'
+    if path.startswith('/catalog/'):
+        return 'listing'
+    if path.startswith('/products/'):
+        return 'product'
+    if path == '/robots.txt' or path.startswith('/sitemap'):
+        return 'sitemap'
+    return 'other'
+
+
+def serve(port: int, options: SiteOptions, host: str = '127.0.0.1'):
+    '''Запускает сервер и обслуживает запросы до остановки процесса'''
+
+    handler = type('Handler', (SiteHandler,), {
+        'catalog': Catalog(options),
+        'stats': Counter(),
+        'product_hits': Counter(),
+        'lock': threading.Lock(),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.request_queue_size = 1024
+    server.serve_forever()
+
+
+def add_site_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--categories', type = int, default = SiteOptions.categories)
+    parser.add_argument('--pages', type = int, default = SiteOptions.pages, help = 'страниц в категории')
+    parser.add_argument('--per-page', type = int, default = SiteOptions.per_page, help = 'товаров на странице')
+    parser.add_argument('--duplicates', type = float, default = 0.0, help = 'доля карточек с товарами других категорий')
+    parser.add_argument('--latency', type = float, default = 0.0, help = 'средняя задержка ответа, с')
+    parser.add_argument('--error-rate', type = float, default = 0.0, help = 'доля ответов 503')
+    parser.add_argument('--throttle-rate', type = float, default = 0.0, help = 'доля ответов 429')
+    parser.add_argument('--seed', type = int, default = SiteOptions.seed)
+
+
+def site_options(args: argparse.Namespace) -> SiteOptions:
+    return SiteOptions(
+        categories = args.categories,
+        pages = args.pages,
+        per_page = args.per_page,
+        duplicates = args.duplicates,
+        latency = args.latency,
+        error_rate = args.error_rate,
+        throttle_rate = args.throttle_rate,
+        seed = args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--port', type = int, default = 8000)
+    add_site_arguments(parser)
+    args = parser.parse_args()
+
+    options = site_options(args)
+    print(f"Синтетический сайт: http://127.0.0.1:{args.port}/, товаров {options.products}")
+    serve(args.port, options)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,14 @@
+import argparse
 import asyncio
 import logging
+import signal
+from src.core.profiling import SamplingProfiler, SlowCallbackMonitor, write_report
+from src.core.settings import settings
 from src.services.parser_service import ParserService
 
+# Число страниц товаров в режиме профилирования, если --limit не задан
+PROFILE_DEFAULT_LIMIT = 500
+
 
 def setup_logging():
     """Настройка логирования"""
@@ -14,24 +21,84 @@ def setup_logging():
         ]
     )
 
-async def main():
+def parse_args():
+    """Разбор аргументов командной строки"""
+    
+    parser = argparse.ArgumentParser(description="Парсер товаров ОптоСтрой")
+    parser.add_argument('--limit', type=int, default=None,
+                        help='загрузить не больше N страниц товаров (фронтир не сохраняется)')
+    parser.add_argument('--profile', action='store_true',
+                        help='выборочное профилирование по стадиям и поиск медленных callback')
+    parser.add_argument('--profile-output', default='profile',
+                        help='каталог для stacks.folded и top.txt')
+    parser.add_argument('--profile-top', type=int, default=30, help='число функций в отчете')
+    parser.add_argument('--profile-interval', type=float, default=0.005,
+                        help='интервал выборок, с')
+    parser.add_argument('--slow-callback', type=float, default=0.1,
+                        help='порог медленного callback цикла событий, с')
+    return parser.parse_args()
+
+async def main(args):
     """Главная функция для запуска парсинга"""
     
     setup_logging()
     
+    # SIGTERM (docker stop) отменяет обход: сервис записывает буферы
+    # и отмечает запуск как прерванный, чтобы продолжить его после рестарта
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:
+        pass
+    
+    if args.limit is not None:
+        settings.product_limit = args.limit
+    
+    profiler = None
+    monitor = None
+    if args.profile:
+        asyncio.current_task().set_name('main')
+        if not settings.product_limit:
+            settings.product_limit = PROFILE_DEFAULT_LIMIT
+        # Разбор в пуле процессов не виден профилировщику основного процесса
+        settings.parse_processes = 0
+        
+        # Callback цикла событий дольше порога попадают в лог и отчет
+        monitor = SlowCallbackMonitor(args.slow_callback)
+        monitor.install()
+        
+        profiler = SamplingProfiler(args.profile_interval)
+        profiler.start(loop)
+        logging.info(
+            f"Профилирование: выборка раз в {args.profile_interval * 1000:.1f} мс, "
+            f"медленные callback от {args.slow_callback * 1000:.0f} мс"
+        )
+    
     parser_service = ParserService()
     
-    # Запуск парсинга всех категорий ОптоСтрой
-    await parser_service.start_parsing('https://optostroy.com/')
+    try:
+        # Запуск парсинга всех категорий ОптоСтрой
+        await parser_service.start_parsing('https://optostroy.com/')
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            monitor.uninstall()
+            report = write_report(profiler, monitor, args.profile_output, args.profile_top)
+            print(report)
+            logging.info(f"Профиль сохранен в {args.profile_output} (stacks.folded, top.txt)")
     
     
 if __name__ == "__main__":
     
+    args = parse_args()
     try:
-        asyncio.run(main())
+        asyncio.run(main(args))
     except KeyboardInterrupt:
         print("Парсинг прерван пользователем")
         logging.warning("Парсинг прерван пользователем")
+    except asyncio.CancelledError:
+        print("Парсинг остановлен по сигналу")
+        logging.warning("Парсинг остановлен по сигналу SIGTERM")
     except Exception as e:
         print(f"Критическая ошибка: {e}")
         logging.error(f"Критическая ошибка в main: {e}")
\ No newline at end of file
@@ -0,0 +1,69 @@
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from src.repository.mongo_client import mongo_client
+from src.repository.price_history import PriceHistoryRepository
+
+
+def setup_logging():
+    """Настройка логирования"""
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.StreamHandler()
+        ]
+    )
+
+def parse_args():
+    """Разбор аргументов командной строки"""
+
+    parser = argparse.ArgumentParser(description="История цен и наличия товаров ОптоСтрой")
+    parser.add_argument('article', nargs='?', default=None,
+                        help='артикул товара: вывести его историю (без артикула - наибольшие изменения)')
+    parser.add_argument('--days', type=float, default=7, help='окно в сутках, заканчивающееся сейчас')
+    parser.add_argument('--top', type=int, default=20, help='число товаров с наибольшим изменением цены')
+    return parser.parse_args()
+
+def _format_price(price):
+    return '-' if price is None else f"{price:.2f}"
+
+async def main(args):
+    """Выводит историю цены товара или товары с наибольшим изменением цены за окно"""
+
+    setup_logging()
+
+    history = PriceHistoryRepository()
+    since = datetime.now() - timedelta(days=args.days)
+    await mongo_client.connect()
+    try:
+        if args.article:
+            points = await history.series(args.article, since)
+            print(f"История товара {args.article} за {args.days:g} сут.: точек {len(points)}")
+            for point in points:
+                print(f"{point['ts']:%Y-%m-%d %H:%M}  {_format_price(point.get('price')):>12}  {point.get('stock')}")
+        else:
+            rows = await history.top_changes(since, limit=args.top)
+            print(f"Наибольшие изменения цены за {args.days:g} сут.:")
+            for row in rows:
+                ratio = '-' if row.get('ratio') is None else f"{row['ratio']:+.1%}"
+                print(
+                    f"{row['article']:<20}{_format_price(row.get('start')):>12} → {_format_price(row.get('end')):<12}"
+                    f"{ratio:>8}  точек {row['changes']}"
+                )
+    finally:
+        await mongo_client.disconnect()
+
+
+if __name__ == "__main__":
+
+    args = parse_args()
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        print("Прервано пользователем")
+    except Exception as e:
+        print(f"Критическая ошибка: {e}")
+        logging.error(f"Критическая ошибка в prices: {e}")
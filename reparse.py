@@ -0,0 +1,52 @@
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime
+from src.services.reparse_service import ReparseService
+
+
+def setup_logging():
+    """Настройка логирования"""
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.StreamHandler()
+        ]
+    )
+
+def parse_args():
+    """Разбор аргументов командной строки"""
+
+    parser = argparse.ArgumentParser(description="Повторный разбор архива страниц товаров ОптоСтрой")
+    parser.add_argument('--archive', default=None, help='каталог архива (по умолчанию ARCHIVE_PATH)')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                        help='число процессов разбора (0 - в основном процессе)')
+    parser.add_argument('--since', type=datetime.fromisoformat, default=None,
+                        help='только страницы, загруженные начиная с даты (ГГГГ-ММ-ДД[ ЧЧ:ММ])')
+    parser.add_argument('--limit', type=int, default=0, help='разобрать не больше N страниц')
+    parser.add_argument('--chunk-size', type=int, default=50, help='страниц в одной задаче пула')
+    return parser.parse_args()
+
+async def main(args):
+    """Повторно разбирает сохраненные страницы и обновляет товары в базе"""
+
+    setup_logging()
+
+    service = ReparseService(args.archive)
+    await service.run(args.processes, args.since, args.limit, args.chunk_size)
+
+
+if __name__ == "__main__":
+
+    args = parse_args()
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        print("Разбор прерван пользователем")
+        logging.warning("Разбор прерван пользователем")
+    except Exception as e:
+        print(f"Критическая ошибка: {e}")
+        logging.error(f"Критическая ошибка в reparse: {e}")
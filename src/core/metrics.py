@@ -0,0 +1,366 @@
+import asyncio
+import logging
+import math
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин по умолчанию: длительности в секундах
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Границы корзин для размеров пакетов
+SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_number(value: float) -> str:
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    '''Метрика с именованными метками; значения хранятся по кортежу значений меток'''
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: LabelValues, extra: Optional[Dict[str, str]] = None) -> str:
+        pairs = list(zip(self.labelnames, key)) + list((extra or {}).items())
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def _summary_key(self, key: LabelValues) -> str:
+        return ','.join(f"{name}={value}" for name, value in zip(self.labelnames, key))
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        '''Строки экспозиции: (суффикс имени, метки, значение)'''
+
+        return iter(())
+
+    def snapshot(self) -> Union[float, dict]:
+        '''Значения для JSON-сводки; у метрики без меток - само значение'''
+
+        return {}
+
+    def reset(self):
+        pass
+
+
+class Counter(Metric):
+    '''Монотонно растущий счетчик'''
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield '', self._labels(key), value
+
+    def snapshot(self):
+        if not self.labelnames:
+            return self._values.get((), 0)
+        return {self._summary_key(key): value for key, value in sorted(self._values.items())}
+
+    def reset(self):
+        self._values.clear()
+
+
+class Gauge(Metric):
+    '''Текущее значение: устанавливается явно или вычисляется функцией при чтении'''
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def track(self, function: Callable[[], float], **labels):
+        '''Значение берется из function при каждом чтении (например, длина очереди)'''
+
+        self._functions[self._key(labels)] = function
+
+    def untrack(self, **labels):
+        '''Фиксирует последнее значение функции и перестает ее вызывать'''
+
+        key = self._key(labels)
+        function = self._functions.pop(key, None)
+        if function is not None:
+            self._values[key] = self._call(function)
+
+    def _current(self) -> Dict[LabelValues, float]:
+        values = dict(self._values)
+        for key, function in self._functions.items():
+            values[key] = self._call(function)
+        return values
+
+    @staticmethod
+    def _call(function: Callable[[], float]) -> float:
+        try:
+            return float(function())
+        except Exception:
+            return math.nan
+
+    def samples(self):
+        for key, value in sorted(self._current().items()):
+            yield '', self._labels(key), value
+
+    def snapshot(self):
+        values = self._current()
+        if not self.labelnames:
+            return values.get((), 0)
+        return {self._summary_key(key): value for key, value in sorted(values.items())}
+
+    def reset(self):
+        # Отслеживаемые функции остаются: их значения и так текущие
+        self._values.clear()
+
+
+class Histogram(Metric):
+    '''Распределение значений по корзинам с суммой и числом наблюдений'''
+
+    kind = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+        # Крайние значения ограничивают оценки квантилей в сводке
+        self._ranges: Dict[LabelValues, Tuple[float, float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * len(self.buckets)
+            self._sums[key] = 0.0
+            self._ranges[key] = (value, value)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        self._sums[key] += value
+        low, high = self._ranges[key]
+        self._ranges[key] = (min(low, value), max(high, value))
+
+    @contextmanager
+    def time(self, **labels):
+        '''Замеряет длительность блока в секундах'''
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        for key, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield '_bucket', self._labels(key, {'le': _format_number(bound)}), cumulative
+            yield '_sum', self._labels(key), self._sums[key]
+            yield '_count', self._labels(key), cumulative
+
+    def _quantile(self, key: LabelValues, quantile: float) -> float:
+        '''Оценка квантиля линейной интерполяцией внутри корзины'''
+
+        counts = self._counts[key]
+        low, high = self._ranges[key]
+        rank = quantile * sum(counts)
+        cumulative = 0
+        lower = low
+        for bound, count in zip(self.buckets, counts):
+            if count and cumulative + count >= rank:
+                upper = min(bound, high)
+                return max(low, lower + (upper - lower) * (rank - cumulative) / count)
+            cumulative += count
+            lower = max(lower, min(bound, high))
+        return high
+
+    def _summary(self, key: LabelValues) -> dict:
+        count = sum(self._counts[key])
+        low, high = self._ranges[key]
+        return {
+            'count': count,
+            'sum': round(self._sums[key], 6),
+            'mean': round(self._sums[key] / count, 6),
+            'min': round(low, 6),
+            'p50': round(self._quantile(key, 0.5), 6),
+            'p95': round(self._quantile(key, 0.95), 6),
+            'p99': round(self._quantile(key, 0.99), 6),
+            'max': round(high, 6),
+        }
+
+    def snapshot(self):
+        if not self.labelnames:
+            return self._summary(()) if () in self._counts else {'count': 0}
+        return {self._summary_key(key): self._summary(key) for key in sorted(self._counts)}
+
+    def reset(self):
+        self._counts.clear()
+        self._sums.clear()
+        self._ranges.clear()
+
+
+class MetricsRegistry:
+    '''Реестр метрик процесса: экспозиция в формате Prometheus и JSON-сводка
+
+    Метрики обновляются только из цикла событий, поэтому блокировки не нужны.
+    Повторная регистрация метрики с тем же именем возвращает существующую.
+    '''
+
+    def __init__(self, namespace: str = 'optostroy'):
+        self.namespace = namespace
+        self._metrics: Dict[str, Metric] = {}
+
+    def _register(self, metric_class, name: str, documentation: str, labelnames: Sequence[str], **kwargs) -> Metric:
+        full_name = f"{self.namespace}_{name}"
+        metric = self._metrics.get(full_name)
+        if metric is None:
+            metric = self._metrics[full_name] = metric_class(full_name, documentation, labelnames, **kwargs)
+        elif not isinstance(metric, metric_class) or metric.labelnames != tuple(labelnames):
+            raise ValueError(f"Метрика {full_name} уже зарегистрирована с другим типом или метками")
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets = buckets)
+
+    def reset(self):
+        '''Обнуляет значения всех метрик (в начале запуска)'''
+
+        for metric in self._metrics.values():
+            metric.reset()
+
+    def render(self) -> str:
+        '''Текстовый формат экспозиции Prometheus 0.0.4'''
+
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{name}{suffix}{labels} {_format_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> Dict[str, Union[float, dict]]:
+        '''Значения всех метрик для JSON-сводки (имена без префикса)'''
+
+        prefix = len(self.namespace) + 1
+        return {name[prefix:]: metric.snapshot() for name, metric in sorted(self._metrics.items())}
+
+
+class MetricsServer:
+    '''HTTP-эндпоинт /metrics в формате Prometheus на цикле событий обхода'''
+
+    def __init__(self, registry: MetricsRegistry, host: str, port: int):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        '''Запускает сервер; при занятом порте обход продолжается без эндпоинта'''
+
+        try:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        except OSError as e:
+            logger.warning(f"Эндпоинт метрик не запущен ({self.host}:{self.port}): {e}")
+            return
+        logger.info(f"Метрики доступны по адресу http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout = 5.0)
+            # Заголовки запроса не нужны, но их надо дочитать
+            while (await asyncio.wait_for(reader.readline(), timeout = 5.0)).strip():
+                pass
+
+            parts = request_line.decode('latin-1').split()
+            path = parts[1].split('?')[0] if len(parts) > 1 else ''
+            if parts and parts[0] == 'GET' and path in ('/metrics', '/'):
+                status, body = '200 OK', self.registry.render().encode('utf-8')
+            else:
+                status, body = '404 Not Found', b'Not Found\n'
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode('latin-1') + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+metrics = MetricsRegistry()
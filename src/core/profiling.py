@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Стадия для выборок, снятых, пока цикл событий ждет ввода-вывода, и для
+# callback вне задач (транспорты, таймеры)
+IDLE_STAGE = 'idle'
+LOOP_STAGE = 'loop'
+
+
+def _frame_name(code) -> str:
+    '''Имя кадра для свернутых стеков: модуль:функция (без пробелов и ';')'''
+
+    filename = code.co_filename
+    try:
+        filename = os.path.relpath(filename)
+    except ValueError:
+        pass
+    if filename.startswith('..'):
+        # Стандартная библиотека и пакеты: достаточно имени файла
+        filename = os.path.basename(filename)
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f"{filename}:{name}".replace(';', ',').replace(' ', '_')
+
+
+def task_stage(task: Optional[asyncio.Task]) -> str:
+    '''Стадия конвейера по имени задачи; безымянные задачи asyncio - other'''
+
+    if task is None:
+        return LOOP_STAGE
+    name = task.get_name()
+    return 'other' if name.startswith('Task-') else name
+
+
+class SamplingProfiler:
+    '''Выборочный профилировщик потока цикла событий
+
+    Фоновый поток каждые interval секунд снимает стек потока цикла событий
+    и запоминает, какая задача выполняется. Задачи конвейера называются по
+    стадиям, поэтому выборки группируются по стадиям. Накладные расходы не
+    зависят от числа вызовов функций, в отличие от cProfile, поэтому режим
+    подходит для запуска на рабочем сайте.
+    '''
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started: Optional[float] = None
+        self.elapsed = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread_id: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        '''Начинает снимать выборки; вызывается из потока цикла событий'''
+
+        self._loop = loop
+        self._thread_id = threading.get_ident()
+        self._stop.clear()
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target = self._run, name = 'sampling-profiler', daemon = True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.elapsed = time.perf_counter() - self.started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            stage = task_stage(asyncio.current_task(self._loop))
+
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            if stage == LOOP_STAGE and stack[-1].startswith('selectors.py:'):
+                stage = IDLE_STAGE
+
+            self.stacks[(stage, *stack)] += 1
+            self.samples += 1
+
+    def collapsed(self) -> List[str]:
+        '''Свернутые стеки "стадия;кадр;...;кадр число" для flamegraph.pl и speedscope'''
+
+        return [f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common()]
+
+    def stages(self) -> List[Tuple[str, int]]:
+        stages: Counter = Counter()
+        for stack, count in self.stacks.items():
+            stages[stack[0]] += count
+        return stages.most_common()
+
+    def hot_functions(self, top: int) -> Tuple[List[Tuple[str, int]], List[Tuple[str, int]]]:
+        '''Самые частые функции: собственное время (вершина стека) и вместе с вызываемыми'''
+
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for stack, count in self.stacks.items():
+            if stack[0] == IDLE_STAGE:
+                continue
+            own[stack[-1]] += count
+            for name in set(stack[1:]):
+                total[name] += count
+        return own.most_common(top), total.most_common(top)
+
+
+class SlowCallbackMonitor:
+    '''Замеряет каждый callback цикла событий и запоминает выполнявшиеся дольше порога
+
+    То же, что предупреждения asyncio в режиме отладки (slow_callback_duration),
+    но без режима отладки: он сохраняет стек создания каждой задачи и future,
+    что замедляет обход в разы и искажает профиль.
+    '''
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.callbacks: List[Tuple[float, str]] = []
+        self._original = None
+
+    def install(self):
+        if self._original is not None:
+            return
+        original = self._original = asyncio.events.Handle._run
+        monitor = self
+
+        def _run(handle):
+            started = time.perf_counter()
+            try:
+                original(handle)
+            finally:
+                elapsed = time.perf_counter() - started
+                if elapsed >= monitor.threshold and monitor._original is not None:
+                    monitor.record(handle, elapsed)
+
+        asyncio.events.Handle._run = _run
+
+    def uninstall(self):
+        if self._original is not None:
+            asyncio.events.Handle._run = self._original
+            self._original = None
+
+    def record(self, handle: asyncio.Handle, seconds: float):
+        # Шаг задачи описываем задачей: в ее repr видно имя и место остановки
+        owner = getattr(handle._callback, '__self__', None)
+        description = repr(owner) if isinstance(owner, asyncio.Task) else repr(handle)
+        self.callbacks.append((seconds, description))
+        logger.warning(f"Медленный callback {seconds:.3f} с: {description}")
+
+    def slowest(self, top: int) -> List[Tuple[float, str]]:
+        return sorted(self.callbacks, reverse = True)[:top]
+
+
+def write_report(
+    profiler: SamplingProfiler,
+    monitor: Optional[SlowCallbackMonitor],
+    output_dir: str,
+    top: int = 30
+) -> str:
+    '''Сохраняет stacks.folded и отчет top.txt, возвращает текст отчета'''
+
+    os.makedirs(output_dir, exist_ok = True)
+    with open(os.path.join(output_dir, 'stacks.folded'), 'w', encoding = 'utf-8') as file:
+        file.write('\n'.join(profiler.collapsed()) + '\n')
+
+    samples = profiler.samples or 1
+    lines = [
+        f"Выборок: {profiler.samples} за {profiler.elapsed:.1f} с (интервал {profiler.interval * 1000:.1f} мс)",
+        "",
+        "Стадии:"
+    ]
+    lines += [f"  {stage:<20}{count:>8}  {count / samples:6.1%}" for stage, count in profiler.stages()]
+
+    own, total = profiler.hot_functions(top)
+    lines += ["", f"Top-{top} функций по собственному времени:"]
+    lines += [f"  {count:>8}  {count / samples:6.1%}  {name}" for name, count in own]
+    lines += ["", f"Top-{top} функций вместе с вызываемыми:"]
+    lines += [f"  {count:>8}  {count / samples:6.1%}  {name}" for name, count in total]
+
+    if monitor is not None:
+        lines += ["", f"Медленных callback: {len(monitor.callbacks)}"]
+        lines += [f"  {seconds:8.3f} с  {handle}" for seconds, handle in monitor.slowest(top)]
+
+    report = '\n'.join(lines) + '\n'
+    with open(os.path.join(output_dir, 'top.txt'), 'w', encoding = 'utf-8') as file:
+        file.write(report)
+    return report
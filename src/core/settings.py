@@ -1,3 +1,5 @@
+from typing import List
+
 from pydantic import Field
 from pydantic_settings import BaseSettings
 
@@ -10,10 +12,144 @@ class Settings(BaseSettings):
     db_name: str = Field(default = "OptoStroy")
     collection_name: str = Field(default = "products")
 
+    # Пакетная запись в MongoDB: размер пакета и интервал записи по таймеру (в секундах)
+    write_batch_size: int = Field(default = 500)
+    write_flush_interval: float = Field(default = 5.0)
+
+    # Возобновление обхода: фронтир в MongoDB и интервал контрольных точек (в секундах)
+    resume_enabled: bool = Field(default = True)
+    crawl_state_collection: str = Field(default = "crawl_state")
+    checkpoint_interval: float = Field(default = 10.0)
+
+    # Распределенный обход: реплики берут задачи category, page и product из общей очереди
+    # в MongoDB с арендой (в секундах), продлевают ее и раз в интервал записывают изменения;
+    # задача, аренда которой истекла max_attempts раз, считается неудачной
+    work_queue_enabled: bool = Field(default = False)
+    work_queue_collection: str = Field(default = "crawl_queue")
+    work_queue_lease: float = Field(default = 60.0)
+    work_queue_heartbeat_interval: float = Field(default = 2.0)
+    work_queue_poll_interval: float = Field(default = 1.0)
+    work_queue_max_attempts: int = Field(default = 3)
+
+    # HTTP-клиент (общий пул соединений на весь запуск)
+    http_timeout: float = Field(default = 30.0)
+    http_max_connections: int = Field(default = 20)
+    http_max_keepalive_connections: int = Field(default = 10)
+    http_keepalive_expiry: float = Field(default = 30.0)
+    http_http2: bool = Field(default = False)
+
+    # Кеш валидаторов HTTP (ETag / Last-Modified) для повторных обходов
+    http_cache_enabled: bool = Field(default = True)
+    http_cache_path: str = Field(default = "cache/http_cache.sqlite3")
+
+    # Архив загруженных страниц товаров для повторного разбора без обхода (reparse.py):
+    # сжатие zstd (нужен пакет zstandard, иначе zlib) или zlib, размер сегмента в байтах
+    archive_enabled: bool = Field(default = False)
+    archive_path: str = Field(default = "archive")
+    archive_compression: str = Field(default = "zstd")
+    archive_compression_level: int = Field(default = 3)
+    archive_segment_size: int = Field(default = 256 * 1024 * 1024)
+
+    # Бэкенд разбора HTML: lxml (быстрый, нужен пакет lxml) или html.parser
+    html_parser: str = Field(default = "lxml")
+
+    # Извлечение полей товара: compiled (один проход по дереву) или legacy (поиск на каждое поле)
+    product_extraction: str = Field(default = "compiled")
+
+    # Быстрый путь по JSON-LD / microdata без построения дерева; выполняется,
+    # только если найдены все обязательные поля, иначе - полный разбор (в том числе
+    # когда наличие не указано или не сопоставлено с формулировками сайта)
+    structured_fast_path: bool = Field(default = True)
+    structured_required_fields: List[str] = Field(default = [
+        "title", "article", "price", "stock", "brand", "category", "description", "attributes"
+    ])
+
+    # Режим обхода: full (страницы всех товаров) или prices (цена и наличие из карточек
+    # каталога, страницы загружаются только для товаров, которых еще нет в базе)
+    crawl_mode: str = Field(default = "full")
+
+    # История загрузок товаров для планирования повторных обходов; revisit_budget - число
+    # загрузок страниц товаров за запуск (0 - без ограничений), revisit_default_rate -
+    # начальная оценка частоты изменений (раз в сутки) для товаров без истории
+    revisit_enabled: bool = Field(default = True)
+    revisit_collection: str = Field(default = "revisits")
+    revisit_budget: int = Field(default = 0)
+    revisit_default_rate: float = Field(default = 1 / 7)
+
+    # История цен и наличия: точка (артикул, цена, наличие, время) пишется в коллекцию
+    # временных рядов MongoDB только при изменении; срок хранения в сутках (0 - бессрочно)
+    price_history_enabled: bool = Field(default = True)
+    price_history_collection: str = Field(default = "price_history")
+    price_history_retention_days: int = Field(default = 0)
+
+    # Источник ссылок на товары: categories (обход каталога), sitemap (robots.txt / sitemap.xml)
+    # или both (sitemap и проверочный обход каталога); ссылки на товары отбираются по подстроке
+    discovery_mode: str = Field(default = "categories")
+    sitemap_product_pattern: str = Field(default = "/products/")
+
+    # Общее на запуск множество ссылок на товары: exact (точное) или bloom (фильтр Блума
+    # на seen_set_capacity ссылок с долей ложных совпадений seen_set_error_rate)
+    seen_set_mode: str = Field(default = "exact")
+    seen_set_capacity: int = Field(default = 1_000_000)
+    seen_set_error_rate: float = Field(default = 0.001)
+
+    # Метрики обхода: эндпоинт Prometheus на localhost (порт 0 - без эндпоинта)
+    # и JSON-сводка в конце запуска (пустой путь - без сводки)
+    metrics_enabled: bool = Field(default = True)
+    metrics_host: str = Field(default = "127.0.0.1")
+    metrics_port: int = Field(default = 9108)
+    metrics_summary_path: str = Field(default = "metrics/last_run.json")
+
+    # Конвейер обхода: число воркеров на стадию и размер очередей между стадиями
+    category_workers: int = Field(default = 1)
+    page_workers: int = Field(default = 4)
+    fetch_workers: int = Field(default = 8)
+    parse_workers: int = Field(default = 1)
+    save_workers: int = Field(default = 2)
+    queue_size: int = Field(default = 100)
+
+    # Упреждающая загрузка страниц категории, если пагинация показывает не все страницы
+    speculative_prefetch: bool = Field(default = True)
+    speculative_window: int = Field(default = 2)
+    speculative_min_products: int = Field(default = 12)
+    # Сколько страниц сверх известной пагинации можно запросить заранее
+    speculative_max_pages: int = Field(default = 50)
+
+    # Ограничение числа загружаемых страниц товаров за запуск (0 - без ограничения),
+    # например для профилирования на рабочем сайте; фронтир при этом не сохраняется
+    product_limit: int = Field(default = 0)
+
+    # Процессы для разбора страниц товаров (0 - разбор в основном процессе)
+    parse_processes: int = Field(default = 0)
+
+    # Задержка между категориями (в секундах)
+    delay_between_categories: float = Field(default = 2.0)
+
+    # Адаптивный ограничитель частоты запросов на хост (AIMD), запросов в секунду
+    rate_limit_initial: float = Field(default = 2.0)
+    rate_limit_min: float = Field(default = 0.2)
+    rate_limit_max: float = Field(default = 20.0)
+    rate_limit_increase: float = Field(default = 0.5)
+    rate_limit_decrease_factor: float = Field(default = 0.5)
+    rate_limit_burst: float = Field(default = 2.0)
+    rate_limit_cooldown: float = Field(default = 2.0)
+    rate_limit_latency_window: int = Field(default = 50)
+    rate_limit_latency_factor: float = Field(default = 2.0)
+
+    # Повторные запросы: экспоненциальная задержка с джиттером и общий бюджет на запуск
+    retry_max_attempts: int = Field(default = 4, ge = 1)
+    retry_backoff_base: float = Field(default = 1.0)
+    retry_backoff_max: float = Field(default = 30.0)
+    retry_budget: int = Field(default = 1000)
+
+    # Circuit breaker: пауза обхода при череде ошибок хоста
+    breaker_failure_threshold: int = Field(default = 10)
+    breaker_cooldown: float = Field(default = 60.0)
+
     
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
         case_sensitive = False
         
-settings = Settings()
\ No newline at end of file
+settings = Settings()
@@ -1,23 +1,27 @@
 import re
 import logging
-from typing import List
+from typing import List, Optional, Tuple
 from urllib.parse import urljoin
 
-from bs4 import BeautifulSoup
+from bs4 import SoupStrainer
 
 from src.core.settings import settings
+from src.parsers.product_spec import price_from_block
+from src.parsers.soup import PARSE_SECONDS, make_soup
 from src.scrapers.scraper import PageScraper
+from src.schemas.product import ListingOffer
 
 
 logger = logging.getLogger(__name__)
 
+PRODUCT_CARD_STRAINER = SoupStrainer('div', class_ = 'product-card')
+
 
 class CategoryPageParser:
     '''Парсер ссылок на товары'''
      
-    def __init__(self):
-        
-        self.scraper = PageScraper()
+    def __init__(self, scraper: Optional[PageScraper] = None):
+        self.scraper = scraper or PageScraper()
         
     async def get_page_count(self, url: str) -> int:
         '''Определяет количество страниц в категории'''
@@ -25,41 +29,93 @@ class CategoryPageParser:
         logger.debug(f"Определение количества страниц для: {url}")
         
         html = await self.scraper.scrape_page(url)
+        if not html:
+            logger.error(f"Не удалось получить первую страницу категории: {url}")
+            return 1
+        
+        return self.parse_page_count(html)
+    
+    def parse_page_count(self, html: str) -> int:
+        '''Определяет количество страниц по ссылкам пагинации в HTML'''
         
         pattern = r'page=(\d+)'
         matches = re.findall(pattern, html)
         
         if matches:
-            return max(int(match) for match in matches)
+            max_page = max(int(match) for match in matches)
             logger.info(f"Найдено страниц: {max_page}")
+            return max_page
         else:
             logger.info("Пагинация не найдена, возвращаем 1 страницу")
             return 1
     
-    async def create_page_links(self, url: str) -> List[str]:
-        '''Создает ссылки на все страницы категории'''
+    async def get_first_page(self, url: str) -> Optional[Tuple[int, List[str]]]:
+        '''Загружает первую страницу категории один раз: число страниц и ссылки на товары
+
+        Возвращает None, если страницу не удалось загрузить.
+        '''
+        
+        html = await self.scraper.scrape_page(url)
+        if not html:
+            logger.error(f"Не удалось получить первую страницу категории: {url}")
+            return None
+        
+        with PARSE_SECONDS.time(page = 'listing', path = 'links'):
+            return self.parse_page_count(html), self.parse_product_links(html)
+    
+    async def get_first_page_cards(self, url: str) -> Optional[Tuple[int, List[ListingOffer]]]:
+        '''Как get_first_page, но с ценой и наличием из карточек товаров'''
+        
+        html = await self.scraper.scrape_page(url)
+        if not html:
+            logger.error(f"Не удалось получить первую страницу категории: {url}")
+            return None
+        
+        with PARSE_SECONDS.time(page = 'listing', path = 'cards'):
+            return self.parse_page_count(html), self.parse_product_cards(html)
+    
+    def page_url(self, url: str, page_number: int) -> str:
+        '''Ссылка на страницу категории с указанным номером'''
         
-        pages = []
-        page_count = await self.get_page_count(url)
+        return url if page_number == 1 else f'{url}?page={page_number}'
+    
+    async def create_page_links(self, url: str, page_count: Optional[int] = None) -> List[str]:
+        '''Создает ссылки на все страницы категории
+
+        Если число страниц уже известно, первая страница повторно не загружается.
+        '''
+        
+        if page_count is None:
+            page_count = await self.get_page_count(url)
         
         logger.info(f"Создание ссылок для {page_count} страниц")
         
-        for page_number in range(1, page_count + 1):
-            if page_number == 1:
-                pages.append(url)
-            else:
-                pages.append(f'{url}?page={page_number}')  
+        pages = [self.page_url(url, page_number) for page_number in range(1, page_count + 1)]
         
         logger.debug(f"Создано ссылок на страницы: {len(pages)}")    
         return pages
     
-    async def get_product_links(self, url: str) -> List[str]:  
-        '''Извлекает ссылки на товары со страницы категории'''
+    async def get_product_links(self, url: str) -> Optional[List[str]]:  
+        '''Извлекает ссылки на товары со страницы категории; None, если страница не загружена'''
         
         logger.debug(f"Извлечение товаров с: {url}")
         
         html = await self.scraper.scrape_page(url)
-        soup = BeautifulSoup(html, 'html.parser')
+        if not html:
+            logger.error(f"Не удалось получить страницу категории: {url}")
+            return None
+        
+        with PARSE_SECONDS.time(page = 'listing', path = 'links'):
+            products_list = self.parse_product_links(html)
+        logger.info(f"Найдено товаров: {len(products_list)}")
+        
+        return products_list
+    
+    def parse_product_links(self, html: str) -> List[str]:
+        '''Извлекает ссылки на товары из HTML страницы категории'''
+        
+        # Строим дерево только из карточек товаров, без шапки, фильтров и скриптов
+        soup = make_soup(html, parse_only = PRODUCT_CARD_STRAINER)
         product_links = set()
         
         item_blocks = soup.find_all('div', class_ = 'product-card')
@@ -73,7 +129,44 @@ class CategoryPageParser:
                     full_url = urljoin(settings.base_url, href)
                     product_links.add(full_url)
         
-        products_list = sorted(list(product_links))
-        logger.info(f"Найдено товаров: {len(products_list)}")
+        return sorted(list(product_links))
+    
+    async def get_product_cards(self, url: str) -> Optional[List[ListingOffer]]:
+        '''Извлекает карточки товаров (ссылка, цена, наличие) со страницы категории; None, если страница не загружена'''
         
-        return products_list
\ No newline at end of file
+        html = await self.scraper.scrape_page(url)
+        if not html:
+            logger.error(f"Не удалось получить страницу категории: {url}")
+            return None
+        
+        with PARSE_SECONDS.time(page = 'listing', path = 'cards'):
+            cards = self.parse_product_cards(html)
+        logger.info(f"Найдено карточек товаров: {len(cards)}")
+        
+        return cards
+    
+    def parse_product_cards(self, html: str) -> List[ListingOffer]:
+        '''Извлекает цену и наличие из блоков div.product-card'''
+        
+        soup = make_soup(html, parse_only = PRODUCT_CARD_STRAINER)
+        cards = {}
+        
+        for block in soup.find_all('div', class_ = 'product-card'):
+            link = next(
+                (link for link in block.find_all('a') if (link.get('href') or '').startswith('products/')),
+                None
+            )
+            if link is None:
+                continue
+            
+            url = urljoin(settings.base_url, link.get('href'))
+            prices = block.find('div', class_ = 'product-card__prices')
+            availability = block.find('div', class_ = 'product-card__availability')
+            
+            cards[url] = ListingOffer(
+                url = url,
+                price = price_from_block(prices) if prices else None,
+                stock = availability.get_text(strip = True) or None if availability else None
+            )
+        
+        return [cards[url] for url in sorted(cards)]
@@ -0,0 +1,116 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from bs4 import BeautifulSoup, Tag
+
+
+def has_class(name: str) -> Callable[[Tag], bool]:
+    '''Тег содержит класс name (как class_='name' в BeautifulSoup)'''
+
+    return lambda tag: name in tag.get('class', ())
+
+
+def has_exact_class(value: str) -> Callable[[Tag], bool]:
+    '''Атрибут class тега в точности равен value (как class_='a b' в BeautifulSoup)'''
+
+    return lambda tag: ' '.join(tag.get('class', ())) == value
+
+
+def has_attr(name: str, value: Any = True) -> Callable[[Tag], bool]:
+    '''Тег имеет атрибут name (со значением value, если оно задано)'''
+
+    if value is True:
+        return lambda tag: tag.has_attr(name)
+    return lambda tag: tag.get(name) == value
+
+
+@dataclass(frozen = True)
+class Anchor:
+    '''Узел документа, запоминаемый за проход: первый подходящий или все (many)'''
+
+    name: str
+    tag: str
+    test: Callable[[Tag], bool] = lambda tag: True
+    many: bool = False
+
+
+@dataclass(frozen = True)
+class Step:
+    '''Шаг извлечения поля из найденных узлов; None - перейти к следующему шагу'''
+
+    anchors: Tuple[str, ...]
+    extract: Callable[..., Optional[Any]]
+
+
+@dataclass(frozen = True)
+class FieldSpec:
+    '''Поле с упорядоченными шагами извлечения и значением по умолчанию'''
+
+    name: str
+    steps: Tuple[Step, ...]
+    default: Any = None
+
+
+class CompiledExtractor:
+    '''Декларативная спецификация, скомпилированная в один обход дерева
+
+    Все якоря группируются по имени тега, поэтому документ проходится один
+    раз, а каждый тег проверяется только якорями со своим именем. Затем поля
+    заполняются по шагам в заданном порядке, как в цепочках find с фолбэками.
+    '''
+
+    def __init__(self, anchors: Sequence[Anchor], fields: Sequence[FieldSpec]):
+        self.anchors = tuple(anchors)
+        self.fields = tuple(fields)
+
+        self._by_tag: Dict[str, List[Anchor]] = defaultdict(list)
+        for anchor in self.anchors:
+            self._by_tag[anchor.tag].append(anchor)
+
+        known = {anchor.name for anchor in self.anchors}
+        for field in self.fields:
+            for step in field.steps:
+                missing = set(step.anchors) - known
+                if missing:
+                    raise ValueError(f"Поле {field.name}: неизвестные якоря {sorted(missing)}")
+
+    def scan(self, soup: BeautifulSoup) -> Dict[str, Any]:
+        '''Один проход по документу, собирающий все якоря'''
+
+        found: Dict[str, Any] = {anchor.name: [] for anchor in self.anchors if anchor.many}
+        by_tag = self._by_tag
+
+        for node in soup.descendants:
+            if not isinstance(node, Tag):
+                continue
+            candidates = by_tag.get(node.name)
+            if not candidates:
+                continue
+            for anchor in candidates:
+                if anchor.many:
+                    if anchor.test(node):
+                        found[anchor.name].append(node)
+                elif anchor.name not in found and anchor.test(node):
+                    found[anchor.name] = node
+
+        return found
+
+    def extract(self, soup: BeautifulSoup) -> Dict[str, Any]:
+        '''Заполняет все поля спецификации по одному проходу документа'''
+
+        found = self.scan(soup)
+        result = {}
+
+        for field in self.fields:
+            value = None
+            for step in field.steps:
+                nodes = [found.get(name) for name in step.anchors]
+                if not any(nodes):
+                    continue
+                value = step.extract(*nodes)
+                if value is not None:
+                    break
+            result[field.name] = field.default if value is None else value
+
+        return result
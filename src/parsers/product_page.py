@@ -1,22 +1,29 @@
 import re
 import logging
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
 from bs4 import BeautifulSoup
 
 from src.core.settings import settings
+from src.parsers.product_spec import product_extractor
+from src.parsers.soup import make_soup
+from src.parsers.structured_data import extract_structured
 from src.scrapers.scraper import PageScraper
 from src.schemas.product import Product, Supplier, SupplierOffer, PriceInfo, Attribute
 
 
 logger = logging.getLogger(__name__)
 
+# Пути разбора страницы товара
+PATH_STRUCTURED = 'structured'
+PATH_FULL = 'full'
+
 
 class ProductPropertyParser:
     '''Парсер для извлечения информации о товаре'''
     
-    def __init__(self):
-        self.scraper = PageScraper()
+    def __init__(self, scraper: Optional[PageScraper] = None):
+        self.scraper = scraper or PageScraper()
         
     async def parse_product(self, url: str) -> Optional[Product]:
         '''Парсит страницу товара, возвращая объект Product'''
@@ -28,7 +35,75 @@ class ProductPropertyParser:
             logger.error(f"Не удалось получить HTML: {url}")            
             return None
         
-        soup = BeautifulSoup(html, 'html.parser')
+        return self.parse_html(html, url)
+    
+    def parse_html(self, html: str, url: str) -> Product:
+        '''Разбирает уже загруженный HTML страницы товара (без обращения к сети)'''
+        
+        product, _ = self.parse_html_with_path(html, url)
+        return product
+    
+    def parse_html_with_path(self, html: str, url: str) -> Tuple[Product, str]:
+        '''Разбирает HTML товара и сообщает, каким путем он разобран
+
+        Сначала пробуется быстрый путь по структурированным данным (JSON-LD,
+        microdata) без построения дерева. Если обязательных полей не хватает,
+        выполняется полный разбор.
+        '''
+        
+        if settings.structured_fast_path:
+            product = self._parse_structured(html, url)
+            if product is not None:
+                return product, PATH_STRUCTURED
+        
+        return self._parse_full(html, url), PATH_FULL
+    
+    def _parse_structured(self, html: str, url: str) -> Optional[Product]:
+        '''Собирает товар из структурированных данных, если они полные'''
+        
+        fields = extract_structured(html)
+        if any(name not in fields for name in settings.structured_required_fields):
+            return None
+        
+        return Product(
+            title = fields.get('title', 'Нет данных'),
+            description = fields.get('description', 'Нет данных'),
+            article = fields.get('article', 'Нет данных'),
+            brand = fields.get('brand', 'Нет данных'),
+            country_of_origin = fields.get('country_of_origin', 'Нет данных'),
+            category = fields.get('category', 'Нет данных'),
+            attributes = fields.get('attributes', []),
+            suppliers = self._build_suppliers(
+                fields.get('price', 0.0),
+                fields.get('stock', 'Нет данных'),
+                url
+            )
+        )
+    
+    def _parse_full(self, html: str, url: str) -> Product:
+        '''Полный разбор по дереву документа'''
+        
+        soup = make_soup(html)
+        
+        if settings.product_extraction == 'legacy':
+            return self._parse_soup_legacy(soup, url)
+        
+        # Все поля заполняются за один проход по дереву
+        fields = product_extractor.extract(soup)
+        
+        return Product(
+            title = fields['title'],
+            description = fields['description'],
+            article = fields['article'],
+            brand = fields['brand'],
+            country_of_origin = fields['country_of_origin'],
+            category = fields['category'],
+            attributes = fields['attributes'],
+            suppliers = self._build_suppliers(fields['price'], fields['stock'], url)
+        )
+    
+    def _parse_soup_legacy(self, soup: BeautifulSoup, url: str) -> Product:
+        '''Разбор отдельными поисками по документу для каждого поля'''
         
         # Извлекаем основную информацию о товарах
         title = self._extract_title(soup)
@@ -373,6 +448,11 @@ class ProductPropertyParser:
         price = self._extract_price(soup)
         stock = self._extract_stock(soup)
         
+        return self._build_suppliers(price, stock, page_url)
+    
+    def _build_suppliers(self, price: float, stock: str, page_url: str) -> List[Supplier]:
+        '''Собирает поставщика ОптоСтрой с предложением по цене и наличию'''
+        
         price_info = PriceInfo(qnt = 1, discount = 0, price = price)
         
         supplier_offer = SupplierOffer(
@@ -389,4 +469,20 @@ class ProductPropertyParser:
             supplier_offers = [supplier_offer]
         )
         
-        return [supplier]      
\ No newline at end of file
+        return [supplier]
+
+
+# Экземпляр для разбора в процессах пула: создается один раз на процесс
+_process_parser: Optional[ProductPropertyParser] = None
+
+
+def parse_product_html(html: str, url: str) -> Tuple[Product, str]:
+    '''Разбирает HTML товара; функция уровня модуля для ProcessPoolExecutor
+
+    Возвращает товар и путь разбора (structured или full).
+    '''
+    
+    global _process_parser
+    if _process_parser is None:
+        _process_parser = ProductPropertyParser()
+    return _process_parser.parse_html_with_path(html, url)
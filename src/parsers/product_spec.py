@@ -0,0 +1,233 @@
+import re
+from typing import List, Optional
+
+from bs4 import Tag
+
+from src.parsers.extraction import (
+    Anchor, CompiledExtractor, FieldSpec, Step, has_attr, has_class, has_exact_class
+)
+from src.schemas.product import Attribute
+
+
+PRICE_PATTERN = re.compile(r'(\d{1,3}(?:\s\d{3})*(?:[,\.]\d{2})?)')
+
+# Характеристики, извлекаемые отдельными полями товара
+EXCLUDED_ATTRIBUTES = {
+    'название', 'описание', 'артикул', 'категория', 'цена', 'стоимость',
+    'наличие', 'в наличии', 'бренд', 'марка', 'страна происхождения'
+}
+
+
+def _text(tag: Optional[Tag]) -> Optional[str]:
+    '''Текст тега или None, если тега нет'''
+
+    return tag.get_text(strip = True) if tag is not None else None
+
+
+def _non_empty(value: Optional[str]) -> Optional[str]:
+    return value if value and value.strip() else None
+
+
+def _parse_price(text: Optional[str], positive: bool = False) -> Optional[float]:
+    if not text:
+        return None
+    price_match = PRICE_PATTERN.search(text)
+    if not price_match:
+        return None
+    try:
+        price = float(price_match.group(1).replace(' ', '').replace(',', '.'))
+    except ValueError:
+        return None
+    if positive and price <= 0:
+        return None
+    return price
+
+
+def _meta_content(meta: Tag) -> Optional[str]:
+    return meta.get('content') or None
+
+
+# Шаги полей повторяют порядок фолбэков методов ProductPropertyParser._extract_*
+
+def _description_from_tab(tab: Tag) -> Optional[str]:
+    return _non_empty(_text(tab.find('p')))
+
+
+def _description_from_block(block: Tag) -> Optional[str]:
+    return _non_empty(_text(block))
+
+
+def _article_from_list(item: Tag) -> Optional[str]:
+    return _non_empty(_text(item.find('span')))
+
+
+def _article_from_meta(meta: Tag) -> Optional[str]:
+    content = meta.get('content')
+    return content.strip() or None if content else None
+
+
+def _brand_from_meta_list(meta_list: Tag) -> Optional[str]:
+    return _non_empty(_text(meta_list.find('a')))
+
+
+def _brand_from_microdata(brand_div: Tag) -> Optional[str]:
+    meta = brand_div.find('meta', {'itemprop': 'brand'})
+    return _meta_content(meta) if meta else None
+
+
+def _spec_rows(spec_section: Tag):
+    for row in spec_section.find_all('div', class_ = 'spec__row'):
+        name_cell = row.find('div', class_ = 'spec__name')
+        value_cell = row.find('div', class_ = 'spec__value')
+        if name_cell and value_cell:
+            yield name_cell, value_cell
+
+
+def _country_from_spec(spec_blocks: List[Tag]) -> Optional[str]:
+    spec_section = spec_blocks[0].find('div', class_ = 'spec__section')
+    if spec_section:
+        for name_cell, value_cell in _spec_rows(spec_section):
+            if name_cell.get_text(strip = True) == 'Страна происхождения:':
+                return value_cell.get_text(strip = True)
+    return None
+
+
+def _category_from_breadcrumb(breadcrumb: Tag) -> Optional[str]:
+    categories = []
+    for item in breadcrumb.find_all('li', {'class': 'breadcrumb-item'}):
+        if 'active' not in item.get('class', []):
+            link = item.find('a')
+            if link:
+                category = link.get_text(strip = True)
+                if category and category != 'Главная':
+                    categories.append(category)
+    return categories[-1] if categories else None
+
+
+def _category_from_meta(meta: Tag) -> Optional[str]:
+    content = meta.get('content')
+    if not content:
+        return None
+    return content.split('/')[-1].strip() or None
+
+
+def _attributes(spec_tab: Optional[Tag], spec_blocks: List[Tag]) -> List[Attribute]:
+    specs_to_check = []
+    if spec_tab is not None:
+        spec_section = spec_tab.find('div', class_ = 'spec__section')
+        if spec_section:
+            specs_to_check.append(spec_section)
+    for spec_block in spec_blocks or ():
+        spec_section = spec_block.find('div', class_ = 'spec__section')
+        if spec_section and spec_section not in specs_to_check:
+            specs_to_check.append(spec_section)
+
+    attributes = []
+    seen_attributes = set()
+    for spec_section in specs_to_check:
+        for name_elem, value_elem in _spec_rows(spec_section):
+            name = name_elem.get_text(strip = True)
+            value_link = value_elem.find('a')
+            value = (value_link or value_elem).get_text(strip = True)
+
+            if name and value:
+                name_clean = name.rstrip(':').strip()
+                name_lower = name_clean.lower().strip()
+                if name_lower in EXCLUDED_ATTRIBUTES or name_lower in seen_attributes:
+                    continue
+                attributes.append(Attribute(attr_name = name_clean, attr_value = value))
+                seen_attributes.add(name_lower)
+
+    return attributes
+
+
+def price_from_block(price_block: Tag) -> Optional[float]:
+    '''Цена из блока цен: new-price, иначе положительная old-price (страница товара и карточка)'''
+
+    price = _parse_price(_text(price_block.find('span', class_ = 'new-price')))
+    if price is None:
+        price = _parse_price(_text(price_block.find('span', class_ = 'old-price')), positive = True)
+    return price
+
+
+def _price_from_variant(checked_variant: Optional[Tag], checked_input: Optional[Tag]) -> Optional[float]:
+    variant = checked_variant or checked_input
+    return _parse_price(variant.get('data-price'))
+
+
+def _price_from_meta(meta: Tag) -> Optional[float]:
+    return _parse_price(meta.get('content'))
+
+
+def _stock_from_meta_list(meta_list: Tag) -> Optional[str]:
+    stock_info = meta_list.find('span', class_ = 'text-success')
+    if stock_info:
+        return stock_info.get_text(strip = True)
+
+    availability_item = meta_list.find('li', class_ = 'product__meta-availability')
+    if availability_item:
+        return _text(availability_item.find('span'))
+    return None
+
+
+PRODUCT_ANCHORS = (
+    Anchor('h1', 'h1'),
+    Anchor('breadcrumb_active', 'li', has_exact_class('breadcrumb-item active')),
+    Anchor('breadcrumb', 'ol', has_class('breadcrumb')),
+    Anchor('meta_name', 'meta', has_attr('itemprop', 'name')),
+    Anchor('meta_sku', 'meta', has_attr('itemprop', 'sku')),
+    Anchor('meta_price', 'meta', has_attr('itemprop', 'price')),
+    Anchor('meta_category', 'meta', has_attr('itemprop', 'category')),
+    Anchor('brand_div', 'div', has_attr('itemprop', 'brand')),
+    Anchor('description_tab', 'div', has_attr('id', 'tab-description')),
+    Anchor('description_block', 'div', has_class('product__description')),
+    Anchor('specification_tab', 'div', has_attr('id', 'tab-specification')),
+    Anchor('spec_blocks', 'div', has_class('spec'), many = True),
+    Anchor('variant_sku', 'span', has_class('variant-sku')),
+    Anchor('sku_item', 'li', has_exact_class('sku sku-show')),
+    Anchor('meta_list', 'ul', has_class('product__meta')),
+    Anchor('prices_block', 'div', has_class('product__prices')),
+    Anchor('checked_variant', 'input', has_exact_class('variant-radio checked')),
+    Anchor('checked_input', 'input', has_attr('checked')),
+)
+
+PRODUCT_FIELDS = (
+    FieldSpec('title', (
+        Step(('h1',), _text),
+        Step(('breadcrumb_active',), _text),
+        Step(('meta_name',), _meta_content),
+    ), 'Нет данных'),
+    FieldSpec('description', (
+        Step(('description_tab',), _description_from_tab),
+        Step(('description_block',), _description_from_block),
+    ), 'Нет данных'),
+    FieldSpec('article', (
+        Step(('variant_sku',), lambda span: _non_empty(_text(span))),
+        Step(('sku_item',), _article_from_list),
+        Step(('meta_sku',), _article_from_meta),
+    ), 'Нет данных'),
+    FieldSpec('brand', (
+        Step(('meta_list',), _brand_from_meta_list),
+        Step(('brand_div',), _brand_from_microdata),
+    ), 'Нет данных'),
+    FieldSpec('country_of_origin', (
+        Step(('spec_blocks',), _country_from_spec),
+    ), 'Нет данных'),
+    FieldSpec('category', (
+        Step(('breadcrumb',), _category_from_breadcrumb),
+        Step(('meta_category',), _category_from_meta),
+    ), 'Нет данных'),
+    FieldSpec('attributes', (
+        Step(('specification_tab', 'spec_blocks'), _attributes),
+    ), ()),
+    FieldSpec('price', (
+        Step(('prices_block',), price_from_block),
+        Step(('checked_variant', 'checked_input'), _price_from_variant),
+        Step(('meta_price',), _price_from_meta),
+    ), 0.0),
+    FieldSpec('stock', (
+        Step(('meta_list',), _stock_from_meta_list),
+    ), 'Нет данных'),
+)
+
+product_extractor = CompiledExtractor(PRODUCT_ANCHORS, PRODUCT_FIELDS)
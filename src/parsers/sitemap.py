@@ -0,0 +1,164 @@
+import logging
+import zlib
+from datetime import datetime, timezone
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+from urllib.parse import urljoin
+from xml.etree.ElementTree import ParseError, XMLPullParser
+
+from src.core.metrics import metrics
+from src.core.settings import settings
+from src.scrapers.scraper import PageScraper
+
+
+logger = logging.getLogger(__name__)
+
+GZIP_MAGIC = b'\x1f\x8b'
+CHUNK_SIZE = 64 * 1024
+
+SITEMAP_ENTRIES = metrics.counter('sitemap_entries_total', 'Записи sitemap по результату отбора', ('result',))
+
+
+def parse_lastmod(value: Optional[str]) -> Optional[datetime]:
+    '''Разбирает <lastmod> (формат W3C Datetime) в datetime с часовым поясом'''
+    
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo = timezone.utc)
+    return parsed
+
+
+def _chunks(data: bytes) -> Iterator[bytes]:
+    '''Отдает содержимое sitemap кусками, распаковывая gzip на лету'''
+    
+    if data[:2] == GZIP_MAGIC:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        for start in range(0, len(data), CHUNK_SIZE):
+            yield decompressor.decompress(data[start:start + CHUNK_SIZE])
+        yield decompressor.flush()
+    else:
+        for start in range(0, len(data), CHUNK_SIZE):
+            yield data[start:start + CHUNK_SIZE]
+
+
+def iter_sitemap_entries(data: bytes) -> Iterator[Tuple[str, str, Optional[datetime]]]:
+    '''Потоково разбирает sitemap: (вид записи, loc, lastmod)
+
+    Вид записи - 'sitemap' для индекса sitemap и 'url' для списка страниц.
+    Дерево целиком не строится: обработанные элементы сразу очищаются.
+    '''
+    
+    parser = XMLPullParser(events = ('end',))
+    for chunk in _chunks(data):
+        parser.feed(chunk)
+        yield from _drain(parser)
+    parser.close()
+    yield from _drain(parser)
+
+
+def _drain(parser: XMLPullParser) -> Iterator[Tuple[str, str, Optional[datetime]]]:
+    for _, element in parser.read_events():
+        kind = element.tag.rsplit('}', 1)[-1]
+        if kind not in ('url', 'sitemap'):
+            continue
+        
+        loc = lastmod = None
+        for child in element:
+            name = child.tag.rsplit('}', 1)[-1]
+            if name == 'loc':
+                loc = (child.text or '').strip()
+            elif name == 'lastmod':
+                lastmod = parse_lastmod(child.text)
+        element.clear()
+        
+        if loc:
+            yield kind, loc, lastmod
+
+
+class SitemapParser:
+    '''Поиск ссылок на товары по robots.txt и sitemap.xml'''
+    
+    def __init__(self, scraper: Optional[PageScraper] = None):
+        self.scraper = scraper or PageScraper()
+        self.found = 0
+        self.skipped_unchanged = 0
+        self.skipped_sitemaps = 0
+        
+    async def get_sitemap_urls(self, base_url: str) -> List[str]:
+        '''Извлекает адреса sitemap из robots.txt, по умолчанию - /sitemap.xml'''
+        
+        robots = await self.scraper.scrape_page(urljoin(base_url, '/robots.txt'))
+        
+        sitemaps = []
+        for line in (robots or '').splitlines():
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'sitemap' and value.strip():
+                sitemaps.append(value.strip())
+        
+        if not sitemaps:
+            sitemaps.append(urljoin(base_url, '/sitemap.xml'))
+        
+        logger.info(f"Найдено sitemap: {len(sitemaps)}")
+        return sitemaps
+    
+    async def iter_product_urls(self, base_url: str, since: Optional[datetime] = None) -> AsyncIterator[str]:
+        '''Отдает ссылки на товары из sitemap, пропуская не изменявшиеся с since'''
+        
+        pending = await self.get_sitemap_urls(base_url)
+        visited = set()
+        
+        while pending:
+            sitemap_url = pending.pop(0)
+            if sitemap_url in visited:
+                continue
+            visited.add(sitemap_url)
+            
+            data = await self.scraper.scrape_bytes(sitemap_url)
+            if not data:
+                logger.error(f"Не удалось получить sitemap: {sitemap_url}")
+                continue
+            
+            logger.info(f"Разбор sitemap: {sitemap_url}")
+            try:
+                for kind, loc, lastmod in iter_sitemap_entries(data):
+                    if kind == 'sitemap':
+                        # Вложенный sitemap без изменений с прошлого запуска не загружаем
+                        if self._unchanged(lastmod, since):
+                            self.skipped_sitemaps += 1
+                            SITEMAP_ENTRIES.inc(result = 'sitemap_unchanged')
+                        else:
+                            pending.append(loc)
+                        continue
+                    
+                    if settings.sitemap_product_pattern not in loc:
+                        continue
+                    
+                    self.found += 1
+                    if self._unchanged(lastmod, since):
+                        self.skipped_unchanged += 1
+                        SITEMAP_ENTRIES.inc(result = 'product_unchanged')
+                        continue
+                    SITEMAP_ENTRIES.inc(result = 'product')
+                    yield loc
+            except ParseError as e:
+                logger.error(f"Ошибка разбора sitemap {sitemap_url}: {e}")
+        
+        logger.info(
+            f"Товаров в sitemap: {self.found}, "
+            f"пропущено без изменений: {self.skipped_unchanged}, "
+            f"вложенных sitemap без изменений: {self.skipped_sitemaps}"
+        )
+    
+    @property
+    def empty(self) -> bool:
+        '''В sitemap не нашлось ни одного товара, в том числе среди пропущенных'''
+        
+        return not (self.found or self.skipped_sitemaps)
+    
+    @staticmethod
+    def _unchanged(lastmod: Optional[datetime], since: Optional[datetime]) -> bool:
+        return bool(lastmod and since and lastmod < since)
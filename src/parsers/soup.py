@@ -0,0 +1,43 @@
+import logging
+from functools import lru_cache
+from importlib.util import find_spec
+from typing import Optional
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from src.core.metrics import metrics
+from src.core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Время разбора страниц: page - вид страницы, path - что из нее извлекается
+PARSE_SECONDS = metrics.histogram('parse_seconds', 'Время разбора страницы', ('page', 'path'))
+
+
+# Поддерживаемые бэкенды BeautifulSoup и пакеты, которые им нужны
+HTML_BACKENDS = {
+    'lxml': 'lxml',
+    'html.parser': None
+}
+
+
+@lru_cache(maxsize = None)
+def _resolve_backend(name: str) -> str:
+    '''Проверяет выбранный бэкенд и при недоступности откатывается на html.parser'''
+    
+    if name not in HTML_BACKENDS:
+        logger.warning(f"Неизвестный HTML-бэкенд '{name}', используется html.parser")
+        return 'html.parser'
+    
+    package = HTML_BACKENDS[name]
+    if package and not find_spec(package):
+        logger.warning(f"HTML-бэкенд '{name}' недоступен (не установлен пакет {package}), используется html.parser")
+        return 'html.parser'
+    
+    return name
+
+
+def make_soup(html: str, parse_only: Optional[SoupStrainer] = None) -> BeautifulSoup:
+    '''Строит дерево документа выбранным в настройках бэкендом'''
+    
+    return BeautifulSoup(html, _resolve_backend(settings.html_parser), parse_only = parse_only)
@@ -1,29 +1,46 @@
-from typing import List
+from typing import List, Optional
 from urllib.parse import urljoin
 import logging
 
-from bs4 import BeautifulSoup
+from bs4 import SoupStrainer
 
 from src.core.settings import settings
+from src.parsers.soup import PARSE_SECONDS, make_soup
 from src.scrapers.scraper import PageScraper
 
 
 logger = logging.getLogger(__name__)
 
+CATEGORY_STRAINER = SoupStrainer('div', class_ = 'category-card__name')
+
 
 class StartPageParser:
     '''Парсер категорий товаров из каталога'''
     
-    def __init__(self):
-        self.scraper = PageScraper()
+    def __init__(self, scraper: Optional[PageScraper] = None):
+        self.scraper = scraper or PageScraper()
         
-    async def get_categories(self, url: str) -> List[str]:
-        '''Извлекает ссылки категорий товаров'''
+    async def get_categories(self, url: str) -> Optional[List[str]]:
+        '''Извлекает ссылки категорий товаров; None, если стартовая страница недоступна'''
         
         logger.info(f"Получение категорий с: {url}")
         
         html = await self.scraper.scrape_page(url)
-        soup = BeautifulSoup(html, 'html.parser')
+        if not html:
+            logger.error(f"Не удалось получить стартовую страницу: {url}")
+            return None
+        
+        with PARSE_SECONDS.time(page = 'start', path = 'categories'):
+            categories = self.parse_categories(html)
+        logger.info(f"Всего найдено категорий: {len(categories)}")
+            
+        return categories
+    
+    def parse_categories(self, html: str) -> List[str]:
+        '''Извлекает ссылки категорий из HTML стартовой страницы'''
+        
+        # Строим дерево только из блоков с названиями категорий
+        soup = make_soup(html, parse_only = CATEGORY_STRAINER)
         
         items = soup.find_all('div', class_ = 'category-card__name')
         
@@ -38,6 +55,4 @@ class StartPageParser:
                     
                     logger.debug(f"Найдена категория: {full_url}")
         
-        logger.info(f"Всего найдено категорий: {len(categories)}")
-            
-        return categories
\ No newline at end of file
+        return categories
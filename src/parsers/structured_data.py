@@ -0,0 +1,162 @@
+import html as html_lib
+import json
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+from src.parsers.product_spec import EXCLUDED_ATTRIBUTES
+from src.schemas.product import Attribute
+
+
+# Регулярные выражения работают по сырому HTML, дерево документа не строится
+META_TAG_PATTERN = re.compile(r'<meta\s[^>]*\bitemprop\s*=\s*["\']?([\w-]+)[^>]*>', re.IGNORECASE)
+ATTRIBUTE_PATTERN = re.compile(r'([\w-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))')
+JSON_LD_PATTERN = re.compile(
+    r'<script[^>]*type\s*=\s*["\']application/ld\+json["\'][^>]*>(.*?)</script>',
+    re.IGNORECASE | re.DOTALL
+)
+
+MICRODATA_FIELDS = {
+    'name': 'title',
+    'sku': 'article',
+    'price': 'price',
+    'brand': 'brand',
+    'category': 'category',
+    'description': 'description',
+}
+
+# Наличие из schema.org в формулировках сайта
+AVAILABILITY = {
+    'instock': 'В наличии',
+    'outofstock': 'Нет в наличии',
+    'preorder': 'Под заказ',
+    'backorder': 'Под заказ',
+}
+
+COUNTRY_ATTRIBUTE = 'страна происхождения'
+
+
+def _tag_attributes(tag: str) -> Dict[str, str]:
+    attributes = {}
+    for match in ATTRIBUTE_PATTERN.finditer(tag):
+        value = next(group for group in match.groups()[1:] if group is not None)
+        attributes[match.group(1).lower()] = html_lib.unescape(value)
+    return attributes
+
+
+def _to_price(value: Any) -> Optional[float]:
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not value:
+        return None
+    try:
+        return float(str(value).replace('\xa0', '').replace(' ', '').replace(',', '.'))
+    except ValueError:
+        return None
+
+
+def _last_category(value: Optional[str]) -> Optional[str]:
+    if not value:
+        return None
+    return value.split('/')[-1].strip() or None
+
+
+def _json_ld_products(raw: str) -> Iterable[dict]:
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        return
+
+    stack = data if isinstance(data, list) else [data]
+    while stack:
+        item = stack.pop(0)
+        if not isinstance(item, dict):
+            continue
+        if '@graph' in item:
+            stack.extend(item['@graph'])
+        item_type = item.get('@type')
+        types = item_type if isinstance(item_type, list) else [item_type]
+        if 'Product' in types:
+            yield item
+
+
+def _attributes(properties: Any) -> tuple:
+    '''Характеристики из additionalProperty с теми же фильтрами, что и в полном разборе'''
+
+    attributes: List[Attribute] = []
+    seen = set()
+    country = None
+
+    for prop in properties if isinstance(properties, list) else [properties]:
+        if not isinstance(prop, dict):
+            continue
+        name = str(prop.get('name') or '').rstrip(':').strip()
+        value = str(prop.get('value') or '').strip()
+        if not (name and value):
+            continue
+
+        name_lower = name.lower()
+        if name_lower == COUNTRY_ATTRIBUTE and country is None:
+            country = value
+        if name_lower in EXCLUDED_ATTRIBUTES or name_lower in seen:
+            continue
+        attributes.append(Attribute(attr_name = name, attr_value = value))
+        seen.add(name_lower)
+
+    return attributes, country
+
+
+def _from_json_ld(item: dict) -> Dict[str, Any]:
+    fields: Dict[str, Any] = {
+        'title': item.get('name'),
+        'article': item.get('sku') or item.get('mpn'),
+        'description': item.get('description'),
+        'category': _last_category(item.get('category')),
+    }
+
+    brand = item.get('brand')
+    fields['brand'] = brand.get('name') if isinstance(brand, dict) else brand
+
+    offers = item.get('offers')
+    if isinstance(offers, list):
+        offers = offers[0] if offers else None
+    if isinstance(offers, dict):
+        fields['price'] = _to_price(offers.get('price') or offers.get('lowPrice'))
+        availability = str(offers.get('availability') or '').rsplit('/', 1)[-1].lower()
+        fields['stock'] = AVAILABILITY.get(availability)
+
+    if 'additionalProperty' in item:
+        fields['attributes'], fields['country_of_origin'] = _attributes(item['additionalProperty'])
+
+    return fields
+
+
+def extract_structured(html: str) -> Dict[str, Any]:
+    '''Извлекает поля товара из JSON-LD и microdata без построения дерева
+
+    JSON-LD имеет приоритет; недостающие поля дополняются из meta-тегов
+    с itemprop. В результат попадают только найденные непустые значения.
+    '''
+
+    fields: Dict[str, Any] = {}
+
+    for match in JSON_LD_PATTERN.finditer(html):
+        for item in _json_ld_products(match.group(1)):
+            for name, value in _from_json_ld(item).items():
+                if value not in (None, '') and name not in fields:
+                    fields[name] = value
+
+    for match in META_TAG_PATTERN.finditer(html):
+        field = MICRODATA_FIELDS.get(match.group(1))
+        if not field or field in fields:
+            continue
+        content = _tag_attributes(match.group(0)).get('content', '').strip()
+        if not content:
+            continue
+        if field == 'price':
+            fields[field] = _to_price(content)
+        elif field == 'category':
+            fields[field] = _last_category(content)
+        else:
+            fields[field] = content
+
+    return {name: value for name, value in fields.items() if value is not None}
@@ -0,0 +1,144 @@
+import logging
+from datetime import datetime
+from typing import AsyncIterator, Iterable, List, Optional
+
+from pymongo import ASCENDING, IndexModel, UpdateOne
+
+from src.core.settings import settings
+from src.repository.mongo_client import MONGO_BATCH_SIZE, MONGO_SECONDS, mongo_client
+
+logger = logging.getLogger(__name__)
+
+
+# Статусы запуска
+RUN_RUNNING = 'running'
+RUN_INTERRUPTED = 'interrupted'
+RUN_COMPLETED = 'completed'
+
+# Статусы задач фронтира
+TASK_PENDING = 'pending'
+TASK_DONE = 'done'
+TASK_FAILED = 'failed'
+
+RUN_ID = 'run'
+
+
+class CrawlStateRepository:
+    '''Фронтир обхода в MongoDB для возобновления после падения или остановки
+
+    Хранит документ запуска и задачи видов category, page, product и sitemap
+    со статусами. Изменения копятся в памяти и записываются упорядоченным
+    bulk_write на контрольных точках: дочерние задачи всегда попадают в базу
+    раньше, чем родительская отмечается выполненной.
+    '''
+
+    def __init__(self):
+        self._collection = None
+        self._pending: List[UpdateOne] = []
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            self._collection = mongo_client.get_collection(settings.crawl_state_collection)
+        return self._collection
+
+    async def ensure_indexes(self):
+        await self.collection.create_indexes([
+            IndexModel([("kind", ASCENDING), ("status", ASCENDING)], name = "kind_status")
+        ])
+
+    async def begin_run(self) -> bool:
+        '''Начинает запуск; True - продолжается незавершенный предыдущий'''
+
+        run = await self.collection.find_one({"_id": RUN_ID})
+        now = datetime.now()
+
+        if run and run.get("status") in (RUN_RUNNING, RUN_INTERRUPTED):
+            await self.collection.update_one(
+                {"_id": RUN_ID},
+                {"$set": {"status": RUN_RUNNING, "resumed_at": now}}
+            )
+            logger.info(f"Продолжение обхода, начатого {run.get('started_at')}")
+            return True
+
+        await self.collection.delete_many({"_id": {"$ne": RUN_ID}})
+        await self.collection.update_one(
+            {"_id": RUN_ID},
+            {
+                "$set": {"status": RUN_RUNNING, "started_at": now},
+                "$unset": {"resumed_at": "", "finished_at": ""}
+            },
+            upsert = True
+        )
+        return False
+
+    async def finish_run(self, status: str):
+        '''Записывает остаток изменений и итоговый статус запуска'''
+
+        await self.write(self.take_pending())
+
+        update = {"status": status, "finished_at": datetime.now()}
+        if status == RUN_COMPLETED:
+            # Время начала завершенного обхода - граница для <lastmod> из sitemap
+            run = await self.collection.find_one({"_id": RUN_ID}, {"started_at": 1})
+            if run and run.get("started_at"):
+                update["last_completed_started_at"] = run["started_at"]
+
+        await self.collection.update_one({"_id": RUN_ID}, {"$set": update})
+        logger.info(f"Состояние обхода сохранено: {status}")
+
+    async def last_completed_at(self) -> Optional[datetime]:
+        '''Время начала последнего завершенного обхода (с часовым поясом) или None'''
+
+        run = await self.collection.find_one({"_id": RUN_ID}, {"last_completed_started_at": 1})
+        started_at = run.get("last_completed_started_at") if run else None
+        # Время записывается как локальное datetime.now()
+        return started_at.astimezone() if started_at else None
+
+    async def load_pending(self, kind: str) -> List[str]:
+        '''Возвращает URL невыполненных задач указанного вида'''
+
+        cursor = self.collection.find({"kind": kind, "status": TASK_PENDING}, {"url": 1})
+        return [document["url"] async for document in cursor]
+
+    async def iter_urls(self, kind: str) -> AsyncIterator[str]:
+        '''URL всех задач указанного вида независимо от статуса'''
+
+        async for document in self.collection.find({"kind": kind}, {"url": 1}):
+            yield document["url"]
+
+    def add(self, kind: str, urls: Iterable[str]):
+        '''Добавляет задачи во фронтир, не трогая уже известные'''
+
+        for url in urls:
+            self._pending.append(UpdateOne(
+                {"_id": f"{kind}:{url}"},
+                {"$setOnInsert": {"kind": kind, "url": url, "status": TASK_PENDING}},
+                upsert = True
+            ))
+
+    def mark(self, kind: str, url: str, status: str = TASK_DONE):
+        '''Отмечает задачу выполненной или неудачной'''
+
+        self._pending.append(UpdateOne(
+            {"_id": f"{kind}:{url}"},
+            {"$set": {"kind": kind, "url": url, "status": status}},
+            upsert = True
+        ))
+
+    def take_pending(self) -> List[UpdateOne]:
+        '''Забирает накопленные изменения для записи на контрольной точке'''
+
+        operations, self._pending = self._pending, []
+        return operations
+
+    def restore(self, operations: List[UpdateOne]):
+        '''Возвращает изменения, которые не удалось записать, до следующей контрольной точки'''
+
+        self._pending[:0] = operations
+
+    async def write(self, operations: List[UpdateOne]):
+        if operations:
+            MONGO_BATCH_SIZE.observe(len(operations), operation = 'checkpoint')
+            with MONGO_SECONDS.time(operation = 'checkpoint_write'):
+                await self.collection.bulk_write(operations, ordered = True)
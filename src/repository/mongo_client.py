@@ -1,9 +1,16 @@
 import logging
 from pymongo import AsyncMongoClient
+from src.core.metrics import SIZE_BUCKETS, metrics
 from src.core.settings import settings
 
 logger = logging.getLogger(__name__)
 
+# Общие для репозиториев метрики: operation - вид выборки или записи
+MONGO_SECONDS = metrics.histogram('mongo_operation_seconds', 'Длительность операций MongoDB', ('operation',))
+MONGO_BATCH_SIZE = metrics.histogram(
+    'mongo_batch_size', 'Число операций в пакете bulk_write', ('operation',), buckets = SIZE_BUCKETS
+)
+
 
 class MongoClient:
     
@@ -0,0 +1,204 @@
+import logging
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError, CollectionInvalid
+
+from src.core.metrics import metrics
+from src.core.settings import settings
+from src.repository.mongo_client import MONGO_BATCH_SIZE, MONGO_SECONDS, mongo_client
+
+logger = logging.getLogger(__name__)
+
+# Поля точки: время (timeField) и артикул (metaField) коллекции временных рядов
+TIME_FIELD = 'ts'
+META_FIELD = 'article'
+
+PRICE_POINTS = metrics.counter(
+    'price_history_points_total', 'Точки истории цен и наличия: new, changed и dropped - не записанные', ('reason',)
+)
+
+
+def offer_point(offer: Optional[dict]) -> Optional[Tuple[Optional[float], Optional[str]]]:
+    '''Цена (за наименьшую партию) и наличие предложения или None, если предложения нет'''
+
+    if not offer:
+        return None
+    prices = [price for price in offer.get("price") or [] if price.get("price") is not None]
+    price = min(prices, key = lambda price: price.get("qnt", 1))["price"] if prices else None
+    return price, offer.get("stock")
+
+
+def first_offer(document: Optional[dict]) -> Optional[dict]:
+    '''Первое предложение первого поставщика товара (документа или model_dump)'''
+
+    suppliers = (document or {}).get("suppliers") or []
+    if suppliers and suppliers[0].get("supplier_offers"):
+        return suppliers[0]["supplier_offers"][0]
+    return None
+
+
+class PriceHistoryRepository:
+    '''История цен и наличия товаров в коллекции временных рядов MongoDB
+
+    Точка - артикул, цена, наличие и время - записывается только при
+    появлении товара и при изменении цены или наличия, а не на каждом
+    обходе, поэтому история занимает место пропорционально числу изменений.
+    Сравнение с сохраненным предложением делается при пакетной выборке
+    товаров перед записью; точки выполненных операций копятся в памяти после
+    записи товаров и пишутся следующим insert_many. Точки, которые не удалось
+    записать, остаются в памяти до следующей записи.
+    Товары без артикула в историю не попадают.
+    '''
+
+    def __init__(self):
+        self._collection = None
+        self._points: List[dict] = []
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            self._collection = mongo_client.get_collection(settings.price_history_collection)
+        return self._collection
+
+    async def ensure_collection(self):
+        '''Создает коллекцию временных рядов (MongoDB 5.0+), если ее еще нет'''
+
+        name = settings.price_history_collection
+        database = mongo_client.database
+        try:
+            if name not in await database.list_collection_names():
+                options = {}
+                if settings.price_history_retention_days > 0:
+                    options["expireAfterSeconds"] = settings.price_history_retention_days * 86400
+                await database.create_collection(
+                    name,
+                    timeseries = {"timeField": TIME_FIELD, "metaField": META_FIELD, "granularity": "hours"},
+                    **options
+                )
+                logger.info(f"Создана коллекция истории цен: {name}")
+        except CollectionInvalid:
+            # Коллекцию одновременно создала другая реплика
+            pass
+        except Exception as e:
+            logger.warning(f"Не удалось создать коллекцию временных рядов {name}, точки пишутся в обычную: {e}")
+        await self.collection.create_index([(META_FIELD, ASCENDING), (TIME_FIELD, ASCENDING)], name = "article_ts")
+
+    def observe(self, article: str, saved_offer: Optional[dict], offer: Optional[dict]):
+        '''Записывает точку, если цена или наличие отличаются от сохраненного предложения'''
+
+        if not article or article == 'Нет данных':
+            return
+        point = offer_point(offer)
+        if point is None:
+            return
+        saved = offer_point(saved_offer)
+        if saved == point:
+            return
+
+        price, stock = point
+        self._points.append({TIME_FIELD: datetime.now(), META_FIELD: article, "price": price, "stock": stock})
+        PRICE_POINTS.inc(reason = 'new' if saved is None else 'changed')
+
+    async def flush(self):
+        '''Записывает накопленные точки одним insert_many'''
+
+        if not self._points:
+            return
+        points, self._points = self._points, []
+
+        try:
+            MONGO_BATCH_SIZE.observe(len(points), operation = 'price_history')
+            with MONGO_SECONDS.time(operation = 'price_history_write'):
+                await self.collection.insert_many(points, ordered = False)
+        except BulkWriteError as e:
+            # Вставленные точки не повторяем, иначе в истории появятся дубли
+            failed = {error.get("index") for error in (e.details or {}).get("writeErrors", [])}
+            self._points[:0] = [point for index, point in enumerate(points) if index in failed]
+            logger.error(f"Ошибка сохранения истории цен: не записано {len(failed)} из {len(points)} точек")
+        except Exception as e:
+            self._points[:0] = points
+            logger.error(f"Ошибка сохранения истории цен: {e}")
+
+    async def close(self):
+        '''Последняя попытка записи; оставшиеся точки учитываются как потерянные'''
+
+        await self.flush()
+        if self._points:
+            logger.error(f"Не записано точек истории цен: {len(self._points)}")
+            PRICE_POINTS.inc(len(self._points), reason = 'dropped')
+            self._points = []
+
+    async def series(
+        self,
+        article: str,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ) -> List[dict]:
+        '''Точки истории цены и наличия товара по возрастанию времени'''
+
+        query = {META_FIELD: article}
+        if since or until:
+            query[TIME_FIELD] = {}
+            if since:
+                query[TIME_FIELD]["$gte"] = since
+            if until:
+                query[TIME_FIELD]["$lte"] = until
+
+        cursor = self.collection.find(query, {"_id": 0}).sort(TIME_FIELD, ASCENDING)
+        return [point async for point in cursor]
+
+    async def top_changes(
+        self,
+        since: datetime,
+        until: Optional[datetime] = None,
+        limit: int = 20
+    ) -> List[dict]:
+        '''Товары с наибольшим относительным изменением цены за окно [since, until]
+
+        Точки пишутся только при изменении, поэтому цена на начало окна - это
+        последняя точка до since, а для товаров, появившихся в окне, - первая
+        точка окна. Для каждого товара возвращаются артикул, цены на начало и
+        конец окна, минимум и максимум в окне, изменение (в рублях и долях) и
+        число изменений в окне.
+        '''
+
+        until = until or datetime.now()
+        in_window = {"$gte": ["$" + TIME_FIELD, since]}
+        point = {"ts": "$" + TIME_FIELD, "price": "$price"}
+        pipeline = [
+            {"$match": {TIME_FIELD: {"$lte": until}, "price": {"$ne": None}}},
+            # $min и $max пропускают null, а документы {ts, price} сравниваются сначала по времени
+            {"$group": {
+                "_id": "$" + META_FIELD,
+                "before": {"$max": {"$cond": [in_window, None, point]}},
+                "first": {"$min": {"$cond": [in_window, point, None]}},
+                "last": {"$max": point},
+                "low": {"$min": {"$cond": [in_window, "$price", None]}},
+                "high": {"$max": {"$cond": [in_window, "$price", None]}},
+                "changes": {"$sum": {"$cond": [in_window, 1, 0]}}
+            }},
+            {"$match": {"changes": {"$gt": 0}}},
+            {"$project": {
+                "_id": 0,
+                "article": "$_id",
+                "start": {"$ifNull": ["$before.price", "$first.price"]},
+                "end": "$last.price",
+                "low": 1,
+                "high": 1,
+                "changes": 1
+            }},
+            {"$addFields": {"change": {"$subtract": ["$end", "$start"]}}},
+            {"$addFields": {"ratio": {"$cond": [
+                {"$gt": ["$start", 0]}, {"$divide": ["$change", "$start"]}, None
+            ]}}},
+            {"$addFields": {"magnitude": {"$abs": {"$ifNull": ["$ratio", 0]}}}},
+            {"$sort": {"magnitude": -1, "changes": -1}},
+            {"$limit": limit},
+            {"$project": {"magnitude": 0}}
+        ]
+
+        with MONGO_SECONDS.time(operation = 'price_history_top'):
+            cursor = await self.collection.aggregate(pipeline)
+            return [row async for row in cursor]
@@ -1,15 +1,96 @@
+import asyncio
+import hashlib
+import json
 import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set
+
+from pymongo import ASCENDING, IndexModel, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from src.core.metrics import metrics
 from src.core.settings import settings
-from src.repository.mongo_client import mongo_client
-from src.schemas.product import Product
+from src.repository.mongo_client import MONGO_BATCH_SIZE, MONGO_SECONDS, mongo_client
+from src.repository.price_history import PriceHistoryRepository, first_offer
+from src.repository.revisits import RevisitRepository
+from src.schemas.product import ListingOffer, PriceInfo, Product
 
 logger = logging.getLogger(__name__)
 
+# Поля, не влияющие на отпечаток содержимого товара
+FINGERPRINT_EXCLUDE = {"created_at"}
+
+PURCHASE_URL = "suppliers.supplier_offers.purchase_url"
+
+PRODUCTS_WRITTEN = metrics.counter('products_written_total', 'Итоги записи товаров', ('result',))
+
+
+def product_fingerprint(product: Product) -> str:
+    '''Стабильный хеш нормализованного товара без временных меток'''
+    
+    payload = json.dumps(
+        product.model_dump(exclude = FINGERPRINT_EXCLUDE),
+        ensure_ascii = False,
+        sort_keys = True,
+        separators = (',', ':')
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _product_key(product: Product) -> tuple:
+    '''Ключ товара, согласованный с критерием поиска'''
+    
+    if product.article != 'Нет данных':
+        return (product.article,)
+    
+    purchase_url = ""
+    if product.suppliers and product.suppliers[0].supplier_offers:
+        purchase_url = product.suppliers[0].supplier_offers[0].purchase_url
+    return ('Нет данных', product.title, purchase_url)
+
+
+def _document_key(document: dict) -> tuple:
+    '''Ключ сохраненного документа, согласованный с _product_key'''
+    
+    article = document.get("article", 'Нет данных')
+    if article != 'Нет данных':
+        return (article,)
+    
+    purchase_url = ""
+    suppliers = document.get("suppliers") or []
+    if suppliers and suppliers[0].get("supplier_offers"):
+        purchase_url = suppliers[0]["supplier_offers"][0].get("purchase_url", "")
+    return ('Нет данных', document.get("title"), purchase_url)
+
 
 class ProductRepository:
+    '''Репозиторий товаров с буферизованной пакетной записью
+
+    Товары копятся в буфере и записываются одним unordered bulk_write из
+    upsert-операций: при заполнении буфера, по таймеру и при закрытии.
+    Пакет, запись которого не удалась, остается в буфере до следующей попытки.
+    Товары, отпечаток содержимого которых совпадает с сохраненным, не
+    перезаписываются; created_at выставляется только при первой вставке.
+    Изменения цены и наличия записываются в историю цен (price_history)
+    после успешной записи товаров.
+    Обработчики on_saved товаров вызываются только после записи их пакета.
+    '''
     
-    def __init__(self):
+    def __init__(
+        self,
+        revisits: Optional[RevisitRepository] = None,
+        price_history: Optional[PriceHistoryRepository] = None
+    ):
         self._collection = None
+        self.revisits = revisits
+        self.price_history = price_history
+        self._buffer: List[Product] = []
+        self._on_saved: List[Callable[[], None]] = []
+        # После ошибки записи пакет повторяется только по таймеру, а не на каждый товар
+        self._write_failed = False
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self.stats = {"new": 0, "updated": 0, "unchanged": 0, "offers_updated": 0, "offers_unchanged": 0}
 
     @property
     def collection(self):
@@ -17,47 +98,361 @@ class ProductRepository:
             self._collection = mongo_client.get_collection(settings.collection_name)
         return self._collection
 
-    async def save_product(self, product: Product):
-        try:
-            product_dict = product.model_dump()
-
-            # Разная логика поиска для товаров с артикулом и без
-            if product.article != 'Нет данных':
-                # Товары с артикулом - ищем по артикулу
-                search_criterion = {"article": product.article}
-                log_id = product.article
-            else:
-                # Товары без артикула - ищем по названию + URL
-                purchase_url = ""
-                if product.suppliers and product.suppliers[0].supplier_offers:
-                    purchase_url = product.suppliers[0].supplier_offers[0].purchase_url
-                
-                search_criterion = {
-                    "title": product.title,
-                    "article": "Нет данных"
-                }
-                
-                # Добавляем URL в критерии если есть
-                if purchase_url:
-                    search_criterion["suppliers.supplier_offers.purchase_url"] = purchase_url
+    async def ensure_indexes(self):
+        '''Создает индексы под критерии поиска товаров'''
+        
+        await self.collection.create_indexes([
+            IndexModel([("article", ASCENDING)], name = "article"),
+            IndexModel(
+                [
+                    ("title", ASCENDING),
+                    ("article", ASCENDING),
+                    ("suppliers.supplier_offers.purchase_url", ASCENDING)
+                ],
+                name = "title_article_purchase_url"
+            ),
+            # Точечное обновление цен по ссылке из карточки каталога
+            IndexModel([(PURCHASE_URL, ASCENDING)], name = "purchase_url")
+        ])
+        logger.info("Индексы коллекции товаров проверены")
+        if self.price_history:
+            await self.price_history.ensure_collection()
+
+    def start(self):
+        '''Запускает периодическую запись буфера по таймеру'''
+        
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_periodically(), name = 'flush')
+
+    async def close(self) -> bool:
+        '''Останавливает таймер, записывает остаток буфера и выводит итоги записи
+
+        Возвращает False, если часть товаров так и не удалось записать.
+        '''
+        
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions = True)
+            self._flush_task = None
+        await self.flush()
+        if self._buffer:
+            logger.error(f"Не записано товаров при закрытии: {len(self._buffer)}")
+        if self.price_history:
+            await self.price_history.close()
+        
+        logger.info(
+            f"Итоги записи: новых {self.stats['new']}, обновлено {self.stats['updated']}, "
+            f"без изменений {self.stats['unchanged']}"
+        )
+        if self.stats["offers_updated"] or self.stats["offers_unchanged"]:
+            logger.info(
+                f"Цены по карточкам каталога: обновлено {self.stats['offers_updated']}, "
+                f"без изменений {self.stats['offers_unchanged']}"
+            )
+        return not self._buffer
+
+    async def save_product(self, product: Product, on_saved: Optional[Callable[[], None]] = None):
+        '''Добавляет товар в буфер записи; on_saved вызывается после записи пакета'''
+        
+        self._buffer.append(product)
+        if on_saved is not None:
+            self._on_saved.append(on_saved)
+        if len(self._buffer) >= settings.write_batch_size and not self._write_failed:
+            await self.flush()
+
+    async def flush(self) -> bool:
+        '''Записывает накопленные товары одним пакетом, пропуская неизмененные
+
+        Возвращает False, если запись не удалась и товары остались в буфере.
+        '''
+        
+        async with self._flush_lock:
+            if self._buffer:
+                products, self._buffer = self._buffer, []
+                callbacks, self._on_saved = self._on_saved, []
                 
-                log_id = f"'{product.title[:30]}...'"
+                try:
+                    await self._write_batch(products)
+                    self._write_failed = False
+                except Exception as e:
+                    if isinstance(e, BulkWriteError):
+                        details = e.details or {}
+                        logger.error(
+                            f"Ошибка пакетной записи: {len(details.get('writeErrors', []))} "
+                            f"из {len(products)} операций не выполнены"
+                        )
+                    else:
+                        logger.error(f"Ошибка сохранения: {e}")
+                    # Upsert повторяем, поэтому пакет целиком возвращается в буфер
+                    # и записывается со следующей попыткой
+                    self._buffer[:0] = products
+                    self._on_saved[:0] = callbacks
+                    self._write_failed = True
+                else:
+                    # Пакет уже записан: ошибка обработчика не должна возвращать его в буфер
+                    for callback in callbacks:
+                        try:
+                            callback()
+                        except Exception as e:
+                            logger.error(f"Ошибка обработчика после сохранения: {e}")
+            
+            # В режиме prices наблюдения копятся и без товаров в буфере
+            if self.revisits:
+                await self.revisits.flush()
+            if self.price_history:
+                await self.price_history.flush()
+            return not self._write_failed
+
+    async def _write_batch(self, products: List[Product]):
+        # Повторы одного товара внутри пакета схлопываем, побеждает последний
+        latest = {_product_key(product): product for product in products}
+        with MONGO_SECONDS.time(operation = 'products_lookup'):
+            saved = await self._load_saved(list(latest.values()))
+        
+        now = datetime.now().strftime("%d.%m.%Y %H:%M")
+        operations = []
+        # Точки истории цен и ссылки для статистики повторных загрузок по номеру
+        # операции: учитываются только после записи товара
+        observed: Dict[int, tuple] = {}
+        revisited: Dict[int, str] = {}
+        unchanged_urls = []
+        for key, product in latest.items():
+            fingerprint = product_fingerprint(product)
+            document = saved.get(key)
+            url = self._revisit_url(product)
+            if (document or {}).get("content_hash") == fingerprint:
+                if url:
+                    unchanged_urls.append(url)
+                continue
+            
+            product_dict = product.model_dump(exclude = {"created_at"})
+            if self.price_history:
+                observed[len(operations)] = (product.article, first_offer(document), first_offer(product_dict))
+            if url:
+                revisited[len(operations)] = url
+            product_dict["content_hash"] = fingerprint
+            product_dict["updated_at"] = now
+            operations.append(UpdateOne(
+                self._search_criterion(product),
+                {"$set": product_dict, "$setOnInsert": {"created_at": product.created_at}},
+                upsert = True
+            ))
+        
+        unchanged = len(latest) - len(operations)
+        if operations:
+            MONGO_BATCH_SIZE.observe(len(operations), operation = 'products')
+            result = await self._bulk_write(operations, observed, revisited, 'products_write')
+            self.stats["new"] += result.upserted_count
+            self.stats["updated"] += len(operations) - result.upserted_count
+            PRODUCTS_WRITTEN.inc(result.upserted_count, result = 'new')
+            PRODUCTS_WRITTEN.inc(len(operations) - result.upserted_count, result = 'updated')
+            logger.info(
+                f"Записано товаров: {len(operations)} (новых {result.upserted_count}), "
+                f"без изменений: {unchanged}"
+            )
+        else:
+            logger.info(f"Пакет без изменений: {unchanged} товаров")
+        
+        # При ошибке записи пакет вернется в буфер, и неизмененные товары будут учтены при повторе
+        self.stats["unchanged"] += unchanged
+        PRODUCTS_WRITTEN.inc(unchanged, result = 'unchanged')
+        if self.revisits:
+            for url in unchanged_urls:
+                self.revisits.observe(url, False)
 
-            # Проверяем существование
-            existing = await self.collection.find_one(search_criterion)
+    async def _bulk_write(
+        self,
+        operations: List[UpdateOne],
+        observed: Dict[int, tuple],
+        revisited: Dict[int, str],
+        operation: str
+    ):
+        '''Unordered bulk_write, после которого учитываются выполненные операции
 
-            if existing:
-                await self.collection.update_one(
-                    search_criterion,
-                    {"$set": product_dict}
-                )
-                logger.info(f"Обновлен: {log_id}")
-            else:
-                await self.collection.insert_one(product_dict)
-                logger.info(f"Сохранен: {log_id}")
+        В историю цен попадают точки observed, в статистику повторных загрузок -
+        изменения товаров revisited. При частичной ошибке операции из writeErrors
+        не учитываются: при повторе товар снова сравнится с сохраненным.
+        '''
+        
+        try:
+            with MONGO_SECONDS.time(operation = operation):
+                result = await self.collection.bulk_write(operations, ordered = False)
+        except BulkWriteError as e:
+            failed = {error.get("index") for error in (e.details or {}).get("writeErrors", [])}
+            self._record_written(observed, revisited, failed)
+            raise
+        self._record_written(observed, revisited)
+        return result
 
-        except Exception as e:
-            logger.error(f"Ошибка сохранения: {e}")
+    def _record_written(self, observed: Dict[int, tuple], revisited: Dict[int, str], failed: Set[int] = frozenset()):
+        if self.price_history:
+            for index, point in observed.items():
+                if index not in failed:
+                    self.price_history.observe(*point)
+        if self.revisits:
+            for index, url in revisited.items():
+                if index not in failed:
+                    self.revisits.observe(url, True)
+
+    def mark_unchanged(self, url: str):
+        '''Отмечает загрузку страницы товара, не изменившейся с прошлого обхода'''
+        
+        if self.revisits:
+            self.revisits.observe(url, False)
+
+    def _revisit_url(self, product: Product) -> Optional[str]:
+        '''Ссылка товара для статистики повторных загрузок'''
+        
+        if self.revisits and product.suppliers and product.suppliers[0].supplier_offers:
+            return product.suppliers[0].supplier_offers[0].purchase_url
+        return None
+
+    async def _load_saved(self, products: List[Product]) -> Dict[tuple, dict]:
+        '''Загружает сохраненные отпечатки (и цены для истории) товаров пакета одним запросом'''
+        
+        criteria = [self._search_criterion(product) for product in products]
+        projection = {
+            "_id": 0,
+            "article": 1,
+            "title": 1,
+            "content_hash": 1,
+            "suppliers.supplier_offers.purchase_url": 1
+        }
+        if self.price_history:
+            projection["suppliers.supplier_offers.price"] = 1
+            projection["suppliers.supplier_offers.stock"] = 1
+        
+        cursor = self.collection.find({"$or": criteria}, projection)
+        return {_document_key(document): document async for document in cursor}
+
+    async def load_offers_updated_at(self, products: List[Product]) -> List[Optional[datetime]]:
+        '''Время последнего обновления цен по карточкам каталога для товаров в порядке products'''
+        
+        if not products:
+            return []
+        
+        criteria = [self._search_criterion(product) for product in products]
+        projection = {
+            "_id": 0,
+            "article": 1,
+            "title": 1,
+            "offers_updated_at": 1,
+            "suppliers.supplier_offers.purchase_url": 1
+        }
+        with MONGO_SECONDS.time(operation = 'products_lookup'):
+            cursor = self.collection.find({"$or": criteria}, projection)
+            saved = {_document_key(document): document.get("offers_updated_at") async for document in cursor}
+        return [saved.get(_product_key(product)) for product in products]
+
+    async def update_offers(self, offers: List[ListingOffer]) -> List[str]:
+        '''Обновляет цену и наличие сохраненных товаров по карточкам каталога
+
+        Меняются только поля price и stock предложения с совпадающим
+        purchase_url (arrayFilters), остальной документ не перезаписывается;
+        отпечаток content_hash измененного товара сбрасывается, а время
+        обновления цен сохраняется в offers_updated_at.
+        Возвращает ссылки на товары, которых еще нет в коллекции.
+        '''
+        
+        if not offers:
+            return []
+        
+        urls = {offer.url for offer in offers}
+        saved = {}
+        with MONGO_SECONDS.time(operation = 'offers_lookup'):
+            cursor = self.collection.find(
+                {PURCHASE_URL: {"$in": list(urls)}},
+                {"_id": 0, "article": 1, "suppliers.supplier_offers": 1}
+            )
+            articles = {}
+            async for document in cursor:
+                for supplier in document.get("suppliers") or []:
+                    for offer in supplier.get("supplier_offers") or []:
+                        if offer.get("purchase_url") in urls:
+                            saved[offer["purchase_url"]] = offer
+                            articles[offer["purchase_url"]] = document.get("article")
+        
+        moment = datetime.now()
+        now = moment.strftime("%d.%m.%Y %H:%M")
+        operations = []
+        observed: Dict[int, tuple] = {}
+        revisited: Dict[int, str] = {}
+        unchanged = 0
+        for offer in offers:
+            current = saved.get(offer.url)
+            if current is None:
+                continue
+            
+            changes = {}
+            if offer.price is not None:
+                price = [PriceInfo(qnt = 1, discount = 0, price = offer.price).model_dump()]
+                if current.get("price") != price:
+                    changes["price"] = price
+            if offer.stock and current.get("stock") != offer.stock:
+                changes["stock"] = offer.stock
+            if not changes:
+                unchanged += 1
+                if self.revisits:
+                    self.revisits.observe(offer.url, False)
+                continue
+            if self.price_history:
+                observed[len(operations)] = (articles.get(offer.url), current, {**current, **changes})
+            if self.revisits:
+                revisited[len(operations)] = offer.url
+            
+            update = {
+                f"suppliers.$[].supplier_offers.$[offer].{name}": value
+                for name, value in changes.items()
+            }
+            update["updated_at"] = now
+            update["offers_updated_at"] = moment
+            operations.append(UpdateOne(
+                {PURCHASE_URL: offer.url},
+                # Отпечаток описывал прежнюю цену: без него следующий полный
+                # разбор запишет товар, даже если страница совпадет со старой
+                {"$set": update, "$unset": {"content_hash": ""}},
+                array_filters = [{"offer.purchase_url": offer.url}]
+            ))
+        
+        self.stats["offers_unchanged"] += unchanged
+        PRODUCTS_WRITTEN.inc(unchanged, result = 'offer_unchanged')
+        if operations:
+            MONGO_BATCH_SIZE.observe(len(operations), operation = 'offers')
+            try:
+                await self._bulk_write(operations, observed, revisited, 'offers_write')
+                self.stats["offers_updated"] += len(operations)
+                PRODUCTS_WRITTEN.inc(len(operations), result = 'offer_updated')
+            except Exception as e:
+                logger.error(f"Ошибка обновления цен: {e}")
+        
+        return [offer.url for offer in offers if offer.url not in saved]
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(settings.write_flush_interval)
+            await self.flush()
+
+    @staticmethod
+    def _search_criterion(product: Product) -> dict:
+        '''Критерий поиска товара в коллекции'''
+        
+        # Товары с артикулом - ищем по артикулу
+        if product.article != 'Нет данных':
+            return {"article": product.article}
+        
+        # Товары без артикула - ищем по названию + URL
+        search_criterion = {
+            "title": product.title,
+            "article": "Нет данных"
+        }
+        
+        # Добавляем URL в критерии если есть
+        if product.suppliers and product.suppliers[0].supplier_offers:
+            purchase_url = product.suppliers[0].supplier_offers[0].purchase_url
+            if purchase_url:
+                search_criterion["suppliers.supplier_offers.purchase_url"] = purchase_url
+        
+        return search_criterion
 
     async def get_products_count(self) -> int:
         """Возвращает общее количество товаров"""
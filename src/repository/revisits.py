@@ -0,0 +1,113 @@
+import logging
+import math
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from src.core.settings import settings
+from src.repository.mongo_client import MONGO_BATCH_SIZE, MONGO_SECONDS, mongo_client
+
+logger = logging.getLogger(__name__)
+
+
+SECONDS_PER_DAY = 86400
+
+
+def estimate_change_rate(intervals: int, changes: int, observed_seconds: float) -> Optional[float]:
+    '''Оценка частоты изменений (раз в сутки) по истории посещений
+
+    Оценка Чо и Гарсиа-Молины: r = -ln((n - X + 0.5) / (n + 0.5)) / I, где
+    n - число интервалов между загрузками, X - число интервалов, в которых
+    замечено изменение, I - средняя длина интервала. В отличие от X / (n * I)
+    она не занижает частоту, когда за интервал происходит несколько изменений.
+    '''
+
+    if intervals <= 0 or observed_seconds <= 0:
+        return None
+    mean_interval = observed_seconds / intervals / SECONDS_PER_DAY
+    return max(0.0, -math.log((intervals - changes + 0.5) / (intervals + 0.5)) / mean_interval)
+
+
+class RevisitRepository:
+    '''История загрузок страниц товаров для планирования повторных обходов
+
+    Для каждой ссылки хранит время первой и последней загрузки, последнего
+    изменения, число интервалов и изменений и оценку частоты изменений.
+    Наблюдения копятся в памяти и записываются пакетом вместе с товарами.
+    '''
+
+    def __init__(self):
+        self._collection = None
+        self._observations: Dict[str, Tuple[bool, datetime]] = {}
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            self._collection = mongo_client.get_collection(settings.revisit_collection)
+        return self._collection
+
+    def observe(self, url: str, changed: bool):
+        '''Запоминает загрузку страницы и то, изменился ли товар'''
+
+        previous = self._observations.get(url)
+        self._observations[url] = (changed or bool(previous and previous[0]), datetime.now())
+
+    async def load(self, urls: List[str]) -> Dict[str, dict]:
+        '''Загружает записи истории для ссылок одним запросом'''
+
+        if not urls:
+            return {}
+        cursor = self.collection.find({"_id": {"$in": urls}})
+        return {document["_id"]: document async for document in cursor}
+
+    async def flush(self):
+        '''Записывает накопленные наблюдения, пересчитывая оценки частоты изменений'''
+
+        if not self._observations:
+            return
+        observations, self._observations = self._observations, {}
+
+        try:
+            MONGO_BATCH_SIZE.observe(len(observations), operation = 'revisits')
+            with MONGO_SECONDS.time(operation = 'revisits_write'):
+                records = await self.load(list(observations))
+                operations = []
+                for url, (changed, fetched_at) in observations.items():
+                    operations.append(UpdateOne(
+                        {"_id": url},
+                        {"$set": self._updated_record(records.get(url), changed, fetched_at)},
+                        upsert = True
+                    ))
+                await self.collection.bulk_write(operations, ordered = False)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения истории загрузок: {e}")
+
+    @staticmethod
+    def _updated_record(record: Optional[dict], changed: bool, fetched_at: datetime) -> dict:
+        if record is None:
+            return {
+                "first_fetched": fetched_at,
+                "last_fetched": fetched_at,
+                "last_changed": fetched_at,
+                "intervals": 0,
+                "changes": 0,
+                "observed_seconds": 0.0,
+                "change_rate": None
+            }
+
+        intervals = record.get("intervals", 0) + 1
+        changes = record.get("changes", 0) + int(changed)
+        observed_seconds = record.get("observed_seconds", 0.0) + max(
+            0.0, (fetched_at - record["last_fetched"]).total_seconds()
+        )
+        update = {
+            "last_fetched": fetched_at,
+            "intervals": intervals,
+            "changes": changes,
+            "observed_seconds": observed_seconds,
+            "change_rate": estimate_change_rate(intervals, changes, observed_seconds)
+        }
+        if changed:
+            update["last_changed"] = fetched_at
+        return update
@@ -0,0 +1,290 @@
+import logging
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+
+from pymongo import ASCENDING, IndexModel, ReturnDocument, UpdateOne
+
+from src.core.metrics import metrics
+from src.core.settings import settings
+from src.repository.crawl_state import (
+    RUN_COMPLETED, RUN_ID, RUN_RUNNING, TASK_DONE, TASK_FAILED, TASK_PENDING
+)
+from src.repository.mongo_client import MONGO_BATCH_SIZE, MONGO_SECONDS, mongo_client
+
+logger = logging.getLogger(__name__)
+
+
+# Запуск, очередь которого наполняется начальными задачами
+RUN_SEEDING = 'seeding'
+
+# Задача, взятая репликой в работу
+TASK_LEASED = 'leased'
+
+WORK_QUEUE_TASKS = metrics.counter(
+    'work_queue_tasks_total', 'События задач общей очереди: claimed, released, requeued, expired', ('kind', 'event')
+)
+
+_RELEASE = {"$unset": {"owner": "", "lease_until": ""}}
+
+
+def worker_name() -> str:
+    '''Имя реплики в очереди: хост и случайный идентификатор процесса
+
+    Номер процесса не подходит: в контейнере main.py всегда PID 1, а при
+    network_mode: host у всех реплик одно имя хоста.
+    '''
+
+    return f"{socket.gethostname()}:{uuid.uuid4().hex}"
+
+
+class WorkQueueRepository:
+    '''Общая очередь задач обхода в MongoDB для нескольких реплик
+
+    Задачи category, page и product лежат в одной коллекции. Реплика берет
+    задачу атомарным find_one_and_update: статус leased, владелец и срок
+    аренды. Пока процесс жив, он продлевает аренду своих задач; задачи с
+    истекшей арендой (реплика упала или зависла) возвращаются в очередь,
+    а после work_queue_max_attempts попыток считаются неудачными.
+
+    Как и во фронтире, новые задачи и отметки о выполнении копятся в памяти
+    и записываются упорядоченным bulk_write: дочерние задачи попадают в базу
+    раньше, чем родительская отмечается выполненной, поэтому пустая очередь
+    означает, что обход действительно закончен.
+    '''
+
+    def __init__(self, worker: Optional[str] = None):
+        self.worker = worker or worker_name()
+        # Эта реплика наполняет очередь начальными задачами запуска
+        self.seeding = False
+        self._collection = None
+        self._pending: List[UpdateOne] = []
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            self._collection = mongo_client.get_collection(settings.work_queue_collection)
+        return self._collection
+
+    async def ensure_indexes(self):
+        await self.collection.create_indexes([
+            IndexModel([("kind", ASCENDING), ("status", ASCENDING)], name = "kind_status"),
+            IndexModel([("status", ASCENDING), ("lease_until", ASCENDING)], name = "status_lease"),
+            IndexModel([("owner", ASCENDING), ("status", ASCENDING)], name = "owner_status")
+        ])
+
+    @staticmethod
+    def _lease_until(now: datetime) -> datetime:
+        return now + timedelta(seconds = settings.work_queue_lease)
+
+    async def begin_run(self) -> bool:
+        '''Присоединяется к обходу; True - эта реплика наполняет очередь начальными задачами
+
+        Новый обход начинает первая реплика, заставшая предыдущий завершенным:
+        она очищает очередь и до end_seeding держит запуск в статусе seeding,
+        пока остальные реплики ждут задач. Если наполнявшая реплика упала и ее
+        аренда истекла, наполнение продолжает следующая запущенная реплика.
+        '''
+
+        now = datetime.now()
+        await self.collection.update_one(
+            {"_id": RUN_ID},
+            {"$setOnInsert": {"status": RUN_COMPLETED}},
+            upsert = True
+        )
+        run = await self.collection.find_one_and_update(
+            {
+                "_id": RUN_ID,
+                "$or": [
+                    {"status": RUN_COMPLETED},
+                    {"status": RUN_SEEDING, "lease_until": {"$lt": now}}
+                ]
+            },
+            {"$set": {"status": RUN_SEEDING, "owner": self.worker, "lease_until": self._lease_until(now)}},
+            return_document = ReturnDocument.BEFORE
+        )
+
+        if run is None:
+            logger.info(f"Реплика {self.worker} присоединилась к распределенному обходу")
+            return False
+
+        self.seeding = True
+        if run.get("status") == RUN_COMPLETED:
+            await self.collection.delete_many({"_id": {"$ne": RUN_ID}})
+            await self.collection.update_one(
+                {"_id": RUN_ID},
+                {"$set": {"started_at": now}, "$unset": {"finished_at": ""}}
+            )
+            logger.info(f"Реплика {self.worker} начала новый распределенный обход")
+        else:
+            logger.warning(f"Наполнение очереди продолжено после реплики {run.get('owner')}")
+        return True
+
+    def end_seeding(self):
+        '''Отмечает конец наполнения очереди; записывается после начальных задач'''
+
+        if not self.seeding:
+            return
+        self._pending.append(UpdateOne(
+            {"_id": RUN_ID, "status": RUN_SEEDING, "owner": self.worker},
+            {"$set": {"status": RUN_RUNNING}, **_RELEASE}
+        ))
+        self.seeding = False
+
+    async def finished(self) -> bool:
+        '''Проверяет, закончен ли обход всеми репликами; завершает запуск, если да
+
+        Обход закончен, когда очередь наполнена и в ней не осталось ни
+        ожидающих, ни взятых в работу задач.
+        '''
+
+        run = await self.collection.find_one({"_id": RUN_ID})
+        if run is None or run.get("status") == RUN_COMPLETED:
+            return True
+        if run.get("status") != RUN_RUNNING:
+            return False
+
+        remaining = await self.collection.find_one(
+            {"status": {"$in": [TASK_PENDING, TASK_LEASED]}}, {"_id": 1}
+        )
+        if remaining:
+            return False
+
+        now = datetime.now()
+        result = await self.collection.update_one(
+            {"_id": RUN_ID, "status": RUN_RUNNING},
+            {"$set": {
+                "status": RUN_COMPLETED,
+                "finished_at": now,
+                "last_completed_started_at": run.get("started_at")
+            }}
+        )
+        if result.modified_count:
+            logger.info(f"Распределенный обход завершен, начат {run.get('started_at')}")
+        return True
+
+    async def last_completed_at(self) -> Optional[datetime]:
+        '''Время начала последнего завершенного обхода (с часовым поясом) или None'''
+
+        run = await self.collection.find_one({"_id": RUN_ID}, {"last_completed_started_at": 1})
+        started_at = run.get("last_completed_started_at") if run else None
+        return started_at.astimezone() if started_at else None
+
+    async def claim(self, kind: str) -> Optional[dict]:
+        '''Берет в аренду одну ожидающую задачу указанного вида или возвращает None'''
+
+        now = datetime.now()
+        with MONGO_SECONDS.time(operation = 'work_queue_claim'):
+            task = await self.collection.find_one_and_update(
+                {"kind": kind, "status": TASK_PENDING},
+                {
+                    "$set": {"status": TASK_LEASED, "owner": self.worker, "lease_until": self._lease_until(now)},
+                    "$inc": {"attempts": 1}
+                },
+                return_document = ReturnDocument.AFTER
+            )
+        if task is not None:
+            WORK_QUEUE_TASKS.inc(kind = kind, event = 'claimed')
+        return task
+
+    async def heartbeat(self):
+        '''Продлевает аренду всех задач реплики (и наполнения очереди, если она его ведет)'''
+
+        await self.collection.update_many(
+            {"owner": self.worker, "status": {"$in": [TASK_LEASED, RUN_SEEDING]}},
+            {"$set": {"lease_until": self._lease_until(datetime.now())}}
+        )
+
+    async def requeue_expired(self):
+        '''Возвращает в очередь задачи с истекшей арендой, исчерпавшие попытки - в failed'''
+
+        expired = {"status": TASK_LEASED, "lease_until": {"$lt": datetime.now()}}
+        failed = await self.collection.update_many(
+            {**expired, "attempts": {"$gte": settings.work_queue_max_attempts}},
+            {"$set": {"status": TASK_FAILED}, **_RELEASE}
+        )
+        requeued = await self.collection.update_many(expired, {"$set": {"status": TASK_PENDING}, **_RELEASE})
+
+        if failed.modified_count or requeued.modified_count:
+            WORK_QUEUE_TASKS.inc(requeued.modified_count, kind = 'any', event = 'requeued')
+            WORK_QUEUE_TASKS.inc(failed.modified_count, kind = 'any', event = 'expired')
+            logger.warning(
+                f"Истекла аренда задач: возвращено в очередь {requeued.modified_count}, "
+                f"исчерпали попытки {failed.modified_count}"
+            )
+
+    async def release_owned(self):
+        '''Возвращает в очередь незавершенные задачи реплики при остановке
+
+        Попытка не засчитывается: задачу не выполнили из-за остановки, а не ошибки.
+        '''
+
+        result = await self.collection.update_many(
+            {"owner": self.worker, "status": TASK_LEASED},
+            {"$set": {"status": TASK_PENDING}, "$inc": {"attempts": -1}, **_RELEASE}
+        )
+        # Наполнение очереди сразу передается следующей запущенной реплике
+        await self.collection.update_one(
+            {"_id": RUN_ID, "status": RUN_SEEDING, "owner": self.worker},
+            {"$set": {"lease_until": datetime.now()}}
+        )
+        if result.modified_count:
+            logger.info(f"Возвращено в очередь задач реплики: {result.modified_count}")
+
+    def add(self, kind: str, urls: Iterable[str], **fields):
+        '''Добавляет задачи в очередь, не трогая уже известные за запуск
+
+        fields сохраняются в задаче и возвращаются вместе с ней при аренде.
+        '''
+
+        for url in urls:
+            self._pending.append(UpdateOne(
+                {"_id": f"{kind}:{url}"},
+                {"$setOnInsert": {"kind": kind, "url": url, "status": TASK_PENDING, "attempts": 0, **fields}},
+                upsert = True
+            ))
+
+    def mark(self, kind: str, url: str, status: str = TASK_DONE):
+        '''Отмечает задачу реплики выполненной или неудачной'''
+
+        self._pending.append(UpdateOne(
+            {"_id": f"{kind}:{url}", "owner": self.worker},
+            {"$set": {"status": status, "finished_at": datetime.now()}, **_RELEASE}
+        ))
+
+    def release(self, kind: str, url: str):
+        '''Возвращает задачу в очередь после ошибки обработчика, исчерпавшую попытки - в failed'''
+
+        task_id = f"{kind}:{url}"
+        self._pending.append(UpdateOne(
+            {"_id": task_id, "owner": self.worker, "attempts": {"$lt": settings.work_queue_max_attempts}},
+            {"$set": {"status": TASK_PENDING}, **_RELEASE}
+        ))
+        self._pending.append(UpdateOne(
+            {"_id": task_id, "owner": self.worker},
+            {"$set": {"status": TASK_FAILED}, **_RELEASE}
+        ))
+        WORK_QUEUE_TASKS.inc(kind = kind, event = 'released')
+
+    def take_pending(self) -> List[UpdateOne]:
+        '''Забирает накопленные изменения для записи'''
+
+        operations, self._pending = self._pending, []
+        return operations
+
+    def restore(self, operations: List[UpdateOne]):
+        '''Возвращает изменения, которые не удалось записать, до следующей записи'''
+
+        self._pending[:0] = operations
+
+    async def write(self, operations: List[UpdateOne]):
+        if operations:
+            MONGO_BATCH_SIZE.observe(len(operations), operation = 'work_queue')
+            try:
+                with MONGO_SECONDS.time(operation = 'work_queue_write'):
+                    await self.collection.bulk_write(operations, ordered = True)
+            except Exception:
+                # Изменения повторяемы, поэтому при ошибке записываются со следующей попыткой
+                self.restore(operations)
+                raise
@@ -26,6 +26,13 @@ class Supplier(BaseModel):
     supplier_offers: List[SupplierOffer] = Field(default_factory = list)
 
 
+class ListingOffer(BaseModel):
+    '''Цена и наличие товара из карточки на странице каталога'''
+    url: str
+    price: Optional[float] = None
+    stock: Optional[str] = None
+
+
 class Attribute(BaseModel):
     attr_name: str
     attr_value: str
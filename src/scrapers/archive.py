@@ -0,0 +1,207 @@
+import logging
+import os
+import sqlite3
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+from importlib.util import find_spec
+from typing import BinaryIO, Dict, Iterator, Optional
+
+from src.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CODEC_ZSTD = 'zstd'
+CODEC_ZLIB = 'zlib'
+
+INDEX_NAME = 'index.sqlite3'
+
+ARCHIVE_BYTES = metrics.counter(
+    'archive_bytes_total', 'Байт страниц в архиве: raw - исходных, stored - после сжатия', ('kind',)
+)
+
+
+def resolve_codec(name: str) -> str:
+    '''Проверяет выбранное сжатие; без пакета zstandard используется zlib'''
+
+    if name == CODEC_ZSTD and not find_spec('zstandard'):
+        logger.warning("Сжатие zstd недоступно (не установлен пакет zstandard), используется zlib")
+        return CODEC_ZLIB
+    if name not in (CODEC_ZSTD, CODEC_ZLIB):
+        logger.warning(f"Неизвестное сжатие архива '{name}', используется zlib")
+        return CODEC_ZLIB
+    return name
+
+
+def compress(data: bytes, codec: str, level: int) -> bytes:
+    if codec == CODEC_ZSTD:
+        import zstandard
+        return zstandard.ZstdCompressor(level = level).compress(data)
+    return zlib.compress(data, level)
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == CODEC_ZSTD:
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def segment_path(directory: str, segment: int) -> str:
+    return os.path.join(directory, f"segment-{segment:06d}.seg")
+
+
+@dataclass
+class ArchiveEntry:
+    '''Положение одной сохраненной страницы в сегментах архива'''
+
+    url: str
+    fetched_at: str
+    segment: int
+    offset: int
+    length: int
+    codec: str
+
+
+class HtmlArchive:
+    '''Архив загруженных страниц: сегменты только на дозапись и индекс в SQLite
+
+    Каждая страница сжимается отдельно (zstd или zlib) и дописывается в конец
+    текущего сегмента; при превышении segment_size начинается новый сегмент.
+    Индекс хранит ссылку, время загрузки, сегмент, смещение, длину и хеш тела,
+    поэтому любую версию страницы можно прочитать без распаковки соседних.
+    Страница с тем же хешем, что и последняя сохраненная версия, не дописывается.
+    Записи индекса фиксируются пачками по commit_every, остаток - при закрытии.
+    '''
+
+    def __init__(
+        self,
+        directory: str,
+        codec: str = CODEC_ZSTD,
+        level: int = 3,
+        segment_size: int = 256 * 1024 * 1024,
+        commit_every: int = 100
+    ):
+        self.directory = directory
+        self.codec = codec
+        self.level = level
+        self.segment_size = segment_size
+        self.commit_every = commit_every
+        self._connection: Optional[sqlite3.Connection] = None
+        self._segment = 0
+        self._file: Optional[BinaryIO] = None
+        self._pending = 0
+
+    def open(self):
+        if self._connection is not None:
+            return
+
+        os.makedirs(self.directory, exist_ok = True)
+        self.codec = resolve_codec(self.codec)
+
+        self._connection = sqlite3.connect(os.path.join(self.directory, INDEX_NAME), check_same_thread = False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS pages ('
+            'id INTEGER PRIMARY KEY, url TEXT NOT NULL, fetched_at TEXT NOT NULL, '
+            'segment INTEGER NOT NULL, offset INTEGER NOT NULL, length INTEGER NOT NULL, '
+            'size INTEGER NOT NULL, codec TEXT NOT NULL, digest TEXT)'
+        )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS pages_url ON pages (url, id)')
+        self._connection.commit()
+
+        # Продолжаем последний сегмент: байты без записи в индексе просто не читаются
+        row = self._connection.execute('SELECT MAX(segment) FROM pages').fetchone()
+        self._segment = row[0] or 1
+        self._file = open(segment_path(self.directory, self._segment), 'ab')
+        logger.info(f"Архив страниц открыт: {self.directory} (сжатие {self.codec})")
+
+    def close(self):
+        if self._connection is None:
+            return
+
+        self._file.close()
+        self._file = None
+        self._connection.commit()
+        self._connection.close()
+        self._connection = None
+
+    def put(self, url: str, html: str, digest: Optional[str] = None) -> bool:
+        '''Дописывает страницу в архив; False, если такая версия уже сохранена'''
+
+        if digest:
+            row = self._connection.execute(
+                'SELECT digest FROM pages WHERE url = ? ORDER BY id DESC LIMIT 1', (url,)
+            ).fetchone()
+            if row and row[0] == digest:
+                return False
+
+        raw = html.encode('utf-8')
+        data = compress(raw, self.codec, self.level)
+
+        offset = self._file.tell()
+        if offset and offset + len(data) > self.segment_size:
+            self._file.close()
+            self._segment += 1
+            self._file = open(segment_path(self.directory, self._segment), 'ab')
+            offset = self._file.tell()
+
+        self._file.write(data)
+        # Байты сегмента должны попасть на диск раньше, чем запись индекса
+        self._file.flush()
+        self._connection.execute(
+            'INSERT INTO pages (url, fetched_at, segment, offset, length, size, codec, digest) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (url, datetime.now().isoformat(timespec = 'seconds'), self._segment, offset,
+             len(data), len(raw), self.codec, digest)
+        )
+        ARCHIVE_BYTES.inc(len(raw), kind = 'raw')
+        ARCHIVE_BYTES.inc(len(data), kind = 'stored')
+
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self._connection.commit()
+            self._pending = 0
+        return True
+
+    def latest(self, since: Optional[datetime] = None, limit: int = 0) -> Iterator[ArchiveEntry]:
+        '''Последние версии страниц по каждой ссылке в порядке расположения в сегментах'''
+
+        query = (
+            'SELECT url, fetched_at, segment, offset, length, codec FROM pages '
+            'WHERE id IN (SELECT MAX(id) FROM pages GROUP BY url)'
+        )
+        parameters = []
+        if since:
+            query += ' AND fetched_at >= ?'
+            parameters.append(since.isoformat(timespec = 'seconds'))
+        query += ' ORDER BY segment, offset'
+        if limit:
+            query += ' LIMIT ?'
+            parameters.append(limit)
+
+        for row in self._connection.execute(query, parameters):
+            yield ArchiveEntry(*row)
+
+    def count(self) -> int:
+        return self._connection.execute('SELECT COUNT(DISTINCT url) FROM pages').fetchone()[0]
+
+
+class ArchiveReader:
+    '''Чтение страниц архива по записям индекса; файлы сегментов остаются открытыми'''
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._files: Dict[int, BinaryIO] = {}
+
+    def read(self, entry: ArchiveEntry) -> str:
+        file = self._files.get(entry.segment)
+        if file is None:
+            file = self._files[entry.segment] = open(segment_path(self.directory, entry.segment), 'rb')
+        file.seek(entry.offset)
+        return decompress(file.read(entry.length), entry.codec).decode('utf-8')
+
+    def close(self):
+        for file in self._files.values():
+            file.close()
+        self._files.clear()
@@ -0,0 +1,75 @@
+import logging
+import os
+import sqlite3
+from dataclasses import dataclass
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheEntry:
+    '''Валидаторы и отпечаток тела последнего успешного ответа'''
+
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    digest: Optional[str] = None
+
+
+class HttpCache:
+    '''Постоянный кеш валидаторов HTTP (ETag / Last-Modified) в SQLite
+
+    Хранит только заголовки-валидаторы и хеш тела, сами страницы не сохраняются.
+    Записи фиксируются пачками по commit_every, остаток - при закрытии.
+    '''
+
+    def __init__(self, path: str, commit_every: int = 100):
+        self.path = path
+        self.commit_every = commit_every
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pending = 0
+
+    def open(self):
+        if self._connection is not None:
+            return
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+
+        self._connection = sqlite3.connect(self.path, check_same_thread = False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS http_cache ('
+            'url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, digest TEXT, '
+            'updated_at TEXT DEFAULT CURRENT_TIMESTAMP)'
+        )
+        self._connection.commit()
+        logger.debug(f"HTTP-кеш открыт: {self.path}")
+
+    def close(self):
+        if self._connection is None:
+            return
+
+        self._connection.commit()
+        self._connection.close()
+        self._connection = None
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        row = self._connection.execute(
+            'SELECT etag, last_modified, digest FROM http_cache WHERE url = ?', (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        return CacheEntry(*row)
+
+    def put(self, url: str, entry: CacheEntry):
+        self._connection.execute(
+            'INSERT OR REPLACE INTO http_cache (url, etag, last_modified, digest, updated_at) '
+            'VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)',
+            (url, entry.etag, entry.last_modified, entry.digest)
+        )
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self._connection.commit()
+            self._pending = 0
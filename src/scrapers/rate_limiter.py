@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Optional
+
+from src.core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    '''Переводит заголовок Retry-After (секунды или HTTP-дата) в секунды ожидания'''
+
+    if not value:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo = timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class AdaptiveRateLimiter:
+    '''Token bucket для одного хоста со скоростью, подстраиваемой по схеме AIMD
+
+    Пока ответы быстрые и успешные, скорость растет аддитивно (примерно
+    на rate_limit_increase запросов/с за каждую секунду нормальной работы).
+    На 429, 5xx, таймаутах и росте p95 задержки скорость умножается на
+    rate_limit_decrease_factor, но не чаще раза в rate_limit_cooldown секунд,
+    чтобы пачка ответов на уже отправленные запросы не обрушила ее до минимума.
+    '''
+
+    def __init__(self, host: str):
+        self.host = host
+        self.rate = settings.rate_limit_initial
+
+        self._tokens = settings.rate_limit_burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._lock = asyncio.Lock()
+
+        self._latencies = deque(maxlen = settings.rate_limit_latency_window)
+        self._samples_since_check = 0
+        self._baseline_p95: Optional[float] = None
+
+    async def acquire(self):
+        '''Ждет свободный токен; ожидающие обслуживаются по очереди'''
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def on_response(self, status_code: int, latency: float, retry_after: Optional[str] = None):
+        '''Учитывает ответ сервера'''
+
+        delay = parse_retry_after(retry_after)
+        if delay:
+            self._block(delay)
+
+        if status_code == 429 or status_code >= 500:
+            self._decrease(f"HTTP {status_code}")
+            return
+
+        if self._latency_rising(latency):
+            self._decrease(f"рост p95 задержки до {self._p95():.2f}с")
+            return
+
+        if 200 <= status_code < 300:
+            self._increase()
+
+    def on_timeout(self):
+        '''Учитывает таймаут запроса'''
+
+        self._decrease("таймаут")
+
+    def _refill(self, now: float):
+        self._tokens = min(
+            settings.rate_limit_burst,
+            self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def _block(self, delay: float):
+        blocked_until = time.monotonic() + delay
+        if blocked_until > self._blocked_until:
+            self._blocked_until = blocked_until
+            logger.warning(f"{self.host}: пауза {delay:.1f}с по Retry-After")
+
+    def _increase(self):
+        self.rate = min(settings.rate_limit_max, self.rate + settings.rate_limit_increase / self.rate)
+
+    def _decrease(self, reason: str):
+        now = time.monotonic()
+        if now - self._last_decrease < settings.rate_limit_cooldown:
+            return
+
+        self._last_decrease = now
+        self.rate = max(settings.rate_limit_min, self.rate * settings.rate_limit_decrease_factor)
+        logger.warning(f"{self.host}: скорость снижена до {self.rate:.2f} запр/с ({reason})")
+
+    def _p95(self) -> float:
+        ordered = sorted(self._latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def _latency_rising(self, latency: float) -> bool:
+        '''Проверяет раз в окно, не вырос ли p95 задержки относительно базового уровня'''
+
+        self._latencies.append(latency)
+        self._samples_since_check += 1
+
+        if len(self._latencies) < self._latencies.maxlen:
+            return False
+        if self._samples_since_check < self._latencies.maxlen:
+            return False
+        self._samples_since_check = 0
+
+        p95 = self._p95()
+        if self._baseline_p95 is None:
+            self._baseline_p95 = p95
+            return False
+
+        rising = p95 > self._baseline_p95 * settings.rate_limit_latency_factor
+        # База медленно подтягивается к текущему p95, чтобы стабильно
+        # медленный сайт не удерживал скорость на минимуме
+        self._baseline_p95 = min(p95, 0.9 * self._baseline_p95 + 0.1 * p95)
+        return rising
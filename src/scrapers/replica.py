@@ -0,0 +1,33 @@
+import fcntl
+import logging
+import os
+from typing import TextIO, Tuple
+
+logger = logging.getLogger(__name__)
+
+REPLICA_PREFIX = 'replica-'
+LOCK_NAME = '.lock'
+
+
+def claim_replica_directory(root: str) -> Tuple[str, TextIO]:
+    '''Занимает первый свободный подкаталог root/replica-N
+
+    Подкаталог блокируется flock до закрытия возвращенного файла блокировки,
+    поэтому реплики с общим томом не пишут в одни и те же файлы SQLite и
+    сегменты, а перезапущенная реплика получает освободившийся каталог вместе
+    с его кешем и архивом.
+    '''
+
+    slot = 1
+    while True:
+        directory = os.path.join(root, f"{REPLICA_PREFIX}{slot}")
+        os.makedirs(directory, exist_ok = True)
+        lock = open(os.path.join(directory, LOCK_NAME), 'a')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            slot += 1
+            continue
+        logger.debug(f"Каталог реплики: {directory}")
+        return directory, lock
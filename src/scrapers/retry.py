@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Optional
+
+import httpx
+
+from src.core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+# Классы ошибок, после которых запрос имеет смысл повторить
+CONNECT_ERROR = 'connect'
+READ_TIMEOUT = 'timeout'
+SERVER_ERROR = 'server'
+THROTTLED = 'throttled'
+
+
+def classify_exception(error: Exception) -> Optional[str]:
+    '''Определяет класс ошибки транспорта; None - повторять бессмысленно'''
+
+    if isinstance(error, httpx.TimeoutException):
+        return READ_TIMEOUT
+    if isinstance(error, httpx.TransportError):
+        return CONNECT_ERROR
+    return None
+
+
+def classify_status(status_code: int) -> Optional[str]:
+    '''Определяет класс ответа сервера; None - ответ окончательный'''
+
+    if status_code == 429:
+        return THROTTLED
+    if status_code >= 500:
+        return SERVER_ERROR
+    return None
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    '''Экспоненциальная задержка с полным джиттером, ограниченная сверху
+
+    Если сервер прислал Retry-After, ждем не меньше указанного.
+    '''
+
+    cap = min(settings.retry_backoff_max, settings.retry_backoff_base * 2 ** attempt)
+    delay = random.uniform(0, cap)
+    if retry_after:
+        delay = max(delay, retry_after)
+    return delay
+
+
+class RetryBudget:
+    '''Общий на запуск лимит повторных запросов'''
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.spent = 0
+
+    def try_spend(self) -> bool:
+        '''Списывает один повтор; False - бюджет исчерпан'''
+
+        if self.spent >= self.limit:
+            return False
+        self.spent += 1
+        if self.spent == self.limit:
+            logger.warning(f"Бюджет повторных запросов исчерпан ({self.limit})")
+        return True
+
+
+class CircuitBreaker:
+    '''Предохранитель для одного хоста
+
+    После breaker_failure_threshold ошибок подряд размыкается и приостанавливает
+    все запросы к хосту на breaker_cooldown секунд. Затем пропускает один
+    пробный запрос: успех замыкает цепь, ошибка снова размыкает ее.
+    '''
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, host: str):
+        self.host = host
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_until = 0.0
+        self._probe_in_flight = False
+
+    async def wait_ready(self) -> bool:
+        '''Ждет, пока к хосту снова можно обращаться. Возвращает True, если вызвавшему достался пробный запрос'''
+
+        while True:
+            if self.state == self.CLOSED:
+                return False
+
+            now = time.monotonic()
+            if self.state == self.OPEN:
+                if now < self._opened_until:
+                    await asyncio.sleep(self._opened_until - now)
+                    continue
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+
+            if not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            await asyncio.sleep(1.0)
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info(f"{self.host}: связь восстановлена, обход продолжается")
+        self.state = self.CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def release_probe(self):
+        '''Запрос завершился ошибкой, не говорящей о состоянии хоста: пробный запрос можно повторить'''
+
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self._failures += 1
+        self._probe_in_flight = False
+
+        if self.state == self.HALF_OPEN or self._failures >= settings.breaker_failure_threshold:
+            if self.state != self.OPEN:
+                logger.error(
+                    f"{self.host}: {self._failures} ошибок подряд, "
+                    f"запросы приостановлены на {settings.breaker_cooldown:.0f}с"
+                )
+            self.state = self.OPEN
+            self._opened_until = time.monotonic() + settings.breaker_cooldown
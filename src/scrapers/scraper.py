@@ -1,18 +1,301 @@
-from typing import Optional
+from dataclasses import dataclass
+from importlib.util import find_spec
+from typing import Dict, List, Optional, TextIO
+from urllib.parse import urlsplit
 
+import asyncio
+import hashlib
 import httpx
 import logging
+import os
+import time
+
+from src.core.metrics import metrics
+from src.core.settings import settings
+from src.scrapers.archive import HtmlArchive
+from src.scrapers.http_cache import CacheEntry, HttpCache
+from src.scrapers.rate_limiter import AdaptiveRateLimiter, parse_retry_after
+from src.scrapers.replica import claim_replica_directory
+from src.scrapers.retry import (
+    READ_TIMEOUT, SERVER_ERROR, CircuitBreaker, RetryBudget,
+    backoff_delay, classify_exception, classify_status
+)
 
 logger = logging.getLogger(__name__)
 
+HTTP_REQUESTS = metrics.counter(
+    'http_requests_total', 'HTTP-запросы по хостам и статусам ответа (или типу ошибки)', ('host', 'status')
+)
+HTTP_LATENCY = metrics.histogram('http_request_seconds', 'Длительность HTTP-запроса', ('host',))
+HTTP_BYTES = metrics.counter('http_response_bytes_total', 'Получено байт тела ответа', ('host',))
+HTTP_RETRIES = metrics.counter('http_retries_total', 'Повторные HTTP-запросы', ('host',))
+RATE_LIMIT = metrics.gauge('rate_limit_rps', 'Разрешенная скорость запросов к хосту', ('host',))
+
+
+def _accept_encoding() -> str:
+    '''Формирует Accept-Encoding из доступных в окружении декомпрессоров'''
+    
+    encodings = ['gzip', 'deflate']
+    if find_spec('brotli') or find_spec('brotlicffi'):
+        encodings.append('br')
+    return ', '.join(encodings)
+
+
+@dataclass
+class PageResult:
+    '''Результат условной загрузки страницы'''
+
+    url: str
+    html: Optional[str]
+    unchanged: bool = False
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    digest: Optional[str] = None
+
 
 class PageScraper:
+    '''Загрузчик страниц с общим пулом keep-alive соединений'''
+    
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._limiters: Dict[str, AdaptiveRateLimiter] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.retry_budget = RetryBudget(settings.retry_budget)
+        self.cache: Optional[HttpCache] = None
+        self.archive: Optional[HtmlArchive] = None
+        self._replica_locks: List[TextIO] = []
+
+    async def open(self):
+        '''Создает HTTP-клиент, если он еще не создан'''
+        
+        if self._client is not None:
+            return
+        
+        # Бюджет повторов считается на один запуск
+        self.retry_budget = RetryBudget(settings.retry_budget)
+        
+        if settings.http_cache_enabled:
+            cache_path = settings.http_cache_path
+            if settings.work_queue_enabled:
+                directory = self._replica_directory(os.path.dirname(cache_path))
+                cache_path = os.path.join(directory, os.path.basename(cache_path))
+            self.cache = HttpCache(cache_path)
+            self.cache.open()
+        
+        if settings.archive_enabled:
+            archive_path = settings.archive_path
+            if settings.work_queue_enabled:
+                archive_path = self._replica_directory(archive_path)
+            self.archive = HtmlArchive(
+                archive_path,
+                codec = settings.archive_compression,
+                level = settings.archive_compression_level,
+                segment_size = settings.archive_segment_size
+            )
+            self.archive.open()
+        
+        http2 = settings.http_http2
+        if http2 and not find_spec('h2'):
+            logger.warning("HTTP/2 недоступен (не установлен пакет h2), используется HTTP/1.1")
+            http2 = False
+        
+        limits = httpx.Limits(
+            max_connections = settings.http_max_connections,
+            max_keepalive_connections = settings.http_max_keepalive_connections,
+            keepalive_expiry = settings.http_keepalive_expiry
+        )
+        self._client = httpx.AsyncClient(
+            follow_redirects = True,
+            timeout = settings.http_timeout,
+            limits = limits,
+            http2 = http2,
+            headers = {'Accept-Encoding': _accept_encoding()}
+        )
+        logger.debug(f"HTTP-клиент создан (http2={http2}, соединений={settings.http_max_connections})")
+
+    async def close(self):
+        '''Закрывает HTTP-клиент и все соединения пула'''
+        
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+        for lock in self._replica_locks:
+            lock.close()
+        self._replica_locks.clear()
+
+    def _replica_directory(self, root: str) -> str:
+        '''Отдельный каталог реплики: с общей очередью задач реплики делят тома cache и archive'''
+        
+        directory, lock = claim_replica_directory(root)
+        self._replica_locks.append(lock)
+        return directory
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+    
+    def current_rates(self) -> Dict[str, float]:
+        '''Текущая разрешенная скорость запросов (запросов/с) по хостам'''
+        
+        return {host: limiter.rate for host, limiter in self._limiters.items()}
+    
+    def _limiter(self, url: str) -> AdaptiveRateLimiter:
+        host = urlsplit(url).netloc
+        limiter = self._limiters.get(host)
+        if limiter is None:
+            limiter = self._limiters[host] = AdaptiveRateLimiter(host)
+            RATE_LIMIT.track(lambda: limiter.rate, host = host)
+        return limiter
+    
+    def _breaker(self, url: str) -> CircuitBreaker:
+        host = urlsplit(url).netloc
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(host)
+        return breaker
     
     async def scrape_page(self, url: str) -> Optional[str]:
-        async with httpx.AsyncClient(follow_redirects = True, timeout = 30) as Client:
+        '''Загружает страницу, повторяя запрос при временных ошибках
+
+        Возвращает None, если страница недоступна (4xx) или попытки исчерпаны.
+        '''
+        
+        response = await self._request(url)
+        if response is None:
+            return None
+        return response.text
+    
+    async def scrape_bytes(self, url: str) -> Optional[bytes]:
+        '''Загружает ресурс как байты (например, sitemap, в том числе .xml.gz)'''
+        
+        response = await self._request(url)
+        if response is None:
+            return None
+        return response.content
+    
+    async def fetch_page(self, url: str) -> Optional[PageResult]:
+        '''Загружает страницу условным запросом по сохраненным валидаторам
+
+        Страница считается неизмененной при ответе 304 или совпадении хеша тела
+        с сохраненным. Валидаторы сохраняются только через remember(), после
+        записи разобранного товара в базу. Новая версия страницы сразу пишется в
+        архив, если он включен.
+        '''
+        
+        cached = self.cache.get(url) if self.cache else None
+        
+        headers = {}
+        if cached and cached.etag:
+            headers['If-None-Match'] = cached.etag
+        if cached and cached.last_modified:
+            headers['If-Modified-Since'] = cached.last_modified
+        
+        response = await self._request(url, headers)
+        if response is None:
+            return None
+        
+        if response.status_code == 304:
+            return PageResult(url = url, html = None, unchanged = True)
+        
+        digest = hashlib.sha256(response.content).hexdigest()
+        unchanged = bool(cached and cached.digest == digest)
+        html = response.text
+        # Страница архивируется до разбора: и та, что не удалось разобрать, пригодится для reparse
+        if self.archive and not unchanged:
+            self.archive.put(url, html, digest)
+        return PageResult(
+            url = url,
+            html = html,
+            unchanged = unchanged,
+            etag = response.headers.get('ETag'),
+            last_modified = response.headers.get('Last-Modified'),
+            digest = digest
+        )
+    
+    def remember(self, result: PageResult):
+        '''Сохраняет валидаторы обработанной страницы для следующих запусков'''
+        
+        if self.cache and not result.unchanged:
+            self.cache.put(
+                result.url,
+                CacheEntry(etag = result.etag, last_modified = result.last_modified, digest = result.digest)
+            )
+    
+    async def _request(self, url: str, headers: Optional[Dict[str, str]] = None) -> Optional[httpx.Response]:
+        '''GET с ограничением частоты, повторами и предохранителем'''
+        
+        if self._client is None:
+            await self.open()
+        
+        limiter = self._limiter(url)
+        breaker = self._breaker(url)
+        host = limiter.host
+        
+        for attempt in range(settings.retry_max_attempts):
+            probe = await breaker.wait_ready()
             try:
-                response = await Client.get(url)
-                return response.text
-            except Exception as e:
-                logger.error(f"Ошибка при получении html: {e}")
-                return None
\ No newline at end of file
+                await limiter.acquire()
+                
+                retry_after = None
+                started = time.monotonic()
+                try:
+                    response = await self._client.get(url, headers = headers)
+                except Exception as e:
+                    HTTP_LATENCY.observe(time.monotonic() - started, host = host)
+                    HTTP_REQUESTS.inc(host = host, status = type(e).__name__)
+                    reason = classify_exception(e)
+                    if reason is None:
+                        # Ошибка запроса, а не хоста: предохранитель ее не учитывает
+                        logger.error(f"Ошибка при получении html {url}: {e}")
+                        return None
+                    breaker.record_failure()
+                    if reason == READ_TIMEOUT:
+                        limiter.on_timeout()
+                    error = f"{type(e).__name__}: {e}"
+                else:
+                    latency = time.monotonic() - started
+                    HTTP_LATENCY.observe(latency, host = host)
+                    HTTP_REQUESTS.inc(host = host, status = response.status_code)
+                    HTTP_BYTES.inc(len(response.content), host = host)
+                    limiter.on_response(response.status_code, latency, response.headers.get('Retry-After'))
+                    reason = classify_status(response.status_code)
+                    if reason is None:
+                        # Окончательный ответ, в том числе 404, означает, что хост доступен
+                        breaker.record_success()
+                        if response.is_success or response.status_code == 304:
+                            return response
+                        logger.warning(f"Страница недоступна ({response.status_code}): {url}")
+                        return None
+                    
+                    # 429 - это ограничение частоты, а не отказ хоста
+                    if reason == SERVER_ERROR:
+                        breaker.record_failure()
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    error = f"HTTP {response.status_code}"
+            finally:
+                # Пробный запрос, не давший ответа о состоянии хоста (429, отмена, ошибка запроса),
+                # освобождается, иначе остальные запросы к хосту ждали бы его вечно
+                if probe:
+                    breaker.release_probe()
+            
+            if attempt + 1 >= settings.retry_max_attempts:
+                break
+            if not self.retry_budget.try_spend():
+                break
+            
+            delay = backoff_delay(attempt, retry_after)
+            HTTP_RETRIES.inc(host = host)
+            logger.warning(f"{error} для {url}, повтор {attempt + 1} через {delay:.1f}с")
+            await asyncio.sleep(delay)
+        
+        logger.error(f"Не удалось получить html после повторов ({error}): {url}")
+        return None
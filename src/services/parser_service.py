@@ -1,11 +1,29 @@
 import asyncio
+import json
 import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import AsyncIterator, AsyncIterable, List, Optional
+
+from src.core.metrics import MetricsServer, metrics
+from src.core.settings import settings
 
 from src.parsers.start_page import StartPageParser
 from src.parsers.category import CategoryPageParser
 from src.parsers.product_page import ProductPropertyParser
+from src.parsers.sitemap import SitemapParser
+from src.repository.crawl_state import RUN_COMPLETED, RUN_INTERRUPTED, CrawlStateRepository
 from src.repository.mongo_client import mongo_client
+from src.repository.price_history import PriceHistoryRepository
 from src.repository.repository import ProductRepository
+from src.repository.revisits import RevisitRepository
+from src.repository.work_queue import WorkQueueRepository
+from src.scrapers.scraper import PageScraper
+from src.services.pipeline import CrawlPipeline
+from src.services.scheduler import RevisitScheduler
+from src.services.seen_set import SeenSet, make_seen_set, normalize_url
 
 logger = logging.getLogger(__name__)
 
@@ -15,44 +33,128 @@ class ParserService:
 
     def __init__(self):
         
-        self.start_parser = StartPageParser()
-        self.category_parser = CategoryPageParser()
-        self.product_parser = ProductPropertyParser()
-        self.repository = ProductRepository()
-
-        # Задержки между запросами
-        self.delay_between_requests = 0.5
-        self.delay_between_categories = 2.0
+        # Один HTTP-клиент с пулом соединений на все парсеры
+        self.scraper = PageScraper()
+        self.start_parser = StartPageParser(self.scraper)
+        self.category_parser = CategoryPageParser(self.scraper)
+        self.product_parser = ProductPropertyParser(self.scraper)
+        self.sitemap_parser = SitemapParser(self.scraper)
+        self.revisits = RevisitRepository() if settings.revisit_enabled else None
+        self.price_history = PriceHistoryRepository() if settings.price_history_enabled else None
+        self.repository = ProductRepository(self.revisits, self.price_history)
+        self.crawl_state = CrawlStateRepository()
+        self.work_queue = WorkQueueRepository()
 
     async def start_parsing(self, base_url: str = "https://optostroy.com/"):
-        """Запускает полный парсинг сайта"""
+        """Запускает полный парсинг сайта, продолжая прерванный обход при наличии"""
        
+        run_status = RUN_INTERRUPTED
+        checkpoints = None
+        maintenance = None
+        started_at = datetime.now()
+        started = time.monotonic()
+        metrics.reset()
+        metrics_server = None
         try:
             logger.info("Запуск парсинга ОптоСтрой")
 
-            # Подключаемся к MongoDB
+            if settings.metrics_enabled and settings.metrics_port:
+                metrics_server = MetricsServer(metrics, settings.metrics_host, settings.metrics_port)
+                await metrics_server.start()
+
+            # Подключаемся к MongoDB и открываем HTTP-клиент
             await mongo_client.connect()
+            await self.repository.ensure_indexes()
+            self.repository.start()
+            await self.scraper.open()
+
+            if settings.work_queue_enabled:
+                # Распределенный обход: задачи берутся из общей очереди в MongoDB
+                maintenance = asyncio.create_task(self._maintain_work_queue(), name = 'work_queue')
+                await self._process_work_queue(base_url)
+            else:
+                # Ограниченный запуск не трогает фронтир: иначе следующий обход счел бы
+                # непройденные категории выполненными или продолжил бы пробный запуск
+                resume = settings.resume_enabled and not settings.product_limit
+                if settings.product_limit:
+                    logger.info(f"Ограниченный запуск: не больше {settings.product_limit} страниц товаров")
+
+                resumed = False
+                if resume:
+                    await self.crawl_state.ensure_indexes()
+                    resumed = await self.crawl_state.begin_run()
+                    checkpoints = asyncio.create_task(self._checkpoint_periodically(), name = 'checkpoint')
 
-            # Получаем список категорий
-            logger.info("Получение списка категорий")
-            categories = await self.start_parser.get_categories(base_url)
-            logger.info(f"Найдено категорий: {len(categories)}")
+                crawl_state = self.crawl_state if resume else None
+                seen = make_seen_set()
+                scheduler = None
+                if self.revisits and settings.revisit_budget > 0:
+                    scheduler = RevisitScheduler(self.revisits, settings.revisit_budget)
+                categories, pages, products, sitemaps = [], [], [], []
+                if resumed:
+                    # Товары, уже известные прерванному обходу, повторно не ставятся в очередь
+                    async for product_url in self.crawl_state.iter_urls('product'):
+                        seen.add(normalize_url(product_url))
+                    categories = await self.crawl_state.load_pending('category')
+                    pages = await self.crawl_state.load_pending('page')
+                    products = await self.crawl_state.load_pending('product')
+                    sitemaps = await self.crawl_state.load_pending('sitemap')
+                    logger.info(
+                        f"Осталось из прерванного обхода: категорий {len(categories)}, "
+                        f"страниц {len(pages)}, товаров {len(products)}, sitemap {len(sitemaps)}"
+                    )
+            
+                discovery_mode = self._discovery_mode()
+            
+                if not (categories or pages or products or sitemaps):
+                    # Категории получаем первыми: если их нет, во фронтир ничего не попадет
+                    # и возобновленный запуск начнет обход заново
+                    if discovery_mode != 'sitemap':
+                        categories = await self._discover_categories(base_url, crawl_state)
+                    if discovery_mode in ('sitemap', 'both'):
+                        sitemaps = [base_url]
+                        if crawl_state:
+                            crawl_state.add('sitemap', sitemaps)
 
-            # Обрабатываем каждую категорию
-            for i, category_url in enumerate(categories, 1):
-                logger.info(f"Обработка категории {i}/{len(categories)}: {category_url}")
-                await self._process_category(category_url)
+                # Товары, не изменявшиеся с начала последнего завершенного обхода, пропускаются
+                since = await self.crawl_state.last_completed_at() if crawl_state else None
+                product_stream = self._sitemap_products(sitemaps, since, crawl_state) if sitemaps else None
 
-                # Задержка между категориями
-                if i < len(categories):
-                    await asyncio.sleep(self.delay_between_categories)
+                # Обрабатываем категории конвейером
+                await self._process_categories(
+                    categories, pages, products, crawl_state, product_stream, seen, scheduler
+                )
 
+                # Обход каталога остается запасным вариантом, если sitemap пуст или недоступен
+                if sitemaps and self.sitemap_parser.empty and discovery_mode == 'sitemap':
+                    logger.warning("В sitemap не найдено товаров, переходим к обходу каталога")
+                    categories = await self._discover_categories(base_url, crawl_state)
+                    await self._process_categories(
+                        categories, crawl_state = crawl_state, seen = seen, scheduler = scheduler
+                    )
+
+            run_status = RUN_COMPLETED
             logger.info("Парсинг завершен")
 
         except Exception as e:
             logger.error(f"Критическая ошибка в парсинге: {e}")
         finally:
+            for task in (checkpoints, maintenance):
+                if task is not None:
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions = True)
+            # Запись остатка буфера сохраняет валидаторы в кеш, закрываемый вместе с загрузчиком
+            saved = await self.repository.close()
+            await self.scraper.close()
+            if checkpoints is not None:
+                await self._finish_run(run_status, saved)
+            if maintenance is not None:
+                await self._leave_work_queue(saved)
             await mongo_client.disconnect()
+            if metrics_server is not None:
+                await metrics_server.stop()
+            if settings.metrics_enabled and settings.metrics_summary_path:
+                self._write_metrics_summary(run_status, started_at, time.monotonic() - started)
 
     async def parse_single_category(self, category_url: str):
         '''Парсит одну категорию'''
@@ -60,58 +162,228 @@ class ParserService:
         try:
             logger.info(f"Парсинг категории: {category_url}")
 
-            # Подключаемся к MongoDB
+            # Подключаемся к MongoDB и открываем HTTP-клиент
             await mongo_client.connect()
+            await self.repository.ensure_indexes()
+            self.repository.start()
+            await self.scraper.open()
 
             # Обрабатываем категорию
-            await self._process_category(category_url)
+            await self._process_categories([category_url])
 
             logger.info("Парсинг категории завершен")
 
         except Exception as e:
             logger.error(f"Ошибка при парсинге категории: {e}")
         finally:
+            await self.repository.close()
+            await self.scraper.close()
             await mongo_client.disconnect()
 
-    async def _process_category(self, category_url: str):
-        '''Обрабатывает одну категорию'''
+    async def _process_work_queue(self, base_url: str):
+        '''Распределенный обход: реплика берет задачи из общей очереди в MongoDB
+
+        Первая реплика нового обхода наполняет очередь категориями (и ссылками
+        из sitemap), остальные сразу берут задачи. Задача категории выполняется
+        тем же конвейером, что и parse_single_category, но найденные страницы
+        и товары уходят в общую очередь. Фронтир crawl_state не ведется:
+        очередь сама переживает остановку реплик.
+        '''
+        
+        if settings.product_limit:
+            logger.warning("Ограничение числа товаров не применяется в распределенном обходе")
+        if settings.revisit_budget > 0:
+            # Бюджет считался бы отдельно в каждой реплике, а отложенные товары
+            # после обхода каталога некому загрузить: загружаются все найденные
+            logger.warning("Бюджет повторных загрузок не применяется в распределенном обходе")
+
+        await self.work_queue.ensure_indexes()
+        seeding = await self.work_queue.begin_run()
+
+        categories, product_stream = [], None
+        if seeding:
+            discovery_mode = self._discovery_mode()
+            if discovery_mode in ('sitemap', 'both'):
+                since = await self.work_queue.last_completed_at()
+                product_stream = self._sitemap_products([base_url], since)
+            if discovery_mode != 'sitemap':
+                categories = await self._discover_categories(base_url)
+
+        await self._process_categories(
+            categories, product_stream = product_stream, work_queue = self.work_queue, product_limit = 0
+        )
+
+    def _discovery_mode(self) -> str:
+        discovery_mode = settings.discovery_mode
+        if settings.crawl_mode == 'prices' and discovery_mode != 'categories':
+            # Цены и наличие есть только в карточках каталога
+            logger.info("Режим prices: ссылки на товары берутся из обхода каталога")
+            discovery_mode = 'categories'
+        return discovery_mode
+
+    async def _discover_categories(
+        self,
+        base_url: str,
+        crawl_state: Optional[CrawlStateRepository] = None
+    ) -> List[str]:
+        '''Получает список категорий со стартовой страницы и добавляет их во фронтир
+
+        Без категорий обход каталога невозможен, поэтому ошибка прерывает запуск:
+        он не отмечается завершенным, а в распределенном обходе очередь остается
+        в наполнении и ее наполнит следующая запущенная реплика.
+        '''
+        
+        logger.info("Получение списка категорий")
+        categories = await self.start_parser.get_categories(base_url)
+        if not categories:
+            raise RuntimeError(f"Не удалось получить список категорий: {base_url}")
+        logger.info(f"Найдено категорий: {len(categories)}")
+        if crawl_state:
+            crawl_state.add('category', categories)
+        return categories
+
+    async def _sitemap_products(
+        self,
+        base_urls: List[str],
+        since: Optional[datetime],
+        crawl_state: Optional[CrawlStateRepository] = None
+    ) -> AsyncIterator[str]:
+        '''Ссылки на товары из sitemap сайтов; sitemap отмечается выполненным после разбора'''
+        
+        for base_url in base_urls:
+            if since:
+                logger.info(f"Пропуск товаров без изменений с {since:%Y-%m-%d %H:%M}")
+            async for product_url in self.sitemap_parser.iter_product_urls(base_url, since):
+                yield product_url
+            if crawl_state:
+                crawl_state.mark('sitemap', base_url)
+
+    async def _process_categories(
+        self,
+        category_urls: List[str],
+        page_urls: List[str] = (),
+        product_urls: List[str] = (),
+        crawl_state: Optional[CrawlStateRepository] = None,
+        product_stream: Optional[AsyncIterable[str]] = None,
+        seen: Optional[SeenSet] = None,
+        scheduler: Optional[RevisitScheduler] = None,
+        work_queue: Optional[WorkQueueRepository] = None,
+        product_limit: Optional[int] = None
+    ):
+        '''Прогоняет категории через конвейер обхода'''
+        
+        # Разбор страниц товаров выносится в пул процессов, чтобы не блокировать цикл событий
+        parse_executor = None
+        if settings.parse_processes > 0:
+            parse_executor = ProcessPoolExecutor(max_workers = settings.parse_processes)
+            logger.info(f"Разбор товаров в {settings.parse_processes} процессах")
         
         try:
-            # Получаем все страницы категории
-            page_links = await self.category_parser.create_page_links(category_url)
-            logger.info(f"Найдено страниц: {len(page_links)}")
+            pipeline = CrawlPipeline(
+                self.scraper,
+                self.category_parser,
+                self.product_parser,
+                self.repository,
+                crawl_state,
+                parse_executor,
+                seen,
+                scheduler,
+                work_queue,
+                product_limit
+            )
+            await pipeline.run(category_urls, page_urls, product_urls, product_stream)
+        finally:
+            if parse_executor:
+                parse_executor.shutdown(wait = False, cancel_futures = True)
 
-            # Обрабатываем каждую страницу
-            for page_num, page_url in enumerate(page_links, 1):
-                logger.info(f"Обработка страницы {page_num}/{len(page_links)}")
+    async def _checkpoint(self):
+        '''Контрольная точка: сначала товары, затем отметки о них во фронтире'''
+        
+        operations = self.crawl_state.take_pending()
+        if not await self.repository.flush():
+            # Задачи, товары которых не записаны, не должны стать выполненными
+            self.crawl_state.restore(operations)
+            logger.warning("Контрольная точка отложена: товары не записаны")
+            return
+        await self.crawl_state.write(operations)
 
-                # Получаем товары со страницы
-                product_links = await self.category_parser.get_product_links(page_url)
-                logger.info(f"Найдено товаров на странице: {len(product_links)}")
+    async def _checkpoint_periodically(self):
+        while True:
+            await asyncio.sleep(settings.checkpoint_interval)
+            try:
+                await self._checkpoint()
+            except Exception as e:
+                logger.error(f"Ошибка сохранения контрольной точки: {e}")
 
-                # Парсим товары со страницы
-                for product_url in product_links:
-                    await self._process_product(product_url)
-                    await asyncio.sleep(self.delay_between_requests)
+    async def _maintain_work_queue(self):
+        '''Обслуживание общей очереди: запись изменений, продление аренды, возврат просроченных задач
+        
+        Как и на контрольной точке, товары записываются раньше отметок о них в очереди.
+        '''
+        
+        while True:
+            await asyncio.sleep(settings.work_queue_heartbeat_interval)
+            try:
+                operations = self.work_queue.take_pending()
+                if await self.repository.flush():
+                    await self.work_queue.write(operations)
+                else:
+                    self.work_queue.restore(operations)
+                    logger.warning("Запись изменений очереди отложена: товары не записаны")
+                await self.work_queue.heartbeat()
+                await self.work_queue.requeue_expired()
+            except Exception as e:
+                logger.error(f"Ошибка обслуживания общей очереди: {e}")
 
-            logger.info("Категория обработана")
+    async def _leave_work_queue(self, saved: bool = True):
+        '''Записывает остаток изменений и возвращает в очередь незавершенные задачи реплики
 
+        Если товары не записаны, изменения отбрасываются: задачи реплики остаются
+        за ней и возвращаются в очередь, чтобы их выполнила другая реплика.
+        '''
+        
+        try:
+            operations = self.work_queue.take_pending()
+            if saved:
+                await self.work_queue.write(operations)
+            await self.work_queue.release_owned()
         except Exception as e:
-            logger.error(f"Ошибка при обработке категории {category_url}: {e}")
+            logger.error(f"Не удалось вернуть задачи в общую очередь: {e}")
 
-    async def _process_product(self, product_url: str):
-        '''Обрабатывает один товар'''
-       
+    def _write_metrics_summary(self, status: str, started_at: datetime, seconds: float):
+        '''Сохраняет JSON-сводку метрик запуска'''
+        
+        stats = self.repository.stats
+        processed = stats["new"] + stats["updated"] + stats["unchanged"] + stats["offers_updated"] + stats["offers_unchanged"]
+        summary = {
+            "status": status,
+            "started_at": started_at.isoformat(timespec = 'seconds'),
+            "finished_at": datetime.now().isoformat(timespec = 'seconds'),
+            "seconds": round(seconds, 3),
+            "products_processed": processed,
+            "products_per_second": round(processed / seconds, 3) if seconds > 0 else None,
+            "repository": dict(stats),
+            "metrics": metrics.snapshot()
+        }
+        
+        path = settings.metrics_summary_path
         try:
-            # Парсим товар
-            product = await self.product_parser.parse_product(product_url)
-
-            if product:
-                # Сохраняем в базу данных
-                await self.repository.save_product(product)
-                logger.info(f"Сохранен товар: {product.article}")
-            else:
-                logger.warning(f"Не удалось спарсить товар: {product_url}")
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok = True)
+            with open(path, 'w', encoding = 'utf-8') as file:
+                json.dump(summary, file, ensure_ascii = False, indent = 2)
+            logger.info(f"Сводка метрик сохранена: {path}")
+        except OSError as e:
+            logger.error(f"Не удалось сохранить сводку метрик {path}: {e}")
 
+    async def _finish_run(self, status: str, saved: bool = True):
+        if not saved:
+            # Отметки с последней контрольной точки отбрасываются вместе с незаписанными
+            # товарами: следующий запуск продолжит обход с этой точки
+            self.crawl_state.take_pending()
+            status = RUN_INTERRUPTED
+        try:
+            await self.crawl_state.finish_run(status)
         except Exception as e:
-            logger.error(f"Ошибка при обработке товара {product_url}: {e}")
\ No newline at end of file
+            logger.error(f"Не удалось сохранить состояние обхода: {e}")
@@ -0,0 +1,659 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass, replace
+from concurrent.futures import Executor
+from functools import partial
+from typing import AsyncIterable, Awaitable, Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+
+from src.core.metrics import metrics
+from src.core.settings import settings
+from src.parsers.category import CategoryPageParser
+from src.parsers.product_page import ProductPropertyParser, parse_product_html
+from src.parsers.soup import PARSE_SECONDS
+from src.repository.crawl_state import TASK_DONE, TASK_FAILED, CrawlStateRepository
+from src.repository.repository import ProductRepository
+from src.repository.work_queue import WorkQueueRepository
+from src.schemas.product import ListingOffer
+from src.scrapers.scraper import PageResult, PageScraper
+from src.services.scheduler import RevisitScheduler
+from src.services.seen_set import SeenSet, make_seen_set, normalize_url
+
+logger = logging.getLogger(__name__)
+
+STREAM_BATCH_SIZE = 100
+
+QUEUE_DEPTH = metrics.gauge('queue_depth', 'Элементов в очереди стадии конвейера', ('stage',))
+PRODUCTS = metrics.counter('pipeline_products_total', 'Товары по итогу обработки в конвейере', ('status',))
+PRODUCTS_PER_SECOND = metrics.gauge(
+    'products_per_second', 'Обработано товаров в секунду с начала работы конвейера'
+)
+
+
+class PageTask(NamedTuple):
+    '''Страница категории для загрузки; category_url и number нужны для упреждающей загрузки'''
+
+    url: str
+    category_url: Optional[str] = None
+    number: int = 0
+    # Страница за пределами известной пагинации, запрошенная заранее
+    speculative: bool = False
+
+
+@dataclass
+class CategoryPagination:
+    '''Состояние пагинации категории во время обхода'''
+
+    known_count: int
+    max_page: int
+    full_size: int
+    # Ссылки последней разобранной страницы за пределами известной пагинации
+    last_links: FrozenSet[str] = frozenset()
+
+
+class CrawlPipeline:
+    '''Конвейер обхода: категории → страницы → ссылки на товары → загрузка → разбор → сохранение
+
+    Каждая стадия обслуживается своим числом воркеров, стадии связаны
+    ограниченными очередями, поэтому медленная стадия притормаживает
+    предыдущие, а память остается ограниченной.
+
+    С общей очередью задач (work_queue) стадии category, page и product
+    получают элементы из нее, а найденные страницы и товары публикуются
+    туда же: так несколько реплик делят один обход.
+    '''
+
+    def __init__(
+        self,
+        scraper: PageScraper,
+        category_parser: CategoryPageParser,
+        product_parser: ProductPropertyParser,
+        repository: ProductRepository,
+        crawl_state: Optional[CrawlStateRepository] = None,
+        parse_executor: Optional[Executor] = None,
+        seen: Optional[SeenSet] = None,
+        scheduler: Optional[RevisitScheduler] = None,
+        work_queue: Optional[WorkQueueRepository] = None,
+        product_limit: Optional[int] = None
+    ):
+        self.scraper = scraper
+        self.category_parser = category_parser
+        self.product_parser = product_parser
+        self.repository = repository
+        self.crawl_state = crawl_state
+        self.parse_executor = parse_executor
+        # Ссылки на товары, уже поставленные в обход, общие для всех источников
+        self.seen = seen if seen is not None else make_seen_set()
+        # Планировщик повторных загрузок при ограниченном бюджете запросов
+        self.scheduler = scheduler
+        # Общая очередь задач распределенного обхода
+        self.work_queue = work_queue
+        # Ограничение числа страниц товаров за запуск (0 - без ограничения)
+        self.product_limit = settings.product_limit if product_limit is None else product_limit
+
+        self.category_queue: asyncio.Queue = asyncio.Queue(maxsize = settings.queue_size)
+        self.page_queue: asyncio.Queue = asyncio.Queue(maxsize = settings.queue_size)
+        self.product_queue: asyncio.Queue = asyncio.Queue(maxsize = settings.queue_size)
+        self.html_queue: asyncio.Queue = asyncio.Queue(maxsize = settings.queue_size)
+        self.save_queue: asyncio.Queue = asyncio.Queue(maxsize = settings.queue_size)
+
+        self.saved = 0
+        self.enqueued = 0
+        self.streamed = 0
+        self.refreshed = 0
+        self.duplicates = 0
+        self.unchanged = 0
+        self.failed = 0
+        self.parse_paths: Counter = Counter()
+        self._pagination: Dict[str, CategoryPagination] = {}
+        self._started: Optional[float] = None
+
+    @property
+    def queues(self) -> Dict[str, asyncio.Queue]:
+        return {
+            'category': self.category_queue,
+            'page': self.page_queue,
+            'product': self.product_queue,
+            'html': self.html_queue,
+            'save': self.save_queue
+        }
+
+    @property
+    def processed(self) -> int:
+        '''Товары, дошедшие до конца обработки: сохраненные, неизмененные и обновленные по карточкам'''
+
+        return self.saved + self.unchanged + self.refreshed
+
+    @property
+    def limit_reached(self) -> bool:
+        '''Достигнуто ограничение числа загружаемых страниц товаров (product_limit)'''
+
+        return bool(self.product_limit) and self.enqueued >= self.product_limit
+
+    def products_per_second(self) -> float:
+        if self._started is None:
+            return 0.0
+        elapsed = time.monotonic() - self._started
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    async def run(
+        self,
+        category_urls: Iterable[str],
+        page_urls: Iterable[str] = (),
+        product_urls: Iterable[str] = (),
+        product_stream: Optional[AsyncIterable[str]] = None
+    ):
+        '''Прогоняет категории через все стадии и дожидается их завершения
+
+        page_urls и product_urls - невыполненные задачи прерванного обхода,
+        которые подаются сразу на соответствующие стадии. product_stream -
+        ссылки на товары из другого источника (sitemap), минуя обход каталога.
+        '''
+
+        self._started = time.monotonic()
+        for stage, queue in self.queues.items():
+            QUEUE_DEPTH.track(queue.qsize, stage = stage)
+        PRODUCTS_PER_SECOND.track(self.products_per_second)
+
+        workers = (
+            self._spawn(self._category_worker, self.category_queue, settings.category_workers)
+            + self._spawn(self._page_worker, self.page_queue, settings.page_workers)
+            + self._spawn(self._fetch_worker, self.product_queue, settings.fetch_workers)
+            # Каждому процессу пула нужен свой воркер, ожидающий результат
+            + self._spawn(
+                self._parse_worker, self.html_queue,
+                max(settings.parse_workers, settings.parse_processes if self.parse_executor else 0)
+            )
+            + self._spawn(self._save_worker, self.save_queue, settings.save_workers)
+        )
+
+        try:
+            if self.work_queue:
+                await self._run_work_queue(category_urls, product_stream)
+            else:
+                await self._run_local(category_urls, page_urls, product_urls, product_stream)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions = True)
+            # При остановке уже разобранные товары не теряем
+            await self._drain_save_queue()
+            for stage in self.queues:
+                QUEUE_DEPTH.untrack(stage = stage)
+            PRODUCTS_PER_SECOND.untrack()
+
+        logger.info(
+            f"Конвейер завершен: обработано {self.saved}, "
+            f"страниц без изменений {self.unchanged}, ошибок {self.failed}, "
+            f"{self.products_per_second():.1f} товаров/с"
+        )
+        if self.streamed:
+            logger.info(f"Ссылок на товары из sitemap: {self.streamed}")
+        if self.refreshed:
+            logger.info(f"Цены и наличие по карточкам каталога проверены у {self.refreshed} товаров")
+        logger.info(
+            f"Уникальных ссылок на товары: {len(self.seen)}, "
+            f"пропущено повторных: {self.duplicates}"
+        )
+        if self.parse_paths:
+            logger.info(
+                "Пути разбора товаров: "
+                + ", ".join(f"{path} {count}" for path, count in self.parse_paths.most_common())
+            )
+        for host, rate in self.scraper.current_rates().items():
+            logger.info(f"Скорость запросов к {host}: {rate:.2f} запр/с")
+
+    async def _run_local(
+        self,
+        category_urls: Iterable[str],
+        page_urls: Iterable[str],
+        product_urls: Iterable[str],
+        product_stream: Optional[AsyncIterable[str]]
+    ):
+        '''Подает задачи в очереди стадий и дожидается, пока все стадии опустеют'''
+
+        # Невыполненные задачи фронтира уже учтены в seen при возобновлении
+        for product_url in self._take(list(product_urls)):
+            self.seen.add(normalize_url(product_url))
+            await self.product_queue.put(product_url)
+        if product_stream is not None:
+            await self._consume_stream(product_stream)
+        for page_url in page_urls:
+            await self.page_queue.put(PageTask(page_url))
+        for category_url in category_urls:
+            await self.category_queue.put(category_url)
+
+        # Стадии завершаются по порядку: элемент отмечается выполненным
+        # только после передачи результата в следующую очередь
+        await self.category_queue.join()
+        await self.page_queue.join()
+
+        # Обход каталога завершен: остаток бюджета - известным товарам
+        if self.scheduler:
+            await self._enqueue_products(self.scheduler.select())
+
+        for queue in (self.product_queue, self.html_queue, self.save_queue):
+            await queue.join()
+
+    async def _run_work_queue(self, category_urls: Iterable[str], product_stream: Optional[AsyncIterable[str]]):
+        '''Распределенный обход: стадии получают задачи из общей очереди
+
+        Начальные задачи (категории и ссылки из sitemap) передает только
+        реплика, наполняющая очередь. Обход закончен, когда в очереди не
+        осталось ни ожидающих задач, ни задач в работе у какой-либо реплики.
+        Планировщик здесь не используется: отложенные им товары некому было бы
+        загрузить после обхода каталога.
+        '''
+
+        if self.scheduler:
+            raise ValueError("Планировщик повторных загрузок не поддерживается в распределенном обходе")
+
+        feeders = [
+            asyncio.create_task(self._feed(kind, queue), name = f'claim_{kind}')
+            for kind, queue in (
+                ('category', self.category_queue),
+                ('page', self.page_queue),
+                ('product', self.product_queue)
+            )
+        ]
+        try:
+            self.work_queue.add('category', category_urls)
+            if product_stream is not None:
+                await self._consume_stream(product_stream)
+            self.work_queue.end_seeding()
+
+            while not await self.work_queue.finished():
+                await asyncio.sleep(settings.work_queue_poll_interval)
+        finally:
+            for feeder in feeders:
+                feeder.cancel()
+            await asyncio.gather(*feeders, return_exceptions = True)
+
+    async def _feed(self, kind: str, queue: asyncio.Queue):
+        '''Берет задачи вида kind из общей очереди, пока в очереди стадии есть место'''
+
+        while True:
+            try:
+                task = await self.work_queue.claim(kind)
+            except Exception as e:
+                logger.error(f"Не удалось взять задачу {kind} из общей очереди: {e}")
+                task = None
+            if task is None:
+                await asyncio.sleep(settings.work_queue_poll_interval)
+                continue
+            await queue.put(self._page_task(task) if kind == 'page' else task["url"])
+
+    def _page_task(self, task: dict) -> PageTask:
+        '''Страница категории из задачи общей очереди; восстанавливает пагинацию категории
+
+        Страницы категории могут достаться разным репликам, поэтому сведения
+        для упреждающей загрузки передаются вместе с задачей.
+        '''
+
+        category_url = task.get("category_url")
+        if category_url and task.get("known_count") and category_url not in self._pagination:
+            self._pagination[category_url] = CategoryPagination(
+                known_count = task["known_count"],
+                max_page = max(task["known_count"], task.get("number", 0)),
+                full_size = task["full_size"]
+            )
+        return PageTask(task["url"], category_url, task.get("number", 0), task.get("speculative", False))
+
+    def _page_fields(self, task: PageTask) -> dict:
+        fields = {"category_url": task.category_url, "number": task.number, "speculative": task.speculative}
+        pagination = self._pagination.get(task.category_url)
+        if pagination:
+            fields.update(known_count = pagination.known_count, full_size = pagination.full_size)
+        return fields
+
+    def _spawn(
+        self,
+        handler: Callable[[object], Awaitable[None]],
+        queue: asyncio.Queue,
+        count: int
+    ) -> List[asyncio.Task]:
+        '''Запускает воркеры стадии'''
+
+        # Задачи называются по стадиям: так их различает профилировщик
+        stage = handler.__name__.strip('_').replace('_worker', '')
+        return [
+            asyncio.create_task(self._worker_loop(handler, queue), name = stage)
+            for _ in range(max(1, count))
+        ]
+
+    async def _worker_loop(self, handler: Callable[[object], Awaitable[None]], queue: asyncio.Queue):
+        '''Забирает элементы из очереди и передает их обработчику стадии'''
+
+        while True:
+            item = await queue.get()
+            try:
+                await handler(item)
+            except Exception as e:
+                logger.error(f"Ошибка на стадии {handler.__name__}: {e}")
+                # Иначе задача осталась бы в аренде у реплики до ее остановки
+                if self.work_queue:
+                    self.work_queue.release(*self._task_of(queue, item))
+            finally:
+                queue.task_done()
+
+    def _task_of(self, queue: asyncio.Queue, item) -> Tuple[str, str]:
+        '''Вид и ссылка задачи, к которой относится элемент очереди стадии'''
+
+        if queue is self.category_queue:
+            return 'category', item
+        if queue is self.page_queue:
+            return 'page', item.url
+        if queue is self.save_queue:
+            return 'product', item[0].url
+        return 'product', getattr(item, 'url', item)
+
+    async def _consume_stream(self, product_stream: AsyncIterable[str]):
+        '''Подает ссылки на товары из потока сразу на стадию загрузки'''
+
+        batch = []
+        async for product_url in product_stream:
+            if self.limit_reached:
+                break
+            self.streamed += 1
+            PRODUCTS.inc(status = 'streamed')
+            batch.extend(self._new_products([product_url]))
+            # Планировщику ссылки передаются пачками: одна выборка истории на пачку
+            if len(batch) >= STREAM_BATCH_SIZE:
+                await self._enqueue_products(await self._admit(batch))
+                batch = []
+        await self._enqueue_products(await self._admit(batch))
+
+    async def _admit(self, product_links: List[str]) -> List[str]:
+        '''Ссылки, которые планировщик разрешает загрузить сейчас (без планировщика - все)'''
+
+        if self.scheduler is None:
+            return product_links
+        return await self.scheduler.admit(product_links)
+
+    async def _enqueue_products(self, product_links: List[str]):
+        product_links = self._take(product_links)
+        if self.crawl_state:
+            self.crawl_state.add('product', product_links)
+        await self._dispatch([], product_links)
+
+    async def _dispatch(self, page_tasks: List[PageTask], product_links: List[str]):
+        '''Передает найденные страницы категорий и товары на их стадии
+
+        В распределенном обходе они публикуются в общую очередь, откуда их
+        заберет любая реплика, в том числе эта.
+        '''
+
+        if self.work_queue:
+            for task in page_tasks:
+                self.work_queue.add('page', [task.url], **self._page_fields(task))
+            self.work_queue.add('product', product_links)
+            return
+
+        for task in page_tasks:
+            await self.page_queue.put(task)
+        for product_url in product_links:
+            await self.product_queue.put(product_url)
+
+    def _take(self, product_links: List[str]) -> List[str]:
+        '''Ссылки на товары в пределах product_limit; учитывает их как поставленные в загрузку'''
+
+        if self.product_limit:
+            product_links = product_links[:max(0, self.product_limit - self.enqueued)]
+        self.enqueued += len(product_links)
+        return product_links
+
+    def _new_products(self, product_links: Iterable[str]) -> List[str]:
+        '''Нормализованные ссылки на товары, еще не встречавшиеся за запуск'''
+
+        new_links = []
+        for product_url in product_links:
+            product_url = normalize_url(product_url)
+            if self.seen.add(product_url):
+                new_links.append(product_url)
+            else:
+                self.duplicates += 1
+                PRODUCTS.inc(status = 'duplicate')
+        return new_links
+
+    async def _category_worker(self, category_url: str):
+        '''Загружает первую страницу категории и раздает остальные страницы воркерам'''
+
+        if self.limit_reached:
+            return
+
+        logger.info(f"Обработка категории: {category_url}")
+
+        # Первая страница загружается один раз: из нее берутся и пагинация, и товары
+        if settings.crawl_mode == 'prices':
+            first_page = await self.category_parser.get_first_page_cards(category_url)
+        else:
+            first_page = await self.category_parser.get_first_page(category_url)
+        if first_page is None:
+            self._fail('category', category_url)
+            return
+
+        page_count, items = first_page
+        found = len(items)
+        if settings.crawl_mode == 'prices':
+            links = [card.url for card in items]
+            cards = self._new_cards(items)
+            fresh = len(cards)
+            product_links = await self._refresh_prices(cards)
+        else:
+            links = items
+            product_links = self._new_products(items)
+            fresh = len(product_links)
+        logger.info(f"Найдено страниц: {page_count}, товаров на первой странице: {found}")
+        product_links = self._take(await self._admit(product_links))
+
+        page_tasks = [
+            PageTask(self.category_parser.page_url(category_url, number), category_url, number)
+            for number in range(2, page_count + 1)
+        ]
+        self._pagination[category_url] = CategoryPagination(
+            known_count = page_count,
+            max_page = page_count,
+            full_size = max(found, settings.speculative_min_products)
+        )
+        page_tasks += self._speculate(category_url, 1, links, fresh)
+
+        if self.crawl_state:
+            self.crawl_state.add('page', [task.url for task in page_tasks])
+            self.crawl_state.add('product', product_links)
+
+        # Остальные страницы загружаются параллельно воркерами страниц
+        await self._dispatch(page_tasks, product_links)
+        self._mark('category', category_url)
+
+        # Задержка между категориями
+        await asyncio.sleep(settings.delay_between_categories)
+
+    async def _page_worker(self, task: PageTask):
+        '''Собирает ссылки на товары со страницы категории'''
+
+        if self.limit_reached:
+            return
+
+        if settings.crawl_mode == 'prices':
+            cards = await self.category_parser.get_product_cards(task.url)
+            if cards is None:
+                self._fail_page(task)
+                return
+            links = [card.url for card in cards]
+            cards = self._new_cards(cards)
+            speculative = self._speculate(task.category_url, task.number, links, len(cards))
+            product_links = await self._refresh_prices(cards)
+        else:
+            product_links = await self.category_parser.get_product_links(task.url)
+            if product_links is None:
+                self._fail_page(task)
+                return
+            logger.info(f"Найдено товаров на странице: {len(product_links)}")
+            links = product_links
+            product_links = self._new_products(links)
+            speculative = self._speculate(task.category_url, task.number, links, len(product_links))
+        product_links = self._take(await self._admit(product_links))
+
+        if self.crawl_state:
+            self.crawl_state.add('page', [next_task.url for next_task in speculative])
+            self.crawl_state.add('product', product_links)
+
+        await self._dispatch(speculative, product_links)
+        self._mark('page', task.url)
+
+    def _fail_page(self, task: PageTask):
+        '''Неудачная загрузка страницы; упреждающая загрузка категории останавливается, как на пустой'''
+
+        self._speculate(task.category_url, task.number, [], 0)
+        if task.speculative:
+            # Страницы за пределами пагинации может просто не быть: это конец категории, а не ошибка
+            self._mark('page', task.url)
+        else:
+            self._fail('page', task.url)
+
+    def _new_cards(self, cards: List[ListingOffer]) -> List[ListingOffer]:
+        '''Карточки товаров, еще не встречавшихся за запуск, с нормализованными ссылками'''
+
+        by_url = {normalize_url(card.url): card for card in cards}
+        return [by_url[url].model_copy(update = {"url": url}) for url in self._new_products(by_url)]
+
+    async def _refresh_prices(self, cards: List[ListingOffer]) -> List[str]:
+        '''Режим prices: цены известных товаров обновляются по карточкам из _new_cards
+
+        Возвращает ссылки на товары, которых еще нет в базе: их страницы
+        загружаются и разбираются полностью.
+        '''
+
+        product_links = await self.repository.update_offers(cards)
+        self.refreshed += len(cards) - len(product_links)
+        PRODUCTS.inc(len(cards) - len(product_links), status = 'refreshed')
+        return product_links
+
+    def _speculate(self, category_url: Optional[str], number: int, links: List[str], fresh: int) -> List[PageTask]:
+        '''Страницы за пределами известной пагинации, которые стоит запросить заранее
+
+        Пагинация может показывать не все страницы. Если последняя известная
+        страница (или дальше) заполнена полностью, заранее запрашиваются
+        следующие speculative_window страниц, пока не встретится неполная или пустая.
+        links - ссылки на товары со страницы number, fresh - сколько из них новых.
+        Сайт может отдавать на несуществующий номер последнюю или первую страницу,
+        поэтому загрузка останавливается и на странице без новых ссылок (или с теми
+        же ссылками, что у предыдущей), и через speculative_max_pages страниц.
+        '''
+
+        pagination = self._pagination.get(category_url)
+        if pagination is None or number < pagination.known_count:
+            return []
+
+        if number > pagination.known_count:
+            page_links = frozenset(normalize_url(url) for url in links)
+            if links and (not fresh or page_links == pagination.last_links):
+                logger.info(f"Страница {number} повторяет уже загруженные, пагинация закончилась: {category_url}")
+                del self._pagination[category_url]
+                return []
+            pagination.last_links = page_links
+
+        if not settings.speculative_prefetch or len(links) < pagination.full_size:
+            del self._pagination[category_url]
+            return []
+
+        limit = pagination.known_count + settings.speculative_max_pages
+        if number >= limit:
+            logger.warning(f"Упреждающая загрузка остановлена на странице {number}: {category_url}")
+            del self._pagination[category_url]
+            return []
+
+        last = min(number + settings.speculative_window, limit)
+        tasks = [
+            PageTask(self.category_parser.page_url(category_url, next_number), category_url, next_number, True)
+            for next_number in range(pagination.max_page + 1, last + 1)
+        ]
+        if tasks:
+            pagination.max_page = last
+            logger.info(f"Пагинация неполная, запрашиваем страницы до {last}: {category_url}")
+        return tasks
+
+    async def _fetch_worker(self, product_url: str):
+        '''Загружает страницу товара, пропуская неизмененные с прошлого обхода'''
+
+        result = await self.scraper.fetch_page(product_url)
+        if result is None:
+            self.failed += 1
+            PRODUCTS.inc(status = 'fetch_failed')
+            self._fail('product', product_url)
+            logger.error(f"Не удалось получить HTML: {product_url}")
+            return
+
+        if result.unchanged:
+            self.unchanged += 1
+            PRODUCTS.inc(status = 'not_modified')
+            self.repository.mark_unchanged(product_url)
+            self._mark('product', product_url)
+            logger.debug(f"Страница не изменилась: {product_url}")
+            return
+
+        await self.html_queue.put(result)
+
+    async def _parse_worker(self, result: PageResult):
+        '''Разбирает страницу товара'''
+
+        started = time.perf_counter()
+        try:
+            if self.parse_executor:
+                product, path = await asyncio.get_running_loop().run_in_executor(
+                    self.parse_executor, parse_product_html, result.html, result.url
+                )
+            else:
+                product, path = self.product_parser.parse_html_with_path(result.html, result.url)
+        except Exception as e:
+            self.failed += 1
+            PRODUCTS.inc(status = 'parse_failed')
+            PARSE_SECONDS.observe(time.perf_counter() - started, page = 'product', path = 'failed')
+            self._mark('product', result.url, TASK_FAILED)
+            logger.warning(f"Не удалось спарсить товар {result.url}: {e}")
+            return
+
+        # При разборе в пуле процессов время включает передачу страницы и результата
+        PARSE_SECONDS.observe(time.perf_counter() - started, page = 'product', path = path)
+        self.parse_paths[path] += 1
+        # Страница дальше не нужна, а валидаторы сохраняются после записи товара
+        await self.save_queue.put((replace(result, html = None), product))
+
+    async def _save_worker(self, item: tuple):
+        '''Передает товар на пакетную запись в базу данных'''
+
+        result, product = item
+        # Валидаторы, сохраненные до записи товара, при сбое записи
+        # дали бы 304 на следующем обходе, и товар был бы потерян
+        await self.repository.save_product(product, on_saved = partial(self.scraper.remember, result))
+        self._mark('product', result.url)
+        self.saved += 1
+        PRODUCTS.inc(status = 'saved')
+        logger.info(f"Обработан товар: {product.article}")
+
+    async def _drain_save_queue(self):
+        '''Передает на запись товары, оставшиеся в очереди после остановки воркеров'''
+
+        while not self.save_queue.empty():
+            item = self.save_queue.get_nowait()
+            try:
+                await self._save_worker(item)
+            finally:
+                self.save_queue.task_done()
+
+    def _mark(self, kind: str, url: str, status: str = TASK_DONE):
+        '''Отмечает задачу во фронтире и в общей очереди, если они ведутся'''
+
+        if self.crawl_state:
+            self.crawl_state.mark(kind, url, status)
+        if self.work_queue:
+            self.work_queue.mark(kind, url, status)
+
+    def _fail(self, kind: str, url: str):
+        '''Отмечает неудачную загрузку: во фронтире задача неудачна, в общей очереди - возвращается на повтор'''
+
+        if self.crawl_state:
+            self.crawl_state.mark(kind, url, TASK_FAILED)
+        if self.work_queue:
+            self.work_queue.release(kind, url)
@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+
+from src.core.settings import settings
+from src.parsers.product_page import parse_product_html
+from src.repository.mongo_client import mongo_client
+from src.repository.repository import ProductRepository
+from src.schemas.product import Product
+from src.scrapers.archive import INDEX_NAME, ArchiveEntry, ArchiveReader, HtmlArchive
+
+logger = logging.getLogger(__name__)
+
+# Путь разбора в результате для страниц, которые не удалось прочитать или разобрать
+PATH_FAILED = 'failed'
+
+# Читатель архива в процессе пула: создается один раз на процесс
+_process_reader: Optional[ArchiveReader] = None
+
+
+def reparse_entries(directory: str, entries: List[ArchiveEntry]) -> List[Tuple[ArchiveEntry, Optional[Product], str]]:
+    '''Читает и разбирает пачку страниц архива; функция уровня модуля для ProcessPoolExecutor
+
+    Страницы читаются прямо в процессе пула, между процессами передаются
+    только записи индекса и готовые товары. Возвращает (запись индекса, товар,
+    путь разбора); для ошибок товар - None, а вместо пути - текст ошибки.
+    '''
+
+    global _process_reader
+    if _process_reader is None or _process_reader.directory != directory:
+        _process_reader = ArchiveReader(directory)
+
+    results = []
+    for entry in entries:
+        try:
+            product, path = parse_product_html(_process_reader.read(entry), entry.url)
+        except Exception as e:
+            results.append((entry, None, f"{PATH_FAILED}: {type(e).__name__}: {e}"))
+            continue
+        results.append((entry, product, path))
+    return results
+
+
+def _chunks(entries: Iterable[ArchiveEntry], size: int) -> Iterator[List[ArchiveEntry]]:
+    chunk = []
+    for entry in entries:
+        chunk.append(entry)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class ReparseService:
+    '''Повторный разбор архива страниц товаров без обращения к сайту
+
+    Последние версии страниц из архива разбираются в пуле процессов и
+    записываются тем же пакетным upsert, что и при обходе: товары, отпечаток
+    которых не изменился, не перезаписываются. Товары, цены которых режим
+    prices обновил позже загрузки страницы, пропускаются, чтобы не вернуть
+    устаревшие цену и наличие.
+    '''
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or settings.archive_path
+        # История загрузок и цен не ведется: повторный разбор - не загрузка страницы
+        self.repository = ProductRepository()
+        self.parsed = 0
+        self.failed = 0
+        self.outdated = 0
+        self.parse_paths: Counter = Counter()
+
+    async def run(
+        self,
+        processes: int = 0,
+        since: Optional[datetime] = None,
+        limit: int = 0,
+        chunk_size: int = 50
+    ):
+        '''Разбирает архив в processes процессах (0 - в основном процессе)'''
+
+        if not os.path.exists(os.path.join(self.directory, INDEX_NAME)):
+            logger.error(f"Архив страниц не найден: {self.directory}")
+            return
+
+        archive = HtmlArchive(self.directory)
+        executor: Optional[Executor] = None
+        started = time.monotonic()
+        try:
+            archive.open()
+            total = archive.count()
+            logger.info(f"Страниц в архиве: {total}, разбор в {processes or 1} процессах")
+
+            await mongo_client.connect()
+            await self.repository.ensure_indexes()
+            self.repository.start()
+
+            if processes > 0:
+                executor = ProcessPoolExecutor(max_workers = processes)
+            await self._reparse(archive.latest(since, limit), executor, max(1, processes), chunk_size, started)
+
+            elapsed = time.monotonic() - started
+            logger.info(
+                f"Повторный разбор завершен: разобрано {self.parsed}, ошибок {self.failed}, "
+                f"пропущено с более новыми ценами {self.outdated} за {elapsed:.1f} с ({self.parsed / elapsed if elapsed else 0:.1f} товаров/с)"
+            )
+            if self.parse_paths:
+                logger.info(
+                    "Пути разбора товаров: "
+                    + ", ".join(f"{path} {count}" for path, count in self.parse_paths.most_common())
+                )
+
+        except Exception as e:
+            logger.error(f"Ошибка повторного разбора: {e}")
+        finally:
+            if executor is not None:
+                executor.shutdown(wait = False, cancel_futures = True)
+            archive.close()
+            await self.repository.close()
+            await mongo_client.disconnect()
+
+    async def _reparse(
+        self,
+        entries: Iterable[ArchiveEntry],
+        executor: Optional[Executor],
+        processes: int,
+        chunk_size: int,
+        started: float
+    ):
+        '''Раздает пачки пулу, держа в работе не больше двух пачек на процесс'''
+
+        loop = asyncio.get_running_loop()
+        pending: Set[asyncio.Future] = set()
+
+        for chunk in _chunks(entries, chunk_size):
+            if executor is None:
+                await self._save(reparse_entries(self.directory, chunk), started)
+                continue
+
+            pending.add(loop.run_in_executor(executor, reparse_entries, self.directory, chunk))
+            if len(pending) >= processes * 2:
+                done, pending = await asyncio.wait(pending, return_when = asyncio.FIRST_COMPLETED)
+                for future in done:
+                    await self._save(future.result(), started)
+
+        for future in asyncio.as_completed(pending):
+            await self._save(await future, started)
+
+    async def _save(self, results: List[Tuple[ArchiveEntry, Optional[Product], str]], started: float):
+        parsed = []
+        for entry, product, path in results:
+            if product is None:
+                self.failed += 1
+                logger.warning(f"Не удалось разобрать страницу из архива {entry.url}: {path}")
+                continue
+            self.parsed += 1
+            self.parse_paths[path] += 1
+            parsed.append((entry, product))
+
+        offers_updated = await self.repository.load_offers_updated_at([product for _, product in parsed])
+        for (entry, product), updated_at in zip(parsed, offers_updated):
+            if updated_at and updated_at > datetime.fromisoformat(entry.fetched_at):
+                self.outdated += 1
+                logger.debug(f"Цены обновлены после загрузки страницы, товар пропущен: {entry.url}")
+                continue
+            await self.repository.save_product(product)
+
+        done = self.parsed + self.failed
+        if done and done % 1000 < len(results):
+            elapsed = time.monotonic() - started
+            logger.info(f"Разобрано страниц: {done} ({done / elapsed:.1f} в секунду)")
@@ -0,0 +1,74 @@
+import heapq
+import logging
+import math
+from datetime import datetime
+from typing import List, Tuple
+
+from src.core.settings import settings
+from src.repository.revisits import SECONDS_PER_DAY, RevisitRepository
+
+logger = logging.getLogger(__name__)
+
+
+def change_probability(record: dict, now: datetime) -> float:
+    '''Вероятность, что товар изменился с последней загрузки (пуассоновская модель)'''
+
+    rate = record.get("change_rate")
+    if rate is None:
+        rate = settings.revisit_default_rate
+    elapsed = max(0.0, (now - record["last_fetched"]).total_seconds()) / SECONDS_PER_DAY
+    return 1.0 - math.exp(-rate * elapsed)
+
+
+class RevisitScheduler:
+    '''Выбор страниц товаров для загрузки в пределах бюджета запросов на запуск
+
+    Новые товары (без истории загрузок) загружаются сразу, пока есть бюджет.
+    Известные откладываются до конца обхода каталога, после чего остаток
+    бюджета отдается товарам с наибольшей вероятностью изменения.
+    '''
+
+    def __init__(self, revisits: RevisitRepository, budget: int):
+        self.revisits = revisits
+        self.budget = budget
+        self.admitted_new = 0
+        self.admitted_known = 0
+        self.expected_changes = 0.0
+        self._candidates: List[Tuple[float, str]] = []
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.budget - self.admitted_new - self.admitted_known)
+
+    async def admit(self, urls: List[str]) -> List[str]:
+        '''Возвращает ссылки для немедленной загрузки, остальные откладывает'''
+
+        if not urls:
+            return []
+
+        records = await self.revisits.load(urls)
+        now = datetime.now()
+        admitted = []
+        for url in urls:
+            record = records.get(url)
+            if record is not None:
+                self._candidates.append((change_probability(record, now), url))
+            elif self.remaining:
+                self.admitted_new += 1
+                admitted.append(url)
+        return admitted
+
+    def select(self) -> List[str]:
+        '''Известные товары с наибольшей вероятностью изменения в пределах остатка бюджета'''
+
+        chosen = heapq.nlargest(self.remaining, self._candidates)
+        self._candidates = []
+
+        self.admitted_known += len(chosen)
+        self.expected_changes += sum(probability for probability, _ in chosen)
+        logger.info(
+            f"Планировщик: новых товаров {self.admitted_new}, повторных {len(chosen)}, "
+            f"ожидаемых изменений среди повторных {self.expected_changes:.1f}, "
+            f"бюджет {self.budget}"
+        )
+        return [url for _, url in chosen]
@@ -0,0 +1,103 @@
+import hashlib
+import logging
+import math
+from typing import Union
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from src.core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Параметры, не влияющие на содержимое страницы товара
+TRACKING_PARAMS = ('utm_', 'yclid', 'gclid', 'fbclid', '_openstat')
+
+
+def normalize_url(url: str) -> str:
+    '''Приводит ссылку на товар к каноническому виду для сравнения
+
+    Схема и хост переводятся в нижний регистр, порт по умолчанию и якорь
+    отбрасываются, метки рекламных кампаний удаляются, параметры сортируются.
+    '''
+
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+
+    query = sorted(
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values = True)
+        if not name.lower().startswith(TRACKING_PARAMS)
+    )
+    return urlunsplit((scheme, host, parts.path or '/', urlencode(query), ''))
+
+
+class ExactSeenSet:
+    '''Точное множество просмотренных ссылок'''
+
+    def __init__(self):
+        self._urls = set()
+
+    def add(self, url: str) -> bool:
+        '''Добавляет ссылку; False - ссылка уже встречалась'''
+
+        if url in self._urls:
+            return False
+        self._urls.add(url)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._urls)
+
+
+class BloomSeenSet:
+    '''Фильтр Блума: фиксированный объем памяти под capacity ссылок
+
+    Ложноотрицательных ответов нет, а с вероятностью около error_rate новая
+    ссылка ошибочно считается уже встречавшейся и пропускается.
+    '''
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self._count = 0
+
+    def _positions(self, url: str):
+        digest = hashlib.blake2b(url.encode('utf-8'), digest_size = 16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        # Двойное хеширование: k позиций из двух независимых хешей
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, url: str) -> bool:
+        '''Добавляет ссылку; False - ссылка (вероятно) уже встречалась'''
+
+        new = False
+        for position in self._positions(url):
+            byte, bit = divmod(position, 8)
+            if not self._bits[byte] & (1 << bit):
+                self._bits[byte] |= 1 << bit
+                new = True
+        if new:
+            self._count += 1
+        return new
+
+    def __len__(self) -> int:
+        return self._count
+
+
+SeenSet = Union[ExactSeenSet, BloomSeenSet]
+
+
+def make_seen_set() -> SeenSet:
+    '''Создает множество просмотренных ссылок по настройкам запуска'''
+
+    if settings.seen_set_mode == 'bloom':
+        seen = BloomSeenSet(settings.seen_set_capacity, settings.seen_set_error_rate)
+        logger.info(f"Фильтр Блума для ссылок на товары: {seen.size // 8 // 1024} КБ, хешей {seen.hash_count}")
+        return seen
+    return ExactSeenSet()
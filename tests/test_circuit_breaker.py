@@ -0,0 +1,75 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src.core.settings import settings
+from src.scrapers.retry import CircuitBreaker
+from src.scrapers.scraper import PageScraper
+
+URL = 'http://shop.test/catalog/'
+
+
+@pytest.fixture(autouse = True)
+def fast_breaker(monkeypatch):
+    monkeypatch.setattr(settings, 'breaker_failure_threshold', 1)
+    monkeypatch.setattr(settings, 'breaker_cooldown', 0.05)
+    monkeypatch.setattr(settings, 'retry_max_attempts', 4)
+    monkeypatch.setattr(settings, 'retry_backoff_base', 0.01)
+    monkeypatch.setattr(settings, 'retry_backoff_max', 0.01)
+
+
+def make_scraper(handler) -> PageScraper:
+    scraper = PageScraper()
+    scraper._client = httpx.AsyncClient(transport = httpx.MockTransport(handler))
+    return scraper
+
+
+def test_throttled_half_open_probe_is_released():
+    '''429 на пробном запросе не должен оставлять предохранитель занятым навсегда'''
+
+    statuses = iter([503, 429, 200])
+
+    def handler(request):
+        return httpx.Response(next(statuses), text = 'ok')
+
+    async def run():
+        scraper = make_scraper(handler)
+        try:
+            # 503 открывает цепь, 429 приходит на пробный запрос, 200 закрывает цепь
+            html = await asyncio.wait_for(scraper.scrape_page(URL), timeout = 5)
+        finally:
+            await scraper._client.aclose()
+        return html, scraper._breaker(URL)
+
+    html, breaker = asyncio.run(run())
+    assert html == 'ok'
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_cancelled_probe_is_released():
+    '''Отмененный пробный запрос освобождает предохранитель'''
+
+    async def handler(request):
+        await asyncio.sleep(10)
+        return httpx.Response(200)
+
+    async def run():
+        scraper = make_scraper(handler)
+        breaker = scraper._breaker(URL)
+        breaker.record_failure()
+        await asyncio.sleep(settings.breaker_cooldown)
+        try:
+            task = asyncio.create_task(scraper.scrape_page(URL))
+            await asyncio.sleep(0.05)
+            assert breaker._probe_in_flight
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        finally:
+            await scraper._client.aclose()
+        return breaker
+
+    breaker = asyncio.run(run())
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker._probe_in_flight